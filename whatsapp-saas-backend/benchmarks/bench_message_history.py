@@ -0,0 +1,124 @@
+"""Benchmark do histórico de mensagens (GET /api/bots/<id>/messages)
+
+Popula um banco SQLite temporário com N mensagens distribuídas entre bots e
+contatos e mede a latência das consultas usadas pelo endpoint. Exemplo:
+
+    python benchmarks/bench_message_history.py --sizes 10000,1000000,50000000
+    python benchmarks/bench_message_history.py --sizes 100000 --no-indexes
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from src.models import db
+from src.message_history import count_messages, message_page, message_window
+
+BOTS = 20
+CONTACTS_PER_BOT = 5000
+INSERT_CHUNK = 50000
+
+
+def populate(path: str, rows: int):
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=OFF')
+    conn.execute('PRAGMA synchronous=OFF')
+    start = datetime(2024, 1, 1)
+    random.seed(42)
+    inserted = 0
+    while inserted < rows:
+        chunk = min(INSERT_CHUNK, rows - inserted)
+        conn.executemany(
+            'INSERT INTO messages (bot_id, contact_number, message_type, content, direction, status, timestamp) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (
+                (
+                    random.randint(1, BOTS),
+                    f'55119{random.randint(0, CONTACTS_PER_BOT):08d}@c.us',
+                    'text',
+                    'mensagem de teste',
+                    'incoming' if i % 2 else 'outgoing',
+                    'sent',
+                    (start + timedelta(seconds=inserted + i)).isoformat(sep=' ')
+                )
+                for i in range(chunk)
+            )
+        )
+        conn.commit()
+        inserted += chunk
+    conn.close()
+
+
+def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        began = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - began) * 1000)
+    return statistics.median(samples)
+
+
+def run(rows: int, indexes: bool, repeat: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+        db.init_app(app)
+
+        with app.app_context():
+            db.create_all()
+            if not indexes:
+                db.session.execute(db.text('DROP INDEX ix_messages_bot_timestamp'))
+                db.session.execute(db.text('DROP INDEX ix_messages_bot_contact_timestamp'))
+                db.session.commit()
+
+            began = time.perf_counter()
+            populate(path, rows)
+            load_seconds = time.perf_counter() - began
+
+            contact = db.session.execute(db.text(
+                'SELECT contact_number FROM messages WHERE bot_id = 1 LIMIT 1'
+            )).scalar()
+
+            # Página e cursor a ~5.000 mensagens de profundidade (metade do bot em bancos pequenos)
+            depth = min(5000, count_messages(1) // 2)
+            deep_page = depth // 50 + 1
+            deep_rows = message_page(1, deep_page, 50)[0]
+
+            results = {
+                'first page': timed(lambda: message_page(1, 1, 50), repeat),
+                f'page {deep_page}': timed(lambda: message_page(1, deep_page, 50), repeat),
+                'contact page': timed(lambda: message_page(1, 1, 50, contact), repeat),
+                'count only': timed(lambda: count_messages(1), repeat),
+            }
+            if deep_rows:
+                cursor = (deep_rows[-1].timestamp, deep_rows[-1].id)
+                results['cursor page'] = timed(lambda: message_window(1, cursor, 50), repeat)
+
+        print(f"{rows:>12,} rows  (load {load_seconds:.1f}s, indexes={'on' if indexes else 'off'})")
+        for name, median in results.items():
+            print(f"    {name:<14} {median:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,1000000',
+                        help='quantidades de mensagens separadas por vírgula')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--no-indexes', action='store_true', help='remove os índices compostos')
+    args = parser.parse_args()
+
+    for size in args.sizes.split(','):
+        run(int(size), not args.no_indexes, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""Benchmark de webhooks e leituras concorrentes no SQLite, por perfil (DB_PROFILE)
+
+Sobe vários processos (como os workers do gunicorn) apontando para o mesmo
+arquivo SQLite; cada um dispara webhooks e consultas ao histórico em paralelo.
+Mede p50/p99 de latência e os erros de 'database is locked' com o perfil
+'sqlite-performance' e com os padrões da biblioteca ('compat'). Exemplo:
+
+    python benchmarks/bench_sqlite_profile.py --processes 4 --writers 4 --readers 4 --duration 10
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def percentile(samples, fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def profile_env(profile: str, tmp: str) -> dict:
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(tmp, 'app.db')}",
+        'DB_PROFILE': profile,
+        'CONVERSATION_DB_PATH': os.path.join(tmp, 'conversations.db'),
+        'WEBHOOK_SPOOL_DIR': os.path.join(tmp, 'spool'),
+        'MESSAGE_ARCHIVE_ENABLED': 'false'
+    })
+    return env
+
+
+def setup():
+    """Cria o schema, o usuário e o bot usados pelos workers"""
+    from src.main import app
+    from src.models import db, User, Bot
+
+    with app.app_context():
+        user = User(username='bench', email='bench@example.com')
+        user.set_password('bench')
+        db.session.add(user)
+        db.session.commit()
+        db.session.add(Bot(name='bench', user_id=user.id))
+        db.session.commit()
+
+
+def worker(writers: int, readers: int, duration: float):
+    """Executado em cada processo: webhooks e leituras até o fim do tempo"""
+    from flask_jwt_extended import create_access_token
+    from src.main import app
+    from src.message_ingestion import ingestion_pipeline
+
+    with app.app_context():
+        headers = {'Authorization': f"Bearer {create_access_token(identity='1')}"}
+
+    results = {'write': [], 'read': [], 'write_errors': 0, 'read_errors': 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def write_loop():
+        client = app.test_client()
+        latencies, errors = [], 0
+        while time.monotonic() < deadline:
+            began = time.perf_counter()
+            response = client.post('/api/whatsapp/webhook/1', json={
+                'type': 'message_received',
+                'id': uuid.uuid4().hex,
+                'from': f'55119{uuid.uuid4().int % 1000:08d}@c.us',
+                'body': 'mensagem de teste',
+                'messageType': 'chat'
+            })
+            latencies.append((time.perf_counter() - began) * 1000)
+            errors += response.status_code >= 500
+        with lock:
+            results['write'] += latencies
+            results['write_errors'] += errors
+
+    def read_loop():
+        client = app.test_client()
+        latencies, errors = [], 0
+        while time.monotonic() < deadline:
+            began = time.perf_counter()
+            response = client.get('/api/bots/1/messages?limit=50', headers=headers)
+            latencies.append((time.perf_counter() - began) * 1000)
+            errors += response.status_code >= 500
+        with lock:
+            results['read'] += latencies
+            results['read_errors'] += errors
+
+    threads = [threading.Thread(target=write_loop) for _ in range(writers)]
+    threads += [threading.Thread(target=read_loop) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Aguardar o worker de ingestão esvaziar a fila
+    drain_deadline = time.monotonic() + 30
+    while ingestion_pipeline.queue.qsize() and time.monotonic() < drain_deadline:
+        time.sleep(0.1)
+    time.sleep(0.5)
+
+    results['ingestion'] = ingestion_pipeline.metrics()
+    sys.stdout.write('\nRESULT ' + json.dumps(results) + '\n')
+    sys.stdout.flush()
+
+
+def run_profile(profile: str, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = profile_env(profile, tmp)
+        script = os.path.abspath(__file__)
+        subprocess.run([sys.executable, script, '--role', 'setup'], env=env, cwd=BACKEND_DIR,
+                       check=True, stdout=subprocess.DEVNULL)
+
+        processes = [
+            subprocess.Popen(
+                [sys.executable, script, '--role', 'worker', '--writers', str(args.writers),
+                 '--readers', str(args.readers), '--duration', str(args.duration)],
+                env=env, cwd=BACKEND_DIR, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+            )
+            for _ in range(args.processes)
+        ]
+
+        totals = {'write': [], 'read': [], 'write_errors': 0, 'read_errors': 0,
+                  'written': 0, 'retries': 0, 'failed': 0}
+        for process in processes:
+            output, _ = process.communicate()
+            lines = [line for line in output.splitlines() if line.startswith('RESULT ')]
+            if not lines:
+                raise RuntimeError(f'worker do perfil {profile} terminou sem resultado')
+            result = json.loads(lines[-1][len('RESULT '):])
+            for key in ('write', 'read'):
+                totals[key] += result[key]
+            for key in ('write_errors', 'read_errors'):
+                totals[key] += result[key]
+            for key in ('written', 'retries', 'failed'):
+                totals[key] += result['ingestion'][key]
+        return totals
+
+
+def report(profile: str, totals: dict, duration: float):
+    print(f"{profile}")
+    for key in ('write', 'read'):
+        samples = totals[key]
+        errors = totals[f'{key}_errors']
+        rate = 100.0 * errors / len(samples) if samples else 0.0
+        label = 'webhook' if key == 'write' else 'history'
+        print(f"    {label:<8} {len(samples) / duration:8.0f} req/s   p50 {percentile(samples, 0.5):7.2f} ms"
+              f"   p99 {percentile(samples, 0.99):8.2f} ms   5xx {errors} ({rate:.2f}%)")
+    print(f"    ingestão {totals['written']} gravadas, {totals['retries']} tentativas de lote com erro,"
+          f" {totals['failed']} perdidas")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--role', choices=('bench', 'setup', 'worker'), default='bench')
+    parser.add_argument('--profiles', default='compat,sqlite-performance')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=4, help='threads de webhook por processo')
+    parser.add_argument('--readers', type=int, default=4, help='threads de leitura por processo')
+    parser.add_argument('--duration', type=float, default=10.0, help='segundos')
+    args = parser.parse_args()
+
+    if args.role == 'setup':
+        setup()
+        return
+    if args.role == 'worker':
+        worker(args.writers, args.readers, args.duration)
+        return
+
+    print(f"{args.processes} processos x ({args.writers} webhooks + {args.readers} leituras), {args.duration:.0f}s")
+    for profile in args.profiles.split(','):
+        report(profile, run_profile(profile, args), args.duration)
+
+
+if __name__ == '__main__':
+    main()
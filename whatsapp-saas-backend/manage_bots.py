@@ -0,0 +1,79 @@
+"""Inicia, para ou reinicia bots em lote pela API do backend em execução
+
+Os processos dos bots pertencem ao servidor (que os supervisiona), então este
+script apenas chama POST /api/whatsapp/bots/bulk e mostra o resultado de cada
+bot conforme chega. Exemplos:
+
+    python manage_bots.py start --all-active --concurrency 4 --ramp 2
+    python manage_bots.py restart --bots 3,7,12 --username admin
+    DASHURX_TOKEN=... python manage_bots.py stop --all
+"""
+import argparse
+import getpass
+import json
+import os
+import sys
+
+import requests
+
+
+def access_token(args) -> str:
+    if args.token:
+        return args.token
+    username = args.username or input('Usuário: ')
+    password = os.getenv('DASHURX_PASSWORD') or getpass.getpass('Senha: ')
+    response = requests.post(f'{args.url}/api/auth/login',
+                             json={'username': username, 'password': password}, timeout=30)
+    if response.status_code != 200:
+        sys.exit(f"Falha no login: {response.json().get('error', response.status_code)}")
+    return response.json()['access_token']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('action', choices=('start', 'stop', 'restart'))
+    selection = parser.add_mutually_exclusive_group(required=True)
+    selection.add_argument('--bots', help='ids separados por vírgula')
+    selection.add_argument('--all-active', action='store_true',
+                           help='bots que estavam ativos ou conectando')
+    selection.add_argument('--all', action='store_true', help='todos os bots do usuário')
+    parser.add_argument('--concurrency', type=int, help='bots subindo ao mesmo tempo')
+    parser.add_argument('--ramp', type=float, help='segundos entre um lançamento e o próximo')
+    parser.add_argument('--url', default=os.getenv('DASHURX_API_URL', 'http://localhost:5000'))
+    parser.add_argument('--username', default=os.getenv('DASHURX_USERNAME'))
+    parser.add_argument('--token', default=os.getenv('DASHURX_TOKEN'))
+    args = parser.parse_args()
+
+    payload = {'action': args.action, 'concurrency': args.concurrency, 'ramp_seconds': args.ramp}
+    if args.bots:
+        payload['bot_ids'] = [int(bot_id) for bot_id in args.bots.split(',') if bot_id.strip()]
+    else:
+        payload['select'] = 'active' if args.all_active else 'all'
+
+    response = requests.post(f'{args.url}/api/whatsapp/bots/bulk', json=payload, stream=True,
+                             headers={'Authorization': f'Bearer {access_token(args)}'},
+                             timeout=(10, None))
+    if response.status_code != 200:
+        sys.exit(f"Erro {response.status_code}: {response.text}")
+
+    failed = 0
+    for line in response.iter_lines():
+        if not line:
+            continue
+        event = json.loads(line)
+        if event['event'] == 'started':
+            print(f"{event['action']}: {event['total']} bots, até {event['concurrency']} por vez,"
+                  f" {event['ramp_seconds']:g}s entre lançamentos (operação {event['operation_id']})")
+        elif event['event'] == 'result':
+            failed += event['state'] == 'failed'
+            detail = f" - {event['error']}" if event['error'] else ''
+            print(f"  bot {event['bot_id']:>5}  {event['state']:<9} {event['status'] or '':<13}"
+                  f" {event['seconds']:6.1f}s{detail}")
+        elif event['event'] == 'finished':
+            print(f"{event['succeeded']} ok, {event['failed']} com erro, {event['skipped']} ignorados"
+                  f" em {event['seconds']:.1f}s")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
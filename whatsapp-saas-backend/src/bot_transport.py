@@ -0,0 +1,283 @@
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set
+from urllib.parse import quote, unquote, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import MaxRetryError, NewConnectionError, TimeoutError as Urllib3Timeout
+from urllib3.util.retry import Retry
+
+# Esquema das URLs de bots que escutam em socket Unix: http+unix://<caminho codificado>/rota
+UNIX_SCHEME = 'http+unix'
+
+
+def bot_url(port: Optional[int], socket_path: Optional[str], path: str) -> str:
+    """URL de uma rota do bot, pelo socket Unix quando houver, senão pela porta TCP local"""
+    if socket_path:
+        return f"{UNIX_SCHEME}://{quote(socket_path, safe='')}{path}"
+    return f'http://localhost:{port}{path}'
+
+
+class _UnixConnection(HTTPConnection):
+    def __init__(self, *args, socket_path: str, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.socket_path = socket_path
+
+    def _new_conn(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if isinstance(self.timeout, (int, float)):
+            sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as e:
+            sock.close()
+            raise NewConnectionError(self, f'Falha ao conectar em {self.socket_path}: {e}') from e
+        return sock
+
+
+class _MeteredPool(HTTPConnectionPool):
+    # Cliente que conta as conexões novas (definido por subclasse, ver _bind)
+    client: Optional['BotHttpClient'] = None
+
+    def _new_conn(self):
+        if self.client is not None:
+            self.client.count('connections_opened')
+        return super()._new_conn()
+
+
+class _UnixConnectionPool(_MeteredPool):
+    ConnectionCls = _UnixConnection
+
+    def __init__(self, socket_path: str, **kwargs):
+        super().__init__('localhost', socket_path=socket_path, **kwargs)
+
+
+class _MeteredRetry(Retry):
+    client: Optional['BotHttpClient'] = None
+
+    def increment(self, *args, **kwargs):
+        retry = super().increment(*args, **kwargs)  # Esgotadas, levanta MaxRetryError
+        if self.client is not None:
+            self.client.count('retries')
+        return retry
+
+
+def _bind(cls, client: 'BotHttpClient'):
+    """Subclasse que reporta ao cliente (o urllib3 recria pools e Retry a partir da classe)"""
+    return type(cls.__name__, (cls,), {'client': client})
+
+
+class BotHTTPAdapter(HTTPAdapter):
+    """Adapter TCP que conta as conexões abertas com os bots"""
+
+    def __init__(self, client: 'BotHttpClient', **kwargs):
+        self.client = client
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _bind(_MeteredPool, self.client),
+            'https': HTTPSConnectionPool
+        }
+
+    def pool_count(self) -> int:
+        return len(self.poolmanager.pools)
+
+
+class UnixSocketAdapter(HTTPAdapter):
+    """Adapter do requests para http+unix://: uma pool keep-alive por socket de bot
+
+    Mantém as `pool_connections` pools usadas mais recentemente, como o
+    PoolManager faz com hosts TCP.
+    """
+
+    def __init__(self, client: Optional['BotHttpClient'] = None, pool_connections: int = 10,
+                 pool_maxsize: int = 10, **kwargs):
+        self._pools: 'OrderedDict[str, _UnixConnectionPool]' = OrderedDict()
+        self._pools_lock = threading.Lock()
+        self._pool_cls = _bind(_UnixConnectionPool, client)
+        self._max_pools = pool_connections
+        self._pool_maxsize = pool_maxsize
+        super().__init__(pool_connections=pool_connections, pool_maxsize=pool_maxsize, **kwargs)
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        return self._pool(unquote(urlparse(request.url).netloc))
+
+    def get_connection(self, url, proxies=None):  # requests < 2.32
+        return self._pool(unquote(urlparse(url).netloc))
+
+    def request_url(self, request, proxies):
+        return request.path_url
+
+    def close(self):
+        super().close()
+        with self._pools_lock:
+            pools, self._pools = list(self._pools.values()), OrderedDict()
+        for pool in pools:
+            pool.close()
+
+    def pool_count(self) -> int:
+        return len(self._pools)
+
+    def _pool(self, socket_path: str) -> _UnixConnectionPool:
+        with self._pools_lock:
+            pool = self._pools.get(socket_path)
+            if pool is None:
+                pool = self._pool_cls(socket_path, maxsize=self._pool_maxsize, block=self._pool_block)
+                self._pools[socket_path] = pool
+                while len(self._pools) > self._max_pools:
+                    self._pools.popitem(last=False)[1].close()
+            else:
+                self._pools.move_to_end(socket_path)
+            return pool
+
+
+class BotHttpClient:
+    """Cliente HTTP compartilhado para todas as chamadas do backend aos bots Node
+
+    Conexões keep-alive por bot (socket Unix ou porta), timeouts de conexão e
+    leitura separados e novas tentativas com backoff. Falhas de conexão são
+    repetidas em qualquer método, pois nada chegou ao bot; timeouts de leitura
+    e respostas 502/503/504 só em GET, para um envio nunca sair duplicado.
+    """
+
+    def __init__(self):
+        self.connect_timeout = float(os.getenv('BOT_HTTP_CONNECT_TIMEOUT', 2))
+        self.read_timeout = float(os.getenv('BOT_HTTP_READ_TIMEOUT', 5))
+        self.retries = int(os.getenv('BOT_HTTP_RETRIES', 2))
+        pool_hosts = int(os.getenv('BOT_HTTP_POOL_HOSTS', 512))
+        pool_size = int(os.getenv('BOT_HTTP_POOL_SIZE', 4))
+
+        self.stats: Dict[str, int] = {
+            'requests': 0,
+            'errors': 0,
+            'timeouts': 0,
+            'server_errors': 0,
+            'retries': 0,
+            'connections_opened': 0
+        }
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        self._lock = threading.Lock()
+
+        retry = _bind(_MeteredRetry, self)(
+            total=self.retries,
+            allowed_methods=frozenset({'GET'}),
+            status_forcelist=(502, 503, 504),
+            backoff_factor=float(os.getenv('BOT_HTTP_RETRY_BACKOFF', 0.2)),
+            raise_on_status=False
+        )
+        self._adapters = [
+            BotHTTPAdapter(self, pool_connections=pool_hosts, pool_maxsize=pool_size, max_retries=retry),
+            UnixSocketAdapter(self, pool_connections=pool_hosts, pool_maxsize=pool_size, max_retries=retry)
+        ]
+        self.session = requests.Session()
+        self.session.mount('http://', self._adapters[0])
+        self.session.mount(f'{UNIX_SCHEME}://', self._adapters[1])
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def request(self, method: str, url: str, timeout: Optional[float] = None, **kwargs) -> requests.Response:
+        """`timeout` é o de leitura; o de conexão é sempre BOT_HTTP_CONNECT_TIMEOUT"""
+        began = time.monotonic()
+        try:
+            response = self.session.request(method, url, timeout=(self.connect_timeout, timeout or self.read_timeout),
+                                            **kwargs)
+        except requests.RequestException as e:
+            self._observe(began, 'errors', *(('timeouts',) if self._timed_out(e) else ()))
+            raise
+        self._observe(began, *(('server_errors',) if response.status_code >= 500 else ()))
+        return response
+
+    def count(self, key: str, amount: int = 1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def metrics(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            latency_total, latency_max = self._latency_total, self._latency_max
+        requests_made = stats['requests']
+        stats.update({
+            'connection_reuse': round(1 - stats['connections_opened'] / requests_made, 3) if requests_made else None,
+            'latency_ms_avg': round(latency_total / requests_made * 1000, 2) if requests_made else None,
+            'latency_ms_max': round(latency_max * 1000, 2),
+            'pools': sum(adapter.pool_count() for adapter in self._adapters),
+            'connect_timeout': self.connect_timeout,
+            'read_timeout': self.read_timeout,
+            'max_retries': self.retries
+        })
+        return stats
+
+    def close(self):
+        self.session.close()
+
+    @staticmethod
+    def _timed_out(error: requests.RequestException) -> bool:
+        if isinstance(error, requests.Timeout):
+            return True
+        # Timeouts de leitura repetidos até esgotar chegam como ConnectionError(MaxRetryError)
+        reason = error.args[0].reason if error.args and isinstance(error.args[0], MaxRetryError) else None
+        return isinstance(reason, Urllib3Timeout) and not isinstance(reason, NewConnectionError)
+
+    def _observe(self, began: float, *counters: str):
+        elapsed = time.monotonic() - began
+        with self._lock:
+            self.stats['requests'] += 1
+            for key in counters:
+                self.stats[key] += 1
+            self._latency_total += elapsed
+            self._latency_max = max(self._latency_max, elapsed)
+
+
+class PortAllocator:
+    """Empresta portas TCP livres de uma faixa fixa aos processos dos bots
+
+    A busca continua de onde parou, para não reaproveitar logo em seguida a
+    porta de um bot que acabou de sair (conexões em TIME_WAIT, clientes antigos).
+    """
+
+    def __init__(self, start: int, size: int):
+        self.start = start
+        self.size = size
+        self._leased: Set[int] = set()
+        self._cursor = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> int:
+        with self._lock:
+            for offset in range(self.size):
+                index = (self._cursor + offset) % self.size
+                port = self.start + index
+                if port in self._leased or not self._is_free(port):
+                    continue
+                self._leased.add(port)
+                self._cursor = index + 1
+                return port
+        raise RuntimeError(f'Nenhuma porta livre entre {self.start} e {self.start + self.size - 1}')
+
+    def release(self, port: Optional[int]):
+        with self._lock:
+            self._leased.discard(port)
+
+    @staticmethod
+    def _is_free(port: int) -> bool:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+            # Como o listen do Node: conexões em TIME_WAIT não impedem o uso da porta
+            probe.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            try:
+                probe.bind(('', port))
+            except OSError:
+                return False
+        return True
@@ -0,0 +1,265 @@
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+
+from src.models import db
+from src.models.bot import BulkOperation, BulkOperationEvent
+from src.lifecycle_jobs import lifecycle_jobs
+from src.whatsapp_manager import whatsapp_manager
+
+BULK_ACTIONS = ('start', 'stop', 'restart')
+
+# Status do Node em que o navegador já subiu; até lá o bot ocupa uma vaga de concorrência
+BOOTED_NODE_STATUSES = ('qr_ready', 'authenticated', 'ready', 'auth_failure', 'error')
+
+# Intervalo em que o orquestrador confere os bots em andamento
+POLL_INTERVAL = 0.25
+
+
+class BulkLifecycle:
+    """Início, parada e reinício de vários bots com concorrência limitada
+
+    Cada bot vira um job de lifecycle_jobs; no máximo `concurrency` ficam em
+    andamento ao mesmo tempo e os lançamentos respeitam um intervalo mínimo
+    (rampa), para não abrir centenas de Chromium de uma vez. Um início só
+    libera a vaga quando o navegador do bot termina de subir. A operação e seus
+    eventos também vão para o banco, para /bulk/<id> responder em qualquer worker.
+    """
+
+    def __init__(self):
+        self.concurrency = int(os.getenv('BOT_BULK_CONCURRENCY', 4))
+        self.max_concurrency = int(os.getenv('BOT_BULK_MAX_CONCURRENCY', 32))
+        self.ramp_seconds = float(os.getenv('BOT_BULK_RAMP_SECONDS', 2))
+        self.operations: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def run(self, action: str, bots: List[dict], user_id: Optional[int] = None,
+            concurrency: Optional[int] = None, ramp_seconds: Optional[float] = None) -> dict:
+        """Dispara a operação em segundo plano; bots são dicts de Bot.to_dict()"""
+        if action not in BULK_ACTIONS:
+            raise ValueError(f"Ação inválida: '{action}' (use {', '.join(BULK_ACTIONS)})")
+        concurrency = min(max(int(concurrency or self.concurrency), 1), self.max_concurrency)
+        ramp_seconds = max(float(self.ramp_seconds if ramp_seconds is None else ramp_seconds), 0.0)
+
+        operation = {
+            'id': uuid.uuid4().hex,
+            'action': action,
+            'user_id': user_id,
+            'total': len(bots),
+            'concurrency': concurrency,
+            'ramp_seconds': ramp_seconds,
+            'state': 'running',
+            'created_at': datetime.utcnow().isoformat(),
+            'finished_at': None,
+            'events': [],
+            '_condition': threading.Condition(),
+            '_finished': None
+        }
+        with self._lock:
+            self._prune()
+            self.operations[operation['id']] = operation
+        self._save(operation)
+        self._emit(operation, {'event': 'started', 'operation_id': operation['id'], 'action': action,
+                               'total': len(bots), 'concurrency': concurrency, 'ramp_seconds': ramp_seconds})
+        threading.Thread(target=self._orchestrate, args=(operation, bots), daemon=True).start()
+        return operation
+
+    def get(self, operation_id: str) -> Optional[dict]:
+        operation = self.operations.get(operation_id)
+        if operation is None:
+            return self._load(operation_id)  # Disparada em outro worker
+        with operation['_condition']:
+            result = {key: value for key, value in operation.items() if not key.startswith('_')}
+            result['events'] = list(operation['events'])
+        return result
+
+    def stream(self, operation: dict) -> Iterator[str]:
+        """Eventos da operação em NDJSON, do início até o resumo final"""
+        condition = operation['_condition']
+        index = 0
+        while True:
+            with condition:
+                while index >= len(operation['events']) and operation['state'] == 'running':
+                    condition.wait()
+                events = operation['events'][index:]
+                finished = operation['state'] != 'running'
+            index += len(events)
+            for event in events:
+                yield json.dumps(event) + '\n'
+            if finished and index >= len(operation['events']):
+                return
+
+    def wait(self, operation: dict, timeout: Optional[float] = None) -> bool:
+        condition = operation['_condition']
+        with condition:
+            return condition.wait_for(lambda: operation['state'] != 'running', timeout)
+
+    def _orchestrate(self, operation: dict, bots: List[dict]):
+        action = operation['action']
+        pending = deque(bots)
+        in_flight: Dict[int, dict] = {}  # bot_id -> vaga ocupada
+        finished_jobs: queue.Queue = queue.Queue()
+        counts = {'succeeded': 0, 'failed': 0, 'skipped': 0}
+        began = time.monotonic()
+        next_launch = began
+
+        try:
+            while pending or in_flight:
+                now = time.monotonic()
+                if pending and len(in_flight) < operation['concurrency'] and now >= next_launch:
+                    bot = pending.popleft()
+                    job = lifecycle_jobs.launch(action, bot, on_finish=finished_jobs.put)
+                    if job is None:
+                        counts['skipped'] += 1
+                        self._emit(operation, self._result(bot['id'], action, 'skipped', None,
+                                                           'Já existe uma operação em andamento para este bot', 0.0))
+                        continue
+                    in_flight[bot['id']] = {'job_id': job['id'], 'launched': now, 'job': None}
+                    next_launch = now + operation['ramp_seconds']
+                    self._emit(operation, {'event': 'launched', 'bot_id': bot['id'], 'job_id': job['id']})
+                    continue
+
+                # Esperar um job terminar ou o momento do próximo lançamento
+                timeout = POLL_INTERVAL
+                if pending and len(in_flight) < operation['concurrency']:
+                    timeout = min(timeout, max(next_launch - now, 0))
+                try:
+                    job = finished_jobs.get(timeout=timeout)
+                    in_flight[job['bot_id']]['job'] = job
+                except queue.Empty:
+                    pass
+
+                now = time.monotonic()
+                for bot_id, slot in list(in_flight.items()):
+                    status = self._settled(action, bot_id, slot, now)
+                    if status is None:
+                        continue
+                    del in_flight[bot_id]
+                    job = slot['job']
+                    counts[job['state']] += 1
+                    self._emit(operation, self._result(bot_id, action, job['state'], status, job['error'],
+                                                       now - slot['launched'], job['id']))
+        except Exception as e:
+            print(f"Erro na operação em lote {operation['id']}: {e}")
+            counts['failed'] += len(pending) + len(in_flight)
+
+        self._emit(operation, {'event': 'finished', **counts, 'total': operation['total'],
+                               'seconds': round(time.monotonic() - began, 2)}, state='finished')
+
+    @staticmethod
+    def _settled(action: str, bot_id: int, slot: dict, now: float) -> Optional[str]:
+        """Status final do bot se a vaga já pode ser liberada; None enquanto ele ainda sobe"""
+        job = slot['job']
+        if job is None:
+            return None
+        if action == 'stop' or job['state'] != 'succeeded':
+            return job['bot_status']
+
+        # Pelo manager: em um worker seguidor o estado vem do registro compartilhado
+        instance_status = whatsapp_manager.get_instance_status(bot_id)
+        if instance_status is None:
+            return 'stopped'
+        if instance_status['status'] in BOOTED_NODE_STATUSES:
+            return instance_status['status']
+        if now - slot['launched'] >= whatsapp_manager.start_timeout:
+            return instance_status['status']  # Não travar a fila por um navegador lento
+        return None
+
+    @staticmethod
+    def _result(bot_id: int, action: str, state: str, status: Optional[str], error: Optional[str],
+                seconds: float, job_id: Optional[str] = None) -> dict:
+        return {
+            'event': 'result',
+            'bot_id': bot_id,
+            'action': action,
+            'state': state,
+            'status': status,
+            'error': error,
+            'job_id': job_id,
+            'seconds': round(seconds, 2)
+        }
+
+    def _emit(self, operation: dict, event: dict, state: Optional[str] = None):
+        with operation['_condition']:
+            operation['events'].append(event)
+            if state is not None:
+                operation['state'] = state
+                operation['finished_at'] = datetime.utcnow().isoformat()
+                operation['_finished'] = time.time()
+            # Gravado antes de acordar quem espera: ao fim do stream o banco já tem o resumo
+            self._save(operation, event)
+            operation['_condition'].notify_all()
+
+    def _save(self, operation: dict, event: Optional[dict] = None):
+        """Grava a operação (e o evento novo) no banco; uma falha não interrompe a operação"""
+        app = lifecycle_jobs.app
+        if app is None:
+            return
+        try:
+            with app.app_context():
+                row = db.session.get(BulkOperation, operation['id'])
+                if row is None:
+                    row = BulkOperation(
+                        id=operation['id'],
+                        action=operation['action'],
+                        user_id=operation['user_id'],
+                        total=operation['total'],
+                        concurrency=operation['concurrency'],
+                        ramp_seconds=operation['ramp_seconds'],
+                        created_at=datetime.fromisoformat(operation['created_at'])
+                    )
+                    db.session.add(row)
+                row.state = operation['state']
+                row.finished_at = (datetime.fromisoformat(operation['finished_at'])
+                                   if operation['finished_at'] else None)
+                if event is not None:
+                    db.session.add(BulkOperationEvent(operation_id=operation['id'], data=json.dumps(event)))
+                db.session.commit()
+        except Exception as e:
+            print(f"Erro ao gravar a operação em lote {operation['id']}: {e}")
+
+    @staticmethod
+    def _load(operation_id: str) -> Optional[dict]:
+        app = lifecycle_jobs.app
+        if app is None:
+            return None
+        with app.app_context():
+            row = db.session.get(BulkOperation, operation_id)
+            if row is None:
+                return None
+            events = BulkOperationEvent.query.filter_by(operation_id=operation_id) \
+                .order_by(BulkOperationEvent.id).all()
+            return row.to_dict([json.loads(event.data) for event in events])
+
+    def _prune(self):
+        # Chamado com o lock: mesma retenção dos jobs individuais
+        cutoff = time.time() - lifecycle_jobs.retention
+        for operation_id in [operation_id for operation_id, operation in self.operations.items()
+                             if operation['_finished'] is not None and operation['_finished'] < cutoff]:
+            del self.operations[operation_id]
+        app = lifecycle_jobs.app
+        if app is None:
+            return
+        try:
+            with app.app_context():
+                # Ids em lista: o MySQL não apaga de uma tabela com subquery nela mesma
+                expired = [row.id for row in db.session.query(BulkOperation.id).filter(
+                    BulkOperation.finished_at < datetime.utcnow() - timedelta(seconds=lifecycle_jobs.retention)
+                )]
+                if not expired:
+                    return
+                BulkOperationEvent.query.filter(BulkOperationEvent.operation_id.in_(expired)) \
+                    .delete(synchronize_session=False)
+                BulkOperation.query.filter(BulkOperation.id.in_(expired)).delete(synchronize_session=False)
+                db.session.commit()
+        except Exception as e:
+            print(f"Erro ao limpar as operações em lote antigas: {e}")
+
+# Instância global das operações em lote
+bulk_lifecycle = BulkLifecycle()
@@ -0,0 +1,363 @@
+import csv
+import io
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from typing import IO, Dict, List, Optional, Tuple
+
+from src.models import db
+from src.models.bot import Message
+from src.models.campaign import Campaign, CampaignRecipient
+from src.models.scheduled_message import ScheduledMessage
+from src.db_helpers import insert_ignore
+from src.flow_engine import render_template
+from src.outbound_queue import TokenBucket, outbound_queue
+from src.whatsapp_manager import whatsapp_manager
+
+# Colunas do CSV reconhecidas como número do contato; sem nenhuma delas, vale a primeira coluna
+NUMBER_COLUMNS = ('number', 'numero', 'número', 'phone', 'telefone', 'celular', 'whatsapp', 'contact_number')
+
+# Transições pedidas pela API: ação -> (status de origem aceitos, novo status)
+TRANSITIONS = {
+    'start': (('draft',), 'running'),
+    'pause': (('running',), 'paused'),
+    'resume': (('paused',), 'running'),
+    'cancel': (('draft', 'running', 'paused'), 'cancelled')
+}
+
+_NON_DIGITS = re.compile(r'\D')
+
+
+def normalize_number(value: str) -> Optional[str]:
+    """Só os dígitos do número; None se não parecer um telefone"""
+    digits = _NON_DIGITS.sub('', value or '')
+    return digits if 8 <= len(digits) <= 20 else None
+
+
+class CampaignEngine:
+    """Envio de um template para listas grandes de contatos pela fila de envio
+
+    Os contatos chegam por CSV lido em streaming e gravados em lotes. Em cada
+    campanha em andamento o worker supervisor libera os destinatários no ritmo
+    da campanha e com no máximo `window` mensagens na fila de envio do bot, para
+    as respostas dos fluxos e os envios avulsos não ficarem atrás de milhares de
+    mensagens. Os resultados voltam da fila de envio e são gravados em lote,
+    junto com os contadores da campanha.
+    """
+
+    def __init__(self):
+        self.rate_per_minute = float(os.getenv('CAMPAIGN_RATE_PER_MINUTE', 20))
+        self.window = int(os.getenv('CAMPAIGN_WINDOW', 10))
+        self.poll_seconds = float(os.getenv('CAMPAIGN_POLL_SECONDS', 2))
+        self.upload_batch = int(os.getenv('CAMPAIGN_UPLOAD_BATCH', 1000))
+        self.max_recipients = int(os.getenv('CAMPAIGN_MAX_RECIPIENTS', 100000))
+
+        self.app = None
+        self._active: Dict[int, dict] = {}  # campaign_id -> estado das campanhas em andamento
+        self._in_flight: Dict[int, Tuple[int, int]] = {}  # message_id -> (campaign_id, recipient_id)
+        self._in_flight_count: Dict[int, int] = {}  # campaign_id -> mensagens na fila de envio
+        self._outcomes: List[Tuple[int, int, str]] = []  # (campaign_id, recipient_id, status) a gravar
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._next_poll = 0.0
+
+    def init_app(self, app):
+        self.app = app
+        outbound_queue.add_listener(self._on_results)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def import_recipients(self, campaign: Campaign, stream: IO[bytes]) -> dict:
+        """Lê o CSV sem carregá-lo inteiro e grava os contatos em lotes (números repetidos são ignorados)"""
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+        first_line = text.readline()
+        if not first_line.strip():
+            raise ValueError('O CSV está vazio')
+        # Planilhas em português costumam exportar com ponto e vírgula
+        delimiter = ';' if first_line.count(';') > first_line.count(',') else ','
+        columns = [column.strip() for column in next(csv.reader([first_line], delimiter=delimiter))]
+        lowered = [column.lower() for column in columns]
+        number_index = next((lowered.index(name) for name in NUMBER_COLUMNS if name in lowered), 0)
+
+        before = campaign.total
+        room = self.max_recipients - before
+        read = invalid = 0
+        truncated = False
+        batch: List[dict] = []
+        for row in csv.reader(text, delimiter=delimiter):
+            if not any(cell.strip() for cell in row):
+                continue
+            if read >= room:
+                truncated = True
+                break
+            read += 1
+            number = normalize_number(row[number_index]) if number_index < len(row) else None
+            if number is None:
+                invalid += 1
+                continue
+            variables = {column: row[index].strip() for index, column in enumerate(columns)
+                         if column and index < len(row)}
+            batch.append({
+                'campaign_id': campaign.id,
+                'contact_number': number,
+                'variables': json.dumps(variables, ensure_ascii=False),
+                'status': 'pending',
+                'updated_at': datetime.utcnow()
+            })
+            if len(batch) >= self.upload_batch:
+                self._insert_recipients(batch)
+                batch = []
+        if batch:
+            self._insert_recipients(batch)
+
+        campaign.total = CampaignRecipient.query.filter_by(campaign_id=campaign.id).count()
+        db.session.commit()
+        imported = campaign.total - before
+        return {
+            'imported': imported,
+            'invalid': invalid,
+            'duplicates': read - invalid - imported,
+            'truncated': truncated,
+            'total': campaign.total
+        }
+
+    def transition(self, campaign: Campaign, action: str):
+        """Inicia, pausa, retoma ou cancela a campanha (ValueError se não for possível)"""
+        if action not in TRANSITIONS:
+            raise ValueError(f"Ação inválida: '{action}'")
+        sources, target = TRANSITIONS[action]
+        if campaign.status not in sources:
+            raise ValueError(f"Não é possível executar '{action}' em uma campanha com status '{campaign.status}'")
+        if action == 'start' and not campaign.total:
+            raise ValueError('A campanha não tem destinatários')
+
+        # Condicional no banco: outro worker pode ter mudado o status desde a leitura
+        values = {'status': target, 'updated_at': datetime.utcnow()}
+        if action == 'start':
+            values['started_at'] = datetime.utcnow()
+        if action == 'cancel':
+            values['finished_at'] = datetime.utcnow()
+        changed = Campaign.query.filter(
+            Campaign.id == campaign.id, Campaign.status.in_(sources)
+        ).update(values, synchronize_session=False)
+        if not changed:
+            db.session.rollback()
+            raise ValueError('O status da campanha mudou, tente novamente')
+        if action in ('start', 'cancel'):
+            # Um início agendado deixa de valer (o do próprio agendador já saiu de 'scheduled')
+            ScheduledMessage.query.filter_by(campaign_id=campaign.id, status='scheduled').update(
+                {'status': 'cancelled', 'updated_at': datetime.utcnow()}, synchronize_session=False
+            )
+        if action == 'cancel':
+            # As mensagens já na fila de envio seguem; as demais não saem mais
+            CampaignRecipient.query.filter_by(campaign_id=campaign.id, status='pending').update(
+                {'status': 'cancelled', 'updated_at': datetime.utcnow()}, synchronize_session=False
+            )
+        db.session.commit()
+        db.session.refresh(campaign)
+        self.wake()
+
+    def wake(self):
+        """Relê as campanhas no próximo ciclo (no supervisor; os demais workers esperam o poll dele)"""
+        with self._condition:
+            self._next_poll = 0.0
+            self._condition.notify()
+
+    def _insert_recipients(self, rows: List[dict]):
+        db.session.execute(insert_ignore(CampaignRecipient, ['campaign_id', 'contact_number']), rows)
+        db.session.commit()
+
+    def _on_results(self, outcomes: List[Tuple[int, str]]):
+        """Resultados da fila de envio (thread de despacho dela): só separa os das campanhas"""
+        with self._condition:
+            for message_id, status in outcomes:
+                entry = self._in_flight.pop(message_id, None)
+                if entry is None:
+                    continue
+                self._in_flight_count[entry[0]] -= 1
+                self._outcomes.append((entry[0], entry[1], status))
+            if self._outcomes:
+                self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._outcomes:
+                    self._condition.wait(self._timeout())
+                outcomes, self._outcomes = self._outcomes, []
+            try:
+                if outcomes:
+                    self._write_outcomes(outcomes)
+                if time.monotonic() >= self._next_poll:
+                    self._next_poll = time.monotonic() + self.poll_seconds
+                    if whatsapp_manager.supervisor:
+                        self._refresh()
+                for state in list(self._active.values()):
+                    self._release(state)
+            except Exception as e:
+                print(f"Erro no envio de campanhas: {e}")
+
+    def _timeout(self) -> float:
+        # Chamado com o lock
+        now = time.monotonic()
+        deadline = self._next_poll
+        for state in self._active.values():
+            if self._in_flight_count.get(state['id'], 0) < self.window and not state['exhausted']:
+                deadline = min(deadline, state['next_release'])
+        return max(deadline - now, 0.0)
+
+    def _refresh(self):
+        """Acompanha as campanhas iniciadas, pausadas e canceladas por qualquer worker"""
+        with self.app.app_context():
+            running = {campaign.id: campaign for campaign in Campaign.query.filter_by(status='running').all()}
+            for campaign_id in set(self._active) - set(running):
+                del self._active[campaign_id]  # As mensagens já na fila ainda têm o resultado gravado
+            for campaign_id, campaign in running.items():
+                if campaign_id not in self._active:
+                    self._active[campaign_id] = self._activate(campaign)
+
+    def _activate(self, campaign: Campaign) -> dict:
+        """Estado em memória; recupera os destinatários que estavam na fila antes de um reinício ou pausa"""
+        rate = min(campaign.rate_per_minute or self.rate_per_minute, outbound_queue.rate * 60)
+        state = {
+            'id': campaign.id,
+            'bot_id': campaign.bot_id,
+            'template': campaign.template,
+            'media_url': campaign.media_url,
+            'bucket': TokenBucket(rate / 60.0, 1),
+            'cursor': 0,
+            'next_release': 0.0,
+            'exhausted': False
+        }
+
+        queued = db.session.query(CampaignRecipient.id, CampaignRecipient.message_id, Message.status).outerjoin(
+            Message, Message.id == CampaignRecipient.message_id
+        ).filter(CampaignRecipient.campaign_id == campaign.id, CampaignRecipient.status == 'queued').all()
+        with self._condition:
+            for recipient_id, message_id, message_status in queued:
+                if message_id in self._in_flight:
+                    continue
+                if message_status == 'queued':
+                    self._in_flight[message_id] = (campaign.id, recipient_id)
+                    self._in_flight_count[campaign.id] = self._in_flight_count.get(campaign.id, 0) + 1
+                else:
+                    # Concluída enquanto a campanha não era acompanhada (ou a mensagem sumiu)
+                    self._outcomes.append((campaign.id, recipient_id,
+                                           'sent' if message_status in ('sent', 'delivered', 'read') else 'failed'))
+        return state
+
+    def _release(self, state: dict):
+        """Coloca na fila de envio os próximos destinatários que o ritmo e a janela permitem"""
+        campaign_id = state['id']
+        in_flight = self._in_flight_count.get(campaign_id, 0)
+        if state['exhausted']:
+            if in_flight == 0:
+                self._complete(campaign_id)
+            return
+        now = time.monotonic()
+        if now < state['next_release'] or in_flight >= self.window:
+            return
+        if not whatsapp_manager.is_running(state['bot_id']):
+            state['next_release'] = now + self.poll_seconds  # Bot fora do ar: a campanha espera
+            return
+
+        count = 0
+        while count < self.window - in_flight:
+            wait = state['bucket'].take(now)
+            if wait > 0:
+                state['next_release'] = now + wait
+                break
+            count += 1
+        if count == 0:
+            return
+
+        with self.app.app_context():
+            recipients = CampaignRecipient.query.filter(
+                CampaignRecipient.campaign_id == campaign_id,
+                CampaignRecipient.status == 'pending',
+                CampaignRecipient.id > state['cursor']
+            ).order_by(CampaignRecipient.id).limit(count).all()
+            if not recipients:
+                state['exhausted'] = True
+                return
+
+            messages = []
+            for recipient in recipients:
+                variables = json.loads(recipient.variables) if recipient.variables else {}
+                messages.append(outbound_queue.add(state['bot_id'], recipient.contact_number,
+                                                   render_template(state['template'], variables),
+                                                   media_url=state['media_url']))
+            db.session.flush()
+            for recipient, message in zip(recipients, messages):
+                recipient.status = 'queued'
+                recipient.message_id = message.id
+                recipient.updated_at = datetime.utcnow()
+
+            # Registrado antes do commit: a fila de envio pode achar as mensagens no banco e concluí-las antes
+            with self._condition:
+                for recipient, message in zip(recipients, messages):
+                    self._in_flight[message.id] = (campaign_id, recipient.id)
+                self._in_flight_count[campaign_id] = self._in_flight_count.get(campaign_id, 0) + len(messages)
+            try:
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                with self._condition:
+                    for message in messages:
+                        self._in_flight.pop(message.id, None)
+                    self._in_flight_count[campaign_id] -= len(messages)
+                raise
+            state['cursor'] = recipients[-1].id
+            outbound_queue.dispatch(messages)
+
+    def _complete(self, campaign_id: int):
+        with self.app.app_context():
+            pending = CampaignRecipient.query.filter_by(campaign_id=campaign_id, status='pending').count()
+            if pending:
+                # Destinatários incluídos depois da leitura: a campanha continua
+                self._active[campaign_id]['exhausted'] = False
+                self._active[campaign_id]['cursor'] = 0
+                return
+            Campaign.query.filter_by(id=campaign_id, status='running').update(
+                {'status': 'completed', 'finished_at': datetime.utcnow(), 'updated_at': datetime.utcnow()},
+                synchronize_session=False
+            )
+            db.session.commit()
+        del self._active[campaign_id]
+        print(f"Campanha {campaign_id} concluída")
+
+    def _write_outcomes(self, outcomes: List[Tuple[int, int, str]]):
+        """Resultado de cada destinatário e contadores das campanhas em uma transação"""
+        by_status: Dict[str, List[int]] = {}
+        counters: Dict[int, Dict[str, int]] = {}
+        for campaign_id, recipient_id, status in outcomes:
+            by_status.setdefault(status, []).append(recipient_id)
+            campaign_counters = counters.setdefault(campaign_id, {'sent': 0, 'failed': 0})
+            campaign_counters[status] += 1
+
+        with self.app.app_context():
+            try:
+                now = datetime.utcnow()
+                for status, recipient_ids in by_status.items():
+                    CampaignRecipient.query.filter(CampaignRecipient.id.in_(recipient_ids)).update(
+                        {'status': status, 'updated_at': now}, synchronize_session=False
+                    )
+                for campaign_id, campaign_counters in counters.items():
+                    Campaign.query.filter_by(id=campaign_id).update({
+                        'sent_count': Campaign.sent_count + campaign_counters['sent'],
+                        'failed_count': Campaign.failed_count + campaign_counters['failed'],
+                        'updated_at': now
+                    }, synchronize_session=False)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Erro ao gravar o resultado de {len(outcomes)} envios de campanhas: {e}")
+                with self._condition:
+                    self._outcomes[:0] = outcomes  # Tentado de novo no próximo ciclo
+                time.sleep(1)
+
+# Instância global do motor de campanhas
+campaign_engine = CampaignEngine()
@@ -0,0 +1,256 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+Key = Tuple[int, str]  # (bot_id, contact_number)
+
+# Marca contatos sem conversa no cache (evita consultar o SQLite a cada mensagem)
+_MISSING = object()
+
+CacheEntry = Tuple[object, float]  # (estado ou _MISSING, validade em time.monotonic())
+
+
+class ConversationState:
+    """Posição de um contato em um fluxo em execução"""
+
+    __slots__ = ('bot_id', 'contact_number', 'flow_id', 'node_id', 'variables',
+                 'waiting', 'resume_at', 'updated_at')
+
+    def __init__(self, bot_id: int, contact_number: str, flow_id: int, node_id: int,
+                 variables: Optional[dict] = None, waiting: Optional[str] = None,
+                 resume_at: Optional[float] = None, updated_at: Optional[float] = None):
+        self.bot_id = bot_id
+        self.contact_number = contact_number
+        self.flow_id = flow_id
+        self.node_id = node_id
+        self.variables = variables or {}
+        self.waiting = waiting  # 'input' ou 'delay'
+        self.resume_at = resume_at  # epoch em que um delay expira
+        self.updated_at = updated_at or time.time()
+
+    @property
+    def key(self) -> Key:
+        return (self.bot_id, self.contact_number)
+
+    def to_row(self) -> tuple:
+        return (
+            self.bot_id, self.contact_number, self.flow_id, self.node_id,
+            json.dumps(self.variables) if self.variables else None,
+            self.waiting, self.resume_at, self.updated_at
+        )
+
+    @classmethod
+    def from_row(cls, row: tuple) -> 'ConversationState':
+        bot_id, contact_number, flow_id, node_id, variables, waiting, resume_at, updated_at = row
+        return cls(
+            bot_id, contact_number, flow_id, node_id,
+            json.loads(variables) if variables else {},
+            waiting, resume_at, updated_at
+        )
+
+
+class ConversationStore:
+    """Estado das conversas em SQLite, com cache LRU e escrita em lote
+
+    Com vários workers o arquivo é compartilhado, mas o cache não: as entradas
+    valem só CONVERSATION_CACHE_SECONDS, para um worker não responder com o
+    estado antigo de uma conversa que outro worker avançou.
+    """
+
+    COLUMNS = 'bot_id, contact_number, flow_id, node_id, variables, waiting, resume_at, updated_at'
+
+    def __init__(self):
+        self.db_path = os.getenv('CONVERSATION_DB_PATH', os.path.join(
+            os.path.dirname(__file__), 'database', 'conversations.db'
+        ))
+        self.cache_size = int(os.getenv('CONVERSATION_CACHE_SIZE', 100000))
+        self.cache_seconds = float(os.getenv('CONVERSATION_CACHE_SECONDS', 2))
+        self.ttl = int(os.getenv('CONVERSATION_TTL_HOURS', 24)) * 3600
+        self.flush_interval = int(os.getenv('CONVERSATION_FLUSH_MS', 200)) / 1000.0
+        self.flush_batch_size = int(os.getenv('CONVERSATION_FLUSH_BATCH', 500))
+
+        self._cache: 'OrderedDict[Key, CacheEntry]' = OrderedDict()
+        self._dirty: Dict[Key, Optional[ConversationState]] = {}  # None = remover
+        self._lock = threading.Lock()
+        self._flush_requested = threading.Event()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+        self._last_sweep = 0.0
+        atexit.register(self.flush)
+
+    def get(self, bot_id: int, contact_number: str) -> Optional[ConversationState]:
+        """Retorna o estado da conversa, ou None se não houver fluxo ativo"""
+        key = (bot_id, contact_number)
+        with self._lock:
+            hit = self._lookup(key)
+
+        if hit is None:
+            loaded = self._load(key)
+            with self._lock:
+                # Uma escrita concorrente tem prioridade sobre o valor lido
+                hit = self._lookup(key)
+                if hit is None:
+                    self._remember(key, loaded)
+                    hit = loaded if loaded is not None else _MISSING
+
+        state = None if hit is _MISSING else hit
+        if state is not None and self._expired(state):
+            self.delete(bot_id, contact_number)
+            return None
+        return state
+
+    def put(self, state: ConversationState):
+        """Atualiza o estado (gravado em segundo plano)"""
+        state.updated_at = time.time()
+        with self._lock:
+            self._remember(state.key, state)
+            self._dirty[state.key] = state
+            pending = len(self._dirty)
+        self._ensure_writer()
+        if pending >= self.flush_batch_size:
+            self._flush_requested.set()
+
+    def delete(self, bot_id: int, contact_number: str):
+        """Remove a conversa (fluxo finalizado ou abandonado)"""
+        key = (bot_id, contact_number)
+        with self._lock:
+            self._remember(key, None)
+            self._dirty[key] = None
+        self._ensure_writer()
+
+    def due_delays(self, now: float, limit: int) -> List[ConversationState]:
+        """Conversas cujo delay já venceu, gravadas por qualquer worker ou antes de um reinício"""
+        self.flush()
+        conn = self._connection()
+        with self._conn_lock:
+            rows = conn.execute(
+                f'SELECT {self.COLUMNS} FROM conversation_state '
+                'WHERE resume_at IS NOT NULL AND resume_at <= ? ORDER BY resume_at LIMIT ?', (now, limit)
+            ).fetchall()
+        return [ConversationState.from_row(row) for row in rows]
+
+    def flush(self):
+        """Grava imediatamente as alterações pendentes"""
+        with self._lock:
+            dirty = self._dirty
+            self._dirty = {}
+        if not dirty:
+            return
+
+        upserts = [state.to_row() for state in dirty.values() if state is not None]
+        deletes = [key for key, state in dirty.items() if state is None]
+        conn = self._connection()
+        try:
+            with self._conn_lock, conn:
+                if upserts:
+                    conn.executemany(
+                        f'INSERT OR REPLACE INTO conversation_state ({self.COLUMNS}) '
+                        f'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', upserts
+                    )
+                if deletes:
+                    conn.executemany(
+                        'DELETE FROM conversation_state WHERE bot_id = ? AND contact_number = ?', deletes
+                    )
+        except sqlite3.Error as e:
+            print(f"Erro ao gravar estado das conversas: {e}")
+            with self._lock:
+                # Devolver as alterações que não foram sobrescritas nesse meio tempo
+                for key, state in dirty.items():
+                    self._dirty.setdefault(key, state)
+
+    def expire(self):
+        """Remove conversas abandonadas há mais que o TTL"""
+        cutoff = time.time() - self.ttl
+        conn = self._connection()
+        with self._conn_lock, conn:
+            conn.execute(
+                'DELETE FROM conversation_state WHERE updated_at < ? AND resume_at IS NULL', (cutoff,)
+            )
+
+    def _expired(self, state: ConversationState) -> bool:
+        return state.resume_at is None and state.updated_at < time.time() - self.ttl
+
+    def _lookup(self, key: Key) -> object:
+        """Consulta pendências e cache; None indica que é preciso ler do banco"""
+        if key in self._dirty:
+            state = self._dirty[key]
+            return _MISSING if state is None else state
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return entry[0]
+
+    def _remember(self, key: Key, state: Optional[ConversationState]):
+        self._cache[key] = (_MISSING if state is None else state, time.monotonic() + self.cache_seconds)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _load(self, key: Key) -> Optional[ConversationState]:
+        conn = self._connection()
+        with self._conn_lock:
+            row = conn.execute(
+                f'SELECT {self.COLUMNS} FROM conversation_state WHERE bot_id = ? AND contact_number = ?', key
+            ).fetchone()
+        return ConversationState.from_row(row) if row else None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            with self._conn_lock:
+                if self._conn is None:
+                    os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+                    conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+                    conn.execute('PRAGMA journal_mode=WAL')
+                    conn.execute('PRAGMA synchronous=NORMAL')
+                    conn.executescript('''
+                        CREATE TABLE IF NOT EXISTS conversation_state (
+                            bot_id INTEGER NOT NULL,
+                            contact_number TEXT NOT NULL,
+                            flow_id INTEGER NOT NULL,
+                            node_id INTEGER NOT NULL,
+                            variables TEXT,
+                            waiting TEXT,
+                            resume_at REAL,
+                            updated_at REAL NOT NULL,
+                            PRIMARY KEY (bot_id, contact_number)
+                        ) WITHOUT ROWID;
+                        CREATE INDEX IF NOT EXISTS idx_conversation_state_updated
+                            ON conversation_state (updated_at);
+                        CREATE INDEX IF NOT EXISTS idx_conversation_state_resume
+                            ON conversation_state (resume_at) WHERE resume_at IS NOT NULL;
+                    ''')
+                    self._conn = conn
+        return self._conn
+
+    def _ensure_writer(self):
+        if self._writer is not None and self._writer.is_alive():
+            return
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_loop, daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            self._flush_requested.wait(self.flush_interval)
+            self._flush_requested.clear()
+            try:
+                self.flush()
+                if time.monotonic() - self._last_sweep > 60:
+                    self._last_sweep = time.monotonic()
+                    self.expire()
+            except Exception as e:
+                print(f"Erro no gravador de conversas: {e}")
+
+# Instância global do armazenamento de conversas
+conversation_store = ConversationStore()
@@ -0,0 +1,109 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, func, literal, tuple_
+
+from src.models import db
+from src.models.bot import Conversation
+from src.db_helpers import upsert
+from src.message_history import MAX_PAGE_SIZE, Cursor, encode_cursor
+
+PREVIEW_LENGTH = 120
+
+
+def _field(message, name: str):
+    # Aceita tanto objetos Message quanto as linhas (dict) da ingestão em lote
+    if isinstance(message, dict):
+        return message.get(name)
+    return getattr(message, name, None)
+
+
+def _summaries(messages: Iterable) -> List[dict]:
+    """Agrupa as mensagens por contato, mantendo apenas a mais recente de cada um"""
+    summaries: Dict[Tuple[int, str], dict] = {}
+    for message in messages:
+        key = (_field(message, 'bot_id'), _field(message, 'contact_number'))
+        timestamp = _field(message, 'timestamp') or datetime.utcnow()
+        incoming = _field(message, 'direction') == 'incoming'
+
+        summary = summaries.get(key)
+        if summary is None:
+            summary = summaries[key] = {
+                'bot_id': key[0],
+                'contact_number': key[1],
+                'contact_name': None,
+                'last_message_at': timestamp,
+                'unread_count': 0,
+                'message_count': 0,
+                'created_at': datetime.utcnow()
+            }
+        summary['message_count'] += 1
+        summary['unread_count'] += 1 if incoming else 0
+        summary['contact_name'] = _field(message, 'contact_name') or summary['contact_name']
+
+        if timestamp >= summary['last_message_at'] or summary['message_count'] == 1:
+            summary.update({
+                'last_message_at': timestamp,
+                'last_message_preview': (_field(message, 'content') or '')[:PREVIEW_LENGTH],
+                'last_message_type': _field(message, 'message_type'),
+                'last_direction': _field(message, 'direction')
+            })
+    return list(summaries.values())
+
+
+def _merge(excluded) -> dict:
+    """Soma os contadores e troca a última mensagem só se a nova for mais recente"""
+    table = Conversation.__table__.c
+    newer = excluded.last_message_at >= table.last_message_at
+
+    def latest(column: str):
+        return case((newer, excluded[column]), else_=table[column])
+
+    return {
+        'last_message_at': latest('last_message_at'),
+        'last_message_preview': latest('last_message_preview'),
+        'last_message_type': latest('last_message_type'),
+        'last_direction': latest('last_direction'),
+        'contact_name': func.coalesce(excluded.contact_name, table.contact_name),
+        'unread_count': table.unread_count + excluded.unread_count,
+        'message_count': table.message_count + excluded.message_count
+    }
+
+
+def record_messages(messages: Iterable):
+    """Atualiza o resumo das conversas na transação atual (uma linha por contato)"""
+    summaries = _summaries(messages)
+    if summaries:
+        db.session.execute(upsert(Conversation, ['bot_id', 'contact_number'], _merge), summaries)
+
+
+def conversation_window(bot_id: int, before: Optional[Cursor] = None,
+                        limit: int = 50) -> Tuple[List[Conversation], Optional[str]]:
+    """Conversas do bot ordenadas pela última atividade, paginadas por cursor"""
+    limit = min(max(limit, 1), MAX_PAGE_SIZE)
+
+    query = Conversation.query.filter(Conversation.bot_id == bot_id)
+    if before is not None:
+        last_message_at, conversation_id = before
+        query = query.filter(tuple_(Conversation.last_message_at, Conversation.id) < tuple_(
+            literal(last_message_at, Conversation.last_message_at.type), literal(conversation_id)
+        ))
+
+    conversations = query.order_by(
+        Conversation.last_message_at.desc(), Conversation.id.desc()
+    ).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(conversations) > limit:
+        conversations = conversations[:limit]
+        next_cursor = encode_cursor(conversations[-1].last_message_at, conversations[-1].id)
+    return conversations, next_cursor
+
+
+def mark_read(bot_id: int, contact_number: str) -> bool:
+    """Zera o contador de não lidas; False se a conversa não existir"""
+    updated = Conversation.query.filter_by(bot_id=bot_id, contact_number=contact_number).update(
+        {'unread_count': 0}, synchronize_session=False
+    )
+    db.session.commit()
+    return updated > 0
@@ -0,0 +1,108 @@
+import os
+from typing import Dict, List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+from src.models import db
+
+
+# Perfis de ajuste do SQLite (DB_PROFILE), aplicados a cada nova conexão
+SQLITE_PROFILES = ('sqlite-performance', 'compat')
+
+
+def _default_sqlite_uri() -> str:
+    database_dir = os.path.join(os.path.dirname(__file__), 'database')
+    os.makedirs(database_dir, exist_ok=True)
+    return f"sqlite:///{os.path.join(database_dir, 'app.db')}"
+
+
+def database_uri() -> str:
+    """URI do banco a partir de DATABASE_URL (SQLite local por padrão)"""
+    uri = os.getenv('DATABASE_URL') or _default_sqlite_uri()
+    # Provedores como Heroku/Render ainda usam o esquema antigo 'postgres://'
+    if uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite' and url.database and url.database != ':memory:':
+        os.makedirs(os.path.dirname(os.path.abspath(url.database)) or '.', exist_ok=True)
+    return uri
+
+
+def engine_options(uri: str) -> Dict:
+    """Opções do pool e do driver para o SQLAlchemy, conforme o banco"""
+    backend = make_url(uri).get_backend_name()
+    statement_timeout = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 30000))
+
+    if backend == 'sqlite':
+        if sqlite_profile() == 'compat':
+            return {}
+        # Arquivo local: sem reciclagem; a espera pelo lock vem do busy_timeout
+        return {'connect_args': {'timeout': statement_timeout / 1000.0}}
+
+    options = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True
+    }
+    if backend == 'postgresql' and statement_timeout:
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+    return options
+
+
+def sqlite_profile() -> str:
+    profile = os.getenv('DB_PROFILE', 'sqlite-performance')
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f"DB_PROFILE inválido: '{profile}' (use {', '.join(SQLITE_PROFILES)})")
+    return profile
+
+
+def sqlite_pragmas_for(profile: str) -> List[Tuple[str, object]]:
+    """PRAGMAs do perfil; 'compat' mantém os padrões da biblioteca (journal de rollback)"""
+    if profile == 'compat':
+        # journal_mode fica gravado no arquivo, então é preciso desfazer o WAL explicitamente
+        return [('journal_mode', 'DELETE')]
+    return [
+        ('journal_mode', os.getenv('SQLITE_JOURNAL_MODE', 'WAL')),
+        ('synchronous', os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')),
+        ('busy_timeout', int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 30000))),
+        ('cache_size', -int(os.getenv('SQLITE_CACHE_SIZE_MB', 64)) * 1024),
+        ('mmap_size', int(os.getenv('SQLITE_MMAP_SIZE_MB', 256)) * 1024 * 1024),
+        ('temp_store', os.getenv('SQLITE_TEMP_STORE', 'MEMORY'))
+    ]
+
+
+def sqlite_pragmas(dbapi_connection, connection_record):
+    """Ajustes aplicados a cada nova conexão SQLite"""
+    cursor = dbapi_connection.cursor()
+    for name, value in sqlite_pragmas_for(sqlite_profile()):
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+
+def mysql_statement_timeout(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"SET SESSION max_execution_time={int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 30000))}")
+    cursor.close()
+
+
+def init_db(app):
+    """Configura o banco da aplicação e registra os ajustes por conexão"""
+    uri = database_uri()
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(uri)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+
+    with app.app_context():
+        engine = db.engine
+        backend = engine.dialect.name
+        if backend == 'sqlite':
+            event.listen(engine, 'connect', sqlite_pragmas)
+            print(f"Perfil do SQLite: {sqlite_profile()}")
+        elif backend in ('mysql', 'mariadb'):
+            event.listen(engine, 'connect', mysql_statement_timeout)
+        print(f"Banco de dados: {engine.url.render_as_string(hide_password=True)}")
@@ -0,0 +1,64 @@
+from typing import Callable, List, Set
+
+from src.models import db
+
+
+def insert_ignore(model, conflict_columns: List[str]):
+    """INSERT que ignora linhas que violam um índice único, no dialeto do banco atual"""
+    dialect = db.engine.dialect.name
+
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert(model).on_conflict_do_nothing(index_elements=conflict_columns)
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(model).on_conflict_do_nothing(index_elements=conflict_columns)
+    if dialect in ('mysql', 'mariadb'):
+        return db.insert(model).prefix_with('IGNORE')
+
+    return db.insert(model)
+
+
+def insert_ignore_keys(model, key: str, rows: List[dict]) -> Set:
+    """insert_ignore pelo índice único de `key`; retorna as chaves das linhas realmente inseridas
+
+    Linhas com a chave vazia (sem índice a violar) são sempre inseridas e não entram no retorno.
+    """
+    if not rows:
+        return set()
+    column = getattr(model, key)
+    if db.engine.dialect.name in ('sqlite', 'postgresql'):
+        # ON CONFLICT DO NOTHING ... RETURNING só devolve as linhas inseridas
+        result = db.session.execute(insert_ignore(model, [key]).returning(column), rows)
+        return {value for value in result.scalars() if value is not None}
+
+    # Sem RETURNING (MySQL): uma linha por vez, inserida se rowcount == 1
+    inserted = set()
+    statement = insert_ignore(model, [key])
+    for row in rows:
+        if db.session.execute(statement, [row]).rowcount and row.get(key) is not None:
+            inserted.add(row[key])
+    return inserted
+
+
+def upsert(model, conflict_columns: List[str], update: Callable):
+    """INSERT que atualiza a linha existente em caso de conflito
+
+    `update` recebe a pseudo-tabela com os valores propostos (excluded/inserted)
+    e retorna o dicionário de colunas a atualizar.
+    """
+    dialect = db.engine.dialect.name
+
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        statement = insert(model)
+        return statement.on_conflict_do_update(index_elements=conflict_columns, set_=update(statement.excluded))
+    if dialect in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert
+        statement = insert(model)
+        return statement.on_duplicate_key_update(**update(statement.inserted))
+
+    raise NotImplementedError(f"Upsert não suportado no banco '{dialect}'")
@@ -0,0 +1,295 @@
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from src.models.bot import Flow
+
+
+# Tipos de trigger suportados pelo índice
+KEYWORD_TRIGGERS = ('keyword',)
+PATTERN_TRIGGERS = ('pattern', 'regex')
+MEDIA_TRIGGERS = ('media',)
+CATCH_ALL_TRIGGERS = ('message',)
+
+# Tipos de mensagem considerados texto (o whatsapp-web.js usa 'chat')
+TEXT_MESSAGE_TYPES = ('text', 'chat')
+
+# Caracteres que delimitam uma palavra-chave no início da mensagem
+_WORD_BOUNDARY = re.compile(r'[\s\.,;:!\?\-]')
+
+# Referências a grupos (\\1, (?P=nome), condicionais (?(1)...)) não podem ser combinadas
+# numa única regex: os números dos grupos mudam
+_BACKREFERENCE = re.compile(r'\\[1-9]|\(\?P=|\(\?\(')
+
+# Flags globais como "(?i)" só valem no início da regex inteira
+_GLOBAL_FLAGS = re.compile(r'\(\?[aiLmsux]+\)')
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Normaliza o texto para comparação de palavras-chave"""
+    if not text:
+        return ''
+    return ' '.join(text.casefold().split())
+
+
+class _TrieNode:
+    __slots__ = ('children', 'flow_ids')
+
+    def __init__(self):
+        self.children: Dict[str, '_TrieNode'] = {}
+        self.flow_ids: Set[int] = set()
+
+
+class BotTriggerIndex:
+    """Índice compilado dos triggers dos fluxos ativos de um bot"""
+
+    def __init__(self, bot_id: int):
+        self.bot_id = bot_id
+        self.loaded_at = time.monotonic()
+        self._flows: Dict[int, Tuple[str, str]] = {}  # flow_id -> (trigger_type, trigger_value)
+        self._exact: Dict[str, Set[int]] = {}  # palavra-chave -> flow_ids
+        self._trie = _TrieNode()
+        self._patterns: Dict[int, str] = {}
+        self._media: Set[int] = set()
+        self._catch_all: Set[int] = set()
+        self._regex: Optional[re.Pattern] = None
+        self._regex_members: List[Tuple[int, re.Pattern]] = []  # padrões da regex combinada, por flow_id
+        self._regex_fallback: List[Tuple[int, re.Pattern]] = []
+        self._regex_dirty = False
+
+    def add(self, flow_id: int, trigger_type: str, trigger_value: Optional[str]):
+        """Adiciona (ou substitui) o trigger de um fluxo"""
+        if flow_id in self._flows:
+            self.remove(flow_id)
+
+        trigger_type = (trigger_type or '').strip().lower()
+        trigger_value = trigger_value or ''
+        self._flows[flow_id] = (trigger_type, trigger_value)
+
+        if trigger_type in KEYWORD_TRIGGERS:
+            for keyword in self._keywords(trigger_value):
+                self._exact.setdefault(keyword, set()).add(flow_id)
+                self._trie_insert(keyword, flow_id)
+        elif trigger_type in PATTERN_TRIGGERS:
+            if trigger_value:
+                self._patterns[flow_id] = trigger_value
+                self._regex_dirty = True
+        elif trigger_type in MEDIA_TRIGGERS:
+            self._media.add(flow_id)
+        elif trigger_type in CATCH_ALL_TRIGGERS:
+            self._catch_all.add(flow_id)
+
+    def remove(self, flow_id: int):
+        """Remove o trigger de um fluxo do índice"""
+        entry = self._flows.pop(flow_id, None)
+        if not entry:
+            return
+
+        trigger_type, trigger_value = entry
+        if trigger_type in KEYWORD_TRIGGERS:
+            for keyword in self._keywords(trigger_value):
+                flow_ids = self._exact.get(keyword)
+                if flow_ids is not None:
+                    flow_ids.discard(flow_id)
+                    if not flow_ids:
+                        del self._exact[keyword]
+                self._trie_remove(keyword, flow_id)
+        elif trigger_type in PATTERN_TRIGGERS:
+            if self._patterns.pop(flow_id, None) is not None:
+                self._regex_dirty = True
+        else:
+            self._media.discard(flow_id)
+            self._catch_all.discard(flow_id)
+
+    def match(self, text: Optional[str], message_type: str = 'text') -> Optional[int]:
+        """Retorna o id do fluxo acionado pela mensagem, se houver"""
+        is_text = (message_type or 'text') in TEXT_MESSAGE_TYPES
+        normalized = normalize_text(text)
+
+        if normalized:
+            # 1. Palavra-chave exata
+            flow_ids = self._exact.get(normalized)
+            if flow_ids:
+                return min(flow_ids)
+
+            # 2. Palavra-chave mais longa no início da mensagem
+            flow_id = self._trie_longest_prefix(normalized)
+            if flow_id is not None:
+                return flow_id
+
+            # 3. Padrões (regex)
+            flow_id = self._match_patterns(text)
+            if flow_id is not None:
+                return flow_id
+
+        # 4. Mídia
+        if not is_text and self._media:
+            return min(self._media)
+
+        # 5. Qualquer mensagem
+        if self._catch_all:
+            return min(self._catch_all)
+
+        return None
+
+    def __len__(self):
+        return len(self._flows)
+
+    @staticmethod
+    def _keywords(trigger_value: str) -> List[str]:
+        keywords = (normalize_text(value) for value in trigger_value.split(','))
+        return [keyword for keyword in keywords if keyword]
+
+    def _trie_insert(self, keyword: str, flow_id: int):
+        node = self._trie
+        for char in keyword:
+            node = node.children.setdefault(char, _TrieNode())
+        node.flow_ids.add(flow_id)
+
+    def _trie_remove(self, keyword: str, flow_id: int):
+        path = [self._trie]
+        for char in keyword:
+            node = path[-1].children.get(char)
+            if node is None:
+                return
+            path.append(node)
+
+        path[-1].flow_ids.discard(flow_id)
+
+        # Podar ramos que ficaram vazios
+        for depth in range(len(keyword), 0, -1):
+            node = path[depth]
+            if node.flow_ids or node.children:
+                break
+            del path[depth - 1].children[keyword[depth - 1]]
+
+    def _trie_longest_prefix(self, text: str) -> Optional[int]:
+        node = self._trie
+        best = None
+        for position, char in enumerate(text):
+            node = node.children.get(char)
+            if node is None:
+                break
+            if node.flow_ids:
+                next_position = position + 1
+                if next_position == len(text) or _WORD_BOUNDARY.match(text, next_position):
+                    best = min(node.flow_ids)
+        return best
+
+    def _compile_patterns(self):
+        alternatives = []
+        fallback = []
+        for flow_id, pattern in sorted(self._patterns.items()):
+            try:
+                compiled = re.compile(pattern, re.IGNORECASE)
+            except re.error:
+                print(f"Padrão inválido no fluxo {flow_id}: {pattern}")
+                continue
+
+            if _BACKREFERENCE.search(pattern) or _GLOBAL_FLAGS.search(pattern) or compiled.groupindex:
+                fallback.append((flow_id, compiled))
+            else:
+                alternatives.append((flow_id, compiled, f'(?P<f{flow_id}>{pattern})'))
+
+        self._regex = None
+        self._regex_members = []
+        if alternatives:
+            try:
+                self._regex = re.compile('|'.join(alternative for _, _, alternative in alternatives), re.IGNORECASE)
+                self._regex_members = [(flow_id, compiled) for flow_id, compiled, _ in alternatives]
+            except re.error as e:
+                # Um padrão válido sozinho que não combina com os outros não pode derrubar o bot inteiro
+                print(f"Padrões do bot {self.bot_id} testados um a um: {e}")
+                fallback.extend((flow_id, compiled) for flow_id, compiled, _ in alternatives)
+                fallback.sort(key=lambda entry: entry[0])
+        self._regex_fallback = fallback
+        self._regex_dirty = False
+
+    def _match_patterns(self, text: str) -> Optional[int]:
+        if not self._patterns:
+            return None
+        if self._regex_dirty:
+            self._compile_patterns()
+
+        best = None
+        if self._regex is not None:
+            match = self._regex.search(text)
+            if match:
+                # A regex combinada acha o padrão que casa mais à esquerda; vale o fluxo de menor id,
+                # então só os padrões de id menor ainda precisam ser testados um a um
+                best = int(match.lastgroup[1:])
+                for flow_id, compiled in self._regex_members:
+                    if flow_id >= best:
+                        break
+                    if compiled.search(text):
+                        best = flow_id
+                        break
+
+        for flow_id, compiled in self._regex_fallback:
+            if best is not None and flow_id >= best:
+                break
+            if compiled.search(text):
+                return flow_id
+
+        return best
+
+
+class FlowDispatcher:
+    """Associa mensagens recebidas aos fluxos ativos de cada bot"""
+
+    def __init__(self):
+        self.indexes: Dict[int, BotTriggerIndex] = {}  # bot_id -> índice compilado
+        # Recarregar periodicamente mantém workers diferentes consistentes
+        self.index_ttl = int(os.getenv('FLOW_INDEX_TTL', 60))
+        self._lock = threading.RLock()
+
+    def match(self, bot_id: int, text: Optional[str], message_type: str = 'text') -> Optional[int]:
+        """Retorna o id do fluxo que deve ser executado para a mensagem"""
+        with self._lock:
+            return self._get_index(bot_id).match(text, message_type)
+
+    def upsert_flow(self, flow: Flow):
+        """Atualiza o índice após criar ou alterar um fluxo"""
+        with self._lock:
+            index = self.indexes.get(flow.bot_id)
+            if index is None:
+                # Será carregado do banco no próximo match
+                return
+            if flow.is_active:
+                index.add(flow.id, flow.trigger_type, flow.trigger_value)
+            else:
+                index.remove(flow.id)
+
+    def remove_flow(self, bot_id: int, flow_id: int):
+        """Remove um fluxo excluído do índice"""
+        with self._lock:
+            index = self.indexes.get(bot_id)
+            if index is not None:
+                index.remove(flow_id)
+
+    def invalidate_bot(self, bot_id: int):
+        """Descarta o índice de um bot"""
+        with self._lock:
+            self.indexes.pop(bot_id, None)
+
+    def _get_index(self, bot_id: int) -> BotTriggerIndex:
+        index = self.indexes.get(bot_id)
+        if index is None or time.monotonic() - index.loaded_at > self.index_ttl:
+            index = self._load_index(bot_id)
+            self.indexes[bot_id] = index
+        return index
+
+    def _load_index(self, bot_id: int) -> BotTriggerIndex:
+        index = BotTriggerIndex(bot_id)
+        rows = Flow.query.with_entities(
+            Flow.id, Flow.trigger_type, Flow.trigger_value
+        ).filter_by(bot_id=bot_id, is_active=True).all()
+
+        for flow_id, trigger_type, trigger_value in rows:
+            index.add(flow_id, trigger_type, trigger_value)
+        return index
+
+# Instância global do dispatcher
+flow_dispatcher = FlowDispatcher()
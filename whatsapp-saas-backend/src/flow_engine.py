@@ -0,0 +1,279 @@
+import json
+import os
+import re
+import threading
+import time
+from types import MappingProxyType
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from src.models import db
+from src.models.bot import FlowNode, NodeConnection
+
+
+# Limite de nós visitados por passo (protege contra ciclos sem condição)
+MAX_STEPS_PER_RUN = 100
+
+# Variáveis da conversa nas mensagens: "Olá {{nome}}"
+_VARIABLE = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+
+Predicate = Callable[[str], bool]
+
+
+class CompiledEdge(NamedTuple):
+    target: int  # índice do nó de destino em CompiledFlow.nodes
+    predicate: Optional[Predicate]  # None = conexão incondicional
+    condition_type: str
+    condition_value: str
+
+
+class CompiledNode(NamedTuple):
+    id: int
+    node_type: str
+    data: MappingProxyType
+    edges: Tuple[CompiledEdge, ...]
+
+
+class CompiledFlow(NamedTuple):
+    flow_id: int
+    version: int
+    nodes: Tuple[CompiledNode, ...]
+    entry: Optional[int]  # índice do primeiro nó
+    index_by_id: MappingProxyType  # node_id -> índice
+
+
+class StepResult(NamedTuple):
+    actions: List[dict]
+    node_id: Optional[int]  # nó onde a conversa parou (None = fluxo finalizado)
+    waiting: Optional[str]  # 'input', 'delay' ou None
+    delay_ms: int = 0
+    variables: Optional[dict] = None
+
+
+def _normalize(value: Optional[str]) -> str:
+    return ' '.join((value or '').casefold().split())
+
+
+def compile_predicate(condition_type: Optional[str], condition_value: Optional[str]) -> Optional[Predicate]:
+    """Compila a condição de uma conexão em uma função text -> bool"""
+    condition_type = (condition_type or '').strip().lower()
+    condition_value = condition_value or ''
+
+    if not condition_type:
+        if not condition_value:
+            return None
+        condition_type = 'equals'
+
+    if condition_type == 'regex':
+        try:
+            pattern = re.compile(condition_value, re.IGNORECASE)
+        except re.error:
+            print(f"Condição regex inválida: {condition_value}")
+            return lambda text: False
+        return lambda text: pattern.search(text) is not None
+
+    expected = _normalize(condition_value)
+    if condition_type == 'equals':
+        return lambda text: _normalize(text) == expected
+    if condition_type == 'not_equals':
+        return lambda text: _normalize(text) != expected
+    if condition_type == 'contains':
+        return lambda text: expected in _normalize(text)
+    if condition_type == 'starts_with':
+        return lambda text: _normalize(text).startswith(expected)
+    if condition_type in ('any', 'always'):
+        return lambda text: True
+
+    print(f"Tipo de condição desconhecido: {condition_type}")
+    return lambda text: False
+
+
+def render_template(text: str, variables: dict) -> str:
+    """Substitui {{variavel}} pelos valores da conversa"""
+    if not text or '{{' not in text:
+        return text
+    return _VARIABLE.sub(lambda match: str(variables.get(match.group(1), '')), text)
+
+
+def _parse_node_data(raw: Optional[str]) -> dict:
+    if not raw:
+        return {}
+    try:
+        data = json.loads(raw)
+    except (TypeError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+class FlowEngine:
+    """Compila fluxos em grafos imutáveis e executa conversas sobre eles"""
+
+    def __init__(self):
+        self.cache: Dict[int, CompiledFlow] = {}  # flow_id -> fluxo compilado
+        self.cache_ttl = int(os.getenv('FLOW_CACHE_TTL', 60))
+        self._versions: Dict[int, int] = {}
+        self._compiled_at: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def get(self, flow_id: int) -> CompiledFlow:
+        """Retorna o fluxo compilado, compilando se necessário"""
+        with self._lock:
+            version = self._versions.get(flow_id, 0)
+            compiled = self.cache.get(flow_id)
+            fresh = time.monotonic() - self._compiled_at.get(flow_id, 0) <= self.cache_ttl
+            if compiled is not None and compiled.version == version and fresh:
+                return compiled
+
+        compiled = self.compile(flow_id, version)
+
+        with self._lock:
+            # Só publica se ninguém invalidou o fluxo durante a compilação
+            if self._versions.get(flow_id, 0) == version:
+                self.cache[flow_id] = compiled
+                self._compiled_at[flow_id] = time.monotonic()
+        return compiled
+
+    def invalidate(self, flow_id: int):
+        """Descarta a versão compilada após alterações no fluxo"""
+        with self._lock:
+            self._versions[flow_id] = self._versions.get(flow_id, 0) + 1
+            self.cache.pop(flow_id, None)
+
+    def compile(self, flow_id: int, version: int = 0) -> CompiledFlow:
+        """Carrega nós e conexões com duas consultas e monta o grafo"""
+        node_rows = db.session.query(
+            FlowNode.id, FlowNode.node_type, FlowNode.node_data
+        ).filter(
+            FlowNode.flow_id == flow_id
+        ).order_by(FlowNode.order_index, FlowNode.id).all()
+
+        edge_rows = db.session.query(
+            NodeConnection.from_node_id, NodeConnection.to_node_id,
+            NodeConnection.condition_type, NodeConnection.condition_value
+        ).join(
+            FlowNode, NodeConnection.from_node_id == FlowNode.id
+        ).filter(
+            FlowNode.flow_id == flow_id
+        ).order_by(NodeConnection.id).all()
+
+        index_by_id = {node_id: index for index, (node_id, _, _) in enumerate(node_rows)}
+
+        edges_by_node: Dict[int, List[CompiledEdge]] = {}
+        has_incoming = set()
+        for from_id, to_id, condition_type, condition_value in edge_rows:
+            if from_id not in index_by_id or to_id not in index_by_id:
+                continue
+            edge = CompiledEdge(
+                target=index_by_id[to_id],
+                predicate=compile_predicate(condition_type, condition_value),
+                condition_type=condition_type or '',
+                condition_value=condition_value or ''
+            )
+            edges_by_node.setdefault(index_by_id[from_id], []).append(edge)
+            has_incoming.add(index_by_id[to_id])
+
+        nodes = tuple(
+            CompiledNode(
+                id=node_id,
+                node_type=(node_type or '').strip().lower(),
+                data=MappingProxyType(_parse_node_data(node_data)),
+                edges=tuple(edges_by_node.get(index, ()))
+            )
+            for index, (node_id, node_type, node_data) in enumerate(node_rows)
+        )
+
+        # O primeiro nó é o de menor ordem sem conexões de entrada
+        entry = next((index for index in range(len(nodes)) if index not in has_incoming), None)
+        if entry is None and nodes:
+            entry = 0
+
+        return CompiledFlow(
+            flow_id=flow_id,
+            version=version,
+            nodes=nodes,
+            entry=entry,
+            index_by_id=MappingProxyType(index_by_id)
+        )
+
+    def start(self, flow: CompiledFlow, variables: Optional[dict] = None) -> StepResult:
+        """Inicia uma conversa no primeiro nó do fluxo"""
+        variables = dict(variables or {})
+        if flow.entry is None:
+            return StepResult([], None, None, variables=variables)
+        return self._run(flow, flow.entry, None, True, variables)
+
+    def resume(self, flow: CompiledFlow, node_id: int, text: Optional[str] = None,
+               variables: Optional[dict] = None) -> StepResult:
+        """Continua uma conversa parada em node_id (após resposta ou delay)"""
+        variables = dict(variables or {})
+        index = flow.index_by_id.get(node_id)
+        if index is None:
+            # O nó foi removido do fluxo
+            return StepResult([], None, None, variables=variables)
+
+        # Nós podem guardar a resposta do contato em uma variável
+        variable = flow.nodes[index].data.get('variable')
+        if text is not None and variable:
+            variables[variable] = text
+        return self._run(flow, index, text, False, variables)
+
+    def _run(self, flow: CompiledFlow, index: int, text: Optional[str], enter: bool,
+             variables: dict) -> StepResult:
+        actions: List[dict] = []
+
+        for _ in range(MAX_STEPS_PER_RUN):
+            node = flow.nodes[index]
+
+            if enter:
+                if node.node_type == 'message':
+                    actions.append({
+                        'type': 'send_message',
+                        'message': render_template(node.data.get('message', ''), variables),
+                        'message_type': node.data.get('messageType', 'text'),
+                        'media_url': node.data.get('mediaUrl')
+                    })
+                elif node.node_type == 'action':
+                    action = node.data.get('action') or 'end'
+                    if action == 'end':
+                        return StepResult(actions, None, None, variables=variables)
+                    actions.append({'type': action, 'data': dict(node.data)})
+                elif node.node_type == 'delay':
+                    try:
+                        delay_ms = max(int(node.data.get('delay', 1000)), 0)
+                    except (TypeError, ValueError):
+                        delay_ms = 1000
+                    return StepResult(actions, node.id, 'delay', delay_ms, variables)
+
+            if not node.edges:
+                return StepResult(actions, None, None, variables=variables)
+
+            conditional = any(edge.predicate is not None for edge in node.edges)
+            if conditional:
+                if text is None:
+                    return StepResult(actions, node.id, 'input', variables=variables)
+                next_index = self._choose_edge(node, text)
+                if next_index is None:
+                    # Nenhuma condição atendida: aguardar nova resposta
+                    return StepResult(actions, node.id, 'input', variables=variables)
+                text = None
+            else:
+                next_index = node.edges[0].target
+
+            index = next_index
+            enter = True
+
+        print(f"Fluxo {flow.flow_id} excedeu {MAX_STEPS_PER_RUN} passos")
+        return StepResult(actions, None, None, variables=variables)
+
+    @staticmethod
+    def _choose_edge(node: CompiledNode, text: str) -> Optional[int]:
+        fallback = None
+        for edge in node.edges:
+            if edge.predicate is None:
+                if fallback is None:
+                    fallback = edge.target
+            elif edge.predicate(text):
+                return edge.target
+        return fallback
+
+# Instância global do motor de fluxos
+flow_engine = FlowEngine()
@@ -0,0 +1,147 @@
+import heapq
+import os
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from src.models import db
+from src.conversation_store import conversation_store, ConversationState
+from src.flow_dispatcher import flow_dispatcher
+from src.flow_engine import flow_engine, StepResult
+from src.outbound_queue import outbound_queue
+from src.whatsapp_manager import whatsapp_manager
+
+# Delays vencidos retomados por ciclo ao ler o estado das conversas
+DUE_DELAYS_BATCH = 500
+
+
+class FlowRunner:
+    """Executa os fluxos acionados pelas mensagens recebidas
+
+    Os delays só são retomados no worker supervisor, senão cada worker
+    continuaria o fluxo e as mensagens sairiam repetidas. Os delays criados
+    nele esperam num heap; os dos outros workers e os de antes de um reinício
+    são lidos do estado das conversas quando vencem.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.poll_seconds = float(os.getenv('FLOW_DELAY_POLL_SECONDS', 1))
+        self._timers: List[Tuple[float, int, str, int]] = []  # (resume_at, bot_id, contact, node_id)
+        self._timers_changed = threading.Condition()
+        self._timer_thread: Optional[threading.Thread] = None
+        self._next_poll = 0.0
+
+    def init_app(self, app):
+        self.app = app
+        self._timer_thread = threading.Thread(target=self._timer_loop, daemon=True)
+        self._timer_thread.start()
+
+    def handle_message(self, bot_id: int, contact_number: str, text: Optional[str],
+                       message_type: str = 'text') -> Optional[int]:
+        """Continua ou inicia o fluxo da conversa e retorna o id do fluxo"""
+        state = conversation_store.get(bot_id, contact_number)
+
+        # Uma conversa aguardando resposta consome a mensagem
+        if state is not None and state.waiting == 'input':
+            compiled = flow_engine.get(state.flow_id)
+            result = flow_engine.resume(compiled, state.node_id, text or '', state.variables)
+            self._apply(bot_id, contact_number, state.flow_id, result)
+            return state.flow_id
+
+        flow_id = flow_dispatcher.match(bot_id, text, message_type)
+        if flow_id is None:
+            return None
+
+        compiled = flow_engine.get(flow_id)
+        result = flow_engine.start(compiled)
+        self._apply(bot_id, contact_number, flow_id, result)
+        return flow_id
+
+    def _apply(self, bot_id: int, contact_number: str, flow_id: int, result: StepResult):
+        self.execute_actions(bot_id, contact_number, result.actions)
+
+        if result.node_id is None:
+            conversation_store.delete(bot_id, contact_number)
+            return
+
+        state = ConversationState(
+            bot_id, contact_number, flow_id, result.node_id,
+            variables=result.variables,
+            waiting=result.waiting,
+            resume_at=time.time() + result.delay_ms / 1000.0 if result.waiting == 'delay' else None
+        )
+        conversation_store.put(state)
+        if state.resume_at is not None:
+            self._schedule(state)
+
+    def _schedule(self, state: ConversationState):
+        if not whatsapp_manager.supervisor:
+            return  # Gravado no estado da conversa: o supervisor retoma quando vencer
+        with self._timers_changed:
+            heapq.heappush(self._timers, (state.resume_at, state.bot_id, state.contact_number, state.node_id))
+            self._timers_changed.notify()
+
+    def _timer_loop(self):
+        while True:
+            with self._timers_changed:
+                timeout = self._next_poll - time.monotonic()
+                if self._timers:
+                    timeout = min(timeout, self._timers[0][0] - time.time())
+                if timeout > 0:
+                    self._timers_changed.wait(timeout)
+                due = []
+                while self._timers and self._timers[0][0] <= time.time():
+                    due.append(heapq.heappop(self._timers))
+
+            for _, bot_id, contact_number, node_id in due:
+                self._resume_after_delay(bot_id, contact_number, node_id)
+            if time.monotonic() >= self._next_poll:
+                self._next_poll = time.monotonic() + self.poll_seconds
+                if whatsapp_manager.supervisor:
+                    self._resume_stored()
+
+    def _resume_stored(self):
+        try:
+            states = conversation_store.due_delays(time.time(), DUE_DELAYS_BATCH)
+        except Exception as e:
+            print(f"Erro ao ler os delays vencidos: {e}")
+            return
+        for state in states:
+            self._resume_after_delay(state.bot_id, state.contact_number, state.node_id)
+
+    def _resume_after_delay(self, bot_id: int, contact_number: str, node_id: int):
+        if self.app is None:
+            return
+        with self.app.app_context():
+            try:
+                state = conversation_store.get(bot_id, contact_number)
+                # A conversa pode ter mudado desde que o delay foi agendado
+                if state is None or state.waiting != 'delay' or state.node_id != node_id:
+                    return
+
+                compiled = flow_engine.get(state.flow_id)
+                result = flow_engine.resume(compiled, node_id, None, state.variables)
+                self._apply(bot_id, contact_number, state.flow_id, result)
+            except Exception as e:
+                # Sem isso o delay vencido seria lido de novo a cada ciclo
+                db.session.rollback()
+                conversation_store.delete(bot_id, contact_number)
+                print(f"Erro ao continuar fluxo do bot {bot_id} para {contact_number}: {e}")
+
+    def execute_actions(self, bot_id: int, contact_number: str, actions: List[dict]):
+        """Executa as ações geradas pelo motor de fluxos (envios pela fila, na ordem do fluxo)"""
+        records = []
+        for action in actions:
+            if action['type'] != 'send_message':
+                print(f"Ação '{action['type']}' do bot {bot_id} ignorada")
+                continue
+            records.append(outbound_queue.add(bot_id, contact_number, action['message'],
+                                              media_url=action.get('media_url')))
+
+        if records:
+            db.session.commit()
+            outbound_queue.dispatch(records)
+
+# Instância global do executor de fluxos
+flow_runner = FlowRunner()
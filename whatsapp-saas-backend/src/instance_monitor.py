@@ -0,0 +1,223 @@
+import heapq
+import itertools
+import os
+import selectors
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Sem pidfd (Linux < 5.3, macOS), as saídas são verificadas com poll() neste intervalo
+EXIT_POLL_INTERVAL = 1.0
+
+
+class _Watch:
+    __slots__ = ('process', 'on_output', 'on_exit', 'pidfd', 'buffers', 'streams', 'exited')
+
+    def __init__(self, process: subprocess.Popen, on_output: Callable, on_exit: Callable):
+        self.process = process
+        self.on_output = on_output
+        self.on_exit = on_exit
+        self.pidfd: Optional[int] = None
+        self.buffers: Dict[str, bytes] = {}
+        self.streams: Dict[str, object] = {}  # pipes ainda abertos
+        self.exited = False
+
+
+class InstanceMonitor:
+    """Loop único (selectors) que acompanha todos os processos de bots
+
+    Detecta a saída de cada processo pelo pidfd assim que ela acontece, lê
+    stdout/stderr sem uma thread por pipe e executa temporizadores. Tarefas
+    que bloqueiam (HTTP, banco) vão para um pool pequeno de threads.
+    """
+
+    def __init__(self, workers: int = 4):
+        self._selector = selectors.DefaultSelector()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bot-monitor')
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        os.set_blocking(self._wakeup_read, False)
+        os.set_blocking(self._wakeup_write, False)
+        self._selector.register(self._wakeup_read, selectors.EVENT_READ, ('wakeup', None, None))
+
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[str, object]] = []  # alterações aplicadas pela thread do loop
+        self._timers: List[Tuple[float, int, Callable, tuple]] = []
+        self._sequence = itertools.count()
+        self._watches: Dict[int, _Watch] = {}  # pid -> watch
+        self._use_pidfd = hasattr(os, 'pidfd_open')
+        self._thread: Optional[threading.Thread] = None
+
+    def watch(self, process: subprocess.Popen, on_output: Callable[[str, str], None],
+              on_exit: Callable[[int], None]):
+        """Acompanha o processo
+
+        on_output(stream, linha) roda na thread do loop, na ordem das linhas, e não
+        pode bloquear; on_exit(código) roda no pool, depois da última linha.
+        """
+        self._command('watch', _Watch(process, on_output, on_exit))
+
+    def call_later(self, delay: float, callback: Callable, *args):
+        """Agenda o callback (executado no pool de threads)"""
+        with self._lock:
+            heapq.heappush(self._timers, (time.monotonic() + delay, next(self._sequence), callback, args))
+        self._ensure_running()
+        self._wake()
+
+    def submit(self, callback: Callable, *args):
+        self._executor.submit(self._safe_call, callback, args)
+
+    def _command(self, name: str, payload):
+        with self._lock:
+            self._pending.append((name, payload))
+        self._ensure_running()
+        self._wake()
+
+    def _ensure_running(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='bot-monitor-loop', daemon=True)
+                self._thread.start()
+
+    def _wake(self):
+        try:
+            os.write(self._wakeup_write, b'\0')
+        except BlockingIOError:
+            pass  # O loop já tem um despertar pendente
+
+    def _run(self):
+        while True:
+            try:
+                self._apply_pending()
+                events = self._selector.select(self._next_timeout())
+                for key, _ in events:
+                    kind, watch, stream = key.data
+                    if kind == 'wakeup':
+                        self._drain_wakeup()
+                    elif kind == 'exit':
+                        self._check_exit(watch)
+                    else:
+                        self._read(key.fileobj, watch, stream)
+                self._fire_timers()
+                if not self._use_pidfd:
+                    for watch in list(self._watches.values()):
+                        self._check_exit(watch)
+            except Exception as e:
+                print(f"Erro no loop de monitoramento dos bots: {e}")
+                time.sleep(0.1)
+
+    def _apply_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for name, watch in pending:
+            if name == 'watch':
+                self._register(watch)
+
+    def _register(self, watch: _Watch):
+        process = watch.process
+        self._watches[process.pid] = watch
+        for stream_name, stream in (('stdout', process.stdout), ('stderr', process.stderr)):
+            if stream is None:
+                continue
+            os.set_blocking(stream.fileno(), False)
+            watch.buffers[stream_name] = b''
+            watch.streams[stream_name] = stream
+            self._selector.register(stream, selectors.EVENT_READ, ('output', watch, stream_name))
+
+        if self._use_pidfd:
+            try:
+                watch.pidfd = os.pidfd_open(process.pid)
+                self._selector.register(watch.pidfd, selectors.EVENT_READ, ('exit', watch, None))
+            except ProcessLookupError:
+                pass  # Já terminou; o poll() abaixo trata
+            except OSError:
+                self._use_pidfd = False  # Kernel sem pidfd: volta para o poll() periódico
+        self._check_exit(watch)
+
+    def _read(self, stream, watch: _Watch, stream_name: str) -> bool:
+        """Lê o que estiver disponível no pipe; False quando não há mais dados agora"""
+        try:
+            chunk = os.read(stream.fileno(), 65536)
+        except BlockingIOError:
+            return False
+        except OSError:
+            chunk = b''
+
+        data = watch.buffers[stream_name] + chunk
+        if not chunk:
+            # Fim do pipe: entregar o resto e parar de observar
+            self._close_stream(watch, stream_name)
+            lines, data = ([data] if data else []), b''
+        else:
+            *lines, data = data.split(b'\n')
+        watch.buffers[stream_name] = data
+
+        for line in lines:
+            self._safe_call(watch.on_output, (stream_name, line.decode('utf-8', errors='replace').rstrip()))
+        self._maybe_finish(watch)
+        return bool(chunk)
+
+    def _close_stream(self, watch: _Watch, stream_name: str):
+        stream = watch.streams.pop(stream_name, None)
+        if stream is not None:
+            self._selector.unregister(stream)
+            stream.close()
+
+    def _check_exit(self, watch: _Watch):
+        if watch.exited or watch.process.poll() is None:
+            return
+        watch.exited = True
+        if watch.pidfd is not None:
+            self._selector.unregister(watch.pidfd)
+            os.close(watch.pidfd)
+            watch.pidfd = None
+
+        # Ler o que o processo deixou nos pipes; processos filhos dele (ex.: Chromium)
+        # podem manter o pipe aberto, então não esperamos pelo EOF
+        for stream_name, stream in list(watch.streams.items()):
+            while stream_name in watch.streams and self._read(stream, watch, stream_name):
+                pass
+            if watch.buffers.get(stream_name):
+                line, watch.buffers[stream_name] = watch.buffers[stream_name], b''
+                self._safe_call(watch.on_output, (stream_name, line.decode('utf-8', errors='replace').rstrip()))
+            self._close_stream(watch, stream_name)
+        self._maybe_finish(watch)
+
+    def _maybe_finish(self, watch: _Watch):
+        # A saída só é notificada depois de lidas as últimas linhas do processo
+        if watch.exited and not watch.streams and self._watches.get(watch.process.pid) is watch:
+            del self._watches[watch.process.pid]
+            self.submit(watch.on_exit, watch.process.returncode)
+
+    def _next_timeout(self) -> Optional[float]:
+        with self._lock:
+            timeout = max(self._timers[0][0] - time.monotonic(), 0) if self._timers else None
+        if not self._use_pidfd and self._watches:
+            timeout = EXIT_POLL_INTERVAL if timeout is None else min(timeout, EXIT_POLL_INTERVAL)
+        return timeout
+
+    def _fire_timers(self):
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                if not self._timers or self._timers[0][0] > now:
+                    return
+                _, _, callback, args = heapq.heappop(self._timers)
+            self.submit(callback, *args)
+
+    def _drain_wakeup(self):
+        try:
+            while os.read(self._wakeup_read, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    @staticmethod
+    def _safe_call(callback: Callable, args: tuple):
+        try:
+            callback(*args)
+        except Exception as e:
+            print(f"Erro em tarefa do monitor de bots: {e}")
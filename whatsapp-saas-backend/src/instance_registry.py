@@ -0,0 +1,150 @@
+import os
+import socket
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import and_, or_
+
+from src.models import db
+from src.models.bot import Bot, BotInstance
+from src.db_helpers import upsert
+
+# Status do bot Node em que não há processo atendendo
+STOPPED_STATUSES = ('stopped', 'stopping')
+
+
+class InstanceRegistry:
+    """Estado dos processos dos bots visível a todos os workers (tabela bot_instances)
+
+    Só o worker supervisor (o que detém o lock de arquivo do WhatsAppManager)
+    inicia processos; ele grava pid, porta, status e QR code e renova a lease
+    com um heartbeat. Os demais workers leem o estado daqui e pedem início ou
+    parada gravando desired_state com uma nova geração, que o supervisor aplica.
+    """
+
+    def __init__(self):
+        self.lease_seconds = float(os.getenv('BOT_LEASE_SECONDS', 30))
+        self.heartbeat_seconds = float(os.getenv('BOT_HEARTBEAT_SECONDS', 10))
+        self.poll_seconds = float(os.getenv('BOT_REGISTRY_POLL_SECONDS', 1))
+        self.app = None
+
+    def init_app(self, app):
+        self.app = app
+
+    @property
+    def owner(self) -> str:
+        # Calculado a cada uso: com --preload os workers do gunicorn importam o módulo antes do fork
+        return f'{socket.gethostname()}:{os.getpid()}'
+
+    def record(self, bot_id: int, **fields):
+        """Grava o estado do processo como dono e renova a lease"""
+        now = datetime.utcnow()
+        values = {'bot_id': bot_id, 'owner': self.owner, 'heartbeat_at': now,
+                  'lease_expires_at': now + timedelta(seconds=self.lease_seconds), 'updated_at': now, **fields}
+        columns = [key for key in values if key != 'bot_id']
+        self._upsert(values, lambda excluded: {key: getattr(excluded, key) for key in columns})
+
+    def release(self, bot_id: int, status: str = 'stopped', **fields):
+        """Processo encerrado: a linha fica, sem pid, com o último status"""
+        self.record(bot_id, pid=None, port=None, socket_path=None, status=status, qr_code=None, **fields)
+
+    def desire(self, bot_id: int, desired_state: str):
+        """Estado que o supervisor deve restaurar ao assumir (pedido feito no próprio supervisor)"""
+        values = {'bot_id': bot_id, 'desired_state': desired_state, 'updated_at': datetime.utcnow()}
+        self._upsert(values, lambda excluded: {
+            'desired_state': excluded.desired_state,
+            'updated_at': excluded.updated_at
+        })
+
+    def request(self, bot_id: int, desired_state: str) -> Optional[int]:
+        """Pede ao supervisor que inicie ou pare o bot; retorna a geração do pedido"""
+        values = {'bot_id': bot_id, 'desired_state': desired_state, 'generation': 1,
+                  'updated_at': datetime.utcnow()}
+        try:
+            with self.app.app_context():
+                db.session.execute(upsert(BotInstance, ['bot_id'], lambda excluded: {
+                    'desired_state': excluded.desired_state,
+                    'generation': BotInstance.generation + 1,
+                    'updated_at': excluded.updated_at
+                }), [values])
+                generation = db.session.query(BotInstance.generation).filter_by(bot_id=bot_id).scalar()
+                db.session.commit()
+                return generation
+        except Exception as e:
+            print(f"Erro ao registrar pedido para o bot {bot_id}: {e}")
+            return None
+
+    def applied(self, bot_id: int, generation: int, error: Optional[str] = None):
+        self._update(and_(BotInstance.bot_id == bot_id, BotInstance.applied_generation < generation),
+                     applied_generation=generation, error=error, updated_at=datetime.utcnow())
+
+    def heartbeat(self):
+        """Renova a lease de todos os processos deste worker"""
+        now = datetime.utcnow()
+        self._update(and_(BotInstance.owner == self.owner, BotInstance.pid.isnot(None)),
+                     heartbeat_at=now, lease_expires_at=now + timedelta(seconds=self.lease_seconds))
+
+    def get(self, bot_id: int) -> Optional[dict]:
+        with self.app.app_context():
+            instance = db.session.get(BotInstance, bot_id)
+            return instance.to_dict() if instance is not None else None
+
+    def is_live(self, instance: Optional[dict]) -> bool:
+        """True se há um processo de pé com lease válida"""
+        return (instance is not None and instance['pid'] is not None
+                and instance['status'] not in STOPPED_STATUSES
+                and instance['lease_expires_at'] is not None
+                and datetime.fromisoformat(instance['lease_expires_at']) > datetime.utcnow())
+
+    def pending(self) -> List[dict]:
+        """Pedidos de outros workers ainda não aplicados pelo supervisor"""
+        with self.app.app_context():
+            return [instance.to_dict() for instance in BotInstance.query.filter(
+                BotInstance.generation > BotInstance.applied_generation
+            ).order_by(BotInstance.bot_id).all()]
+
+    def orphans(self) -> List[dict]:
+        """Processos registrados por um supervisor que não existe mais"""
+        with self.app.app_context():
+            return [instance.to_dict() for instance in BotInstance.query.filter(
+                BotInstance.pid.isnot(None), or_(BotInstance.owner.is_(None), BotInstance.owner != self.owner)
+            ).all()]
+
+    def desired_running(self) -> List[dict]:
+        """Bots que devem estar rodando (Bot.to_dict()); bancos anteriores ao registro usam Bot.status"""
+        with self.app.app_context():
+            bots = Bot.query.outerjoin(BotInstance, BotInstance.bot_id == Bot.id).filter(or_(
+                BotInstance.desired_state == 'running',
+                and_(BotInstance.bot_id.is_(None), Bot.status.in_(('active', 'connecting')))
+            )).order_by(Bot.id).all()
+            return [bot.to_dict() for bot in bots]
+
+    def existing_bots(self, bot_ids: List[int]) -> set:
+        if not bot_ids:
+            return set()
+        with self.app.app_context():
+            return {bot_id for (bot_id,) in db.session.query(Bot.id).filter(Bot.id.in_(bot_ids)).all()}
+
+    def _update(self, condition, **values):
+        if self.app is None:
+            return
+        try:
+            with self.app.app_context():
+                BotInstance.query.filter(condition).update(values, synchronize_session=False)
+                db.session.commit()
+        except Exception as e:
+            print(f"Erro ao atualizar o registro de instâncias: {e}")
+
+    def _upsert(self, values: dict, update):
+        if self.app is None:
+            return
+        try:
+            with self.app.app_context():
+                # O dialeto do upsert depende do engine: montado dentro do app context
+                db.session.execute(upsert(BotInstance, ['bot_id'], update), [values])
+                db.session.commit()
+        except Exception as e:
+            print(f"Erro ao gravar o registro de instâncias: {e}")
+
+# Instância global do registro de instâncias
+instance_registry = InstanceRegistry()
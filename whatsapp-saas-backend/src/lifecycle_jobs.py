@@ -0,0 +1,203 @@
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from src.models import db
+from src.models.bot import Bot, LifecycleJob
+from src.whatsapp_manager import whatsapp_manager, bot_status_for
+from src.status_events import status_broker
+
+
+class LifecycleJobs:
+    """Início e parada de bots como jobs assíncronos
+
+    A rota só registra o job e devolve o id; o processo é iniciado (ou parado)
+    pelo WhatsAppManager sem bloquear a requisição, e o job termina quando o bot
+    confirma a inicialização pelo stdout (handshake) ou quando o processo sai.
+    Cada job também é gravado na tabela lifecycle_jobs, para que o status possa
+    ser consultado por qualquer worker, não só pelo que o criou.
+    """
+
+    def __init__(self):
+        self.retention = int(os.getenv('BOT_JOB_RETENTION_SECONDS', 3600))
+        self.app = None
+        self.jobs: Dict[str, dict] = {}
+        self._active: Dict[int, str] = {}  # bot_id -> job em andamento
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # Gravações em ordem: a última sempre tem o estado mais novo
+
+    def init_app(self, app):
+        self.app = app
+
+    def start(self, bot: Bot) -> Optional[dict]:
+        """Agenda o início do bot; None se já houver um job em andamento para ele"""
+        return self.launch('start', bot.to_dict())
+
+    def stop(self, bot: Bot) -> Optional[dict]:
+        """Agenda a parada do bot; None se já houver um job em andamento para ele"""
+        return self.launch('stop', bot.to_dict())
+
+    def launch(self, action: str, bot_data: dict,
+               on_finish: Optional[Callable[[dict], None]] = None) -> Optional[dict]:
+        """Agenda start, stop ou restart a partir de Bot.to_dict()
+
+        on_finish(job) roda no pool do monitor quando o job termina.
+        """
+        job = self._create(action, bot_data, on_finish)
+        if job is None:
+            return None
+        if action == 'stop':
+            self._step(job, 'stopping')
+            if not whatsapp_manager.stop_instance_async(job['bot_id'], on_done=lambda: self._finish_stop(job)):
+                self._finish_stop(job)  # Não estava rodando: só acerta o status
+        else:
+            # restart é um start: o manager para o processo anterior antes de subir o novo
+            whatsapp_manager.start_instance(
+                job['bot_id'], bot_data,
+                on_done=lambda ok, error: self._finish_start(job, ok, error),
+                on_step=lambda step: self._step(job, step)
+            )
+        return self.to_dict(job)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return self.to_dict(job)
+        # Criado por outro worker: vem da tabela compartilhada
+        return self._load(LifecycleJob.id == job_id)
+
+    def active_for(self, bot_id: int) -> Optional[dict]:
+        job_id = self._active.get(bot_id)
+        if job_id:
+            return self.get(job_id)
+        # Jobs sem fim mais antigos que a retenção são de um worker que morreu
+        cutoff = datetime.utcnow() - timedelta(seconds=self.retention)
+        return self._load(LifecycleJob.bot_id == bot_id, LifecycleJob.state == 'running',
+                          LifecycleJob.created_at >= cutoff)
+
+    @staticmethod
+    def to_dict(job: dict) -> dict:
+        return {key: value for key, value in job.items() if not key.startswith('_')}
+
+    def _create(self, action: str, bot_data: dict, on_finish: Optional[Callable]) -> Optional[dict]:
+        with self._lock:
+            if bot_data['id'] in self._active:
+                return None
+            self._prune()
+            job = {
+                'id': uuid.uuid4().hex,
+                'action': action,
+                'bot_id': bot_data['id'],
+                'user_id': bot_data['user_id'],
+                'state': 'running',  # running, succeeded, failed
+                'step': 'queued',
+                'error': None,
+                'bot_status': None,
+                'created_at': datetime.utcnow().isoformat(),
+                'finished_at': None,
+                '_finished': None,  # time.time() do fim, para a limpeza
+                '_on_finish': on_finish
+            }
+            self.jobs[job['id']] = job
+            self._active[job['bot_id']] = job['id']
+        self._save(job)
+        return job
+
+    def _step(self, job: dict, step: str):
+        if job['state'] == 'running' and job['step'] != step:
+            job['step'] = step
+            self._save(job)
+
+    def _finish_start(self, job: dict, ok: bool, error: Optional[str]):
+        if ok:
+            # O bot pode já ter enviado QR ou 'ready' junto com o handshake
+            instance_status = whatsapp_manager.get_instance_status(job['bot_id']) or {}
+            status = bot_status_for(instance_status.get('status')) or 'connecting'
+            qr_code = instance_status.get('qrCode')
+        else:
+            status, qr_code = 'error', None
+        self._update_bot(job, status, qr_code, running=ok)
+        self._finish(job, 'succeeded' if ok else 'failed', error)
+
+    def _finish_stop(self, job: dict):
+        self._update_bot(job, 'inactive', None, running=False)
+        self._finish(job, 'succeeded')
+
+    def _update_bot(self, job: dict, status: str, qr_code: Optional[str], running: bool):
+        try:
+            with self.app.app_context():
+                bot = db.session.get(Bot, job['bot_id'])
+                if bot is not None:
+                    bot.status = status
+                    bot.qr_code = qr_code
+                    db.session.commit()
+        except Exception as e:
+            print(f"Erro ao atualizar o bot {job['bot_id']} no job {job['id']}: {e}")
+        job['bot_status'] = status
+        status_broker.publish_session(job['user_id'], job['bot_id'], status, qr_code, running)
+
+    def _finish(self, job: dict, state: str, error: Optional[str] = None):
+        with self._lock:
+            job['state'] = state
+            job['step'] = 'done'
+            job['error'] = error
+            job['finished_at'] = datetime.utcnow().isoformat()
+            job['_finished'] = time.time()
+            if self._active.get(job['bot_id']) == job['id']:
+                del self._active[job['bot_id']]
+            on_finish = job.pop('_on_finish', None)
+        self._save(job)
+        if on_finish is not None:
+            on_finish(self.to_dict(job))
+
+    def _save(self, job: dict):
+        """Grava o estado do job na tabela compartilhada; uma falha do banco não interrompe o job"""
+        if self.app is None:
+            return
+        try:
+            with self._save_lock, self.app.app_context():
+                db.session.merge(LifecycleJob(
+                    id=job['id'],
+                    action=job['action'],
+                    bot_id=job['bot_id'],
+                    user_id=job['user_id'],
+                    state=job['state'],
+                    step=job['step'],
+                    error=job['error'],
+                    bot_status=job['bot_status'],
+                    created_at=datetime.fromisoformat(job['created_at']),
+                    finished_at=datetime.fromisoformat(job['finished_at']) if job['finished_at'] else None
+                ))
+                db.session.commit()
+        except Exception as e:
+            print(f"Erro ao gravar o job {job['id']}: {e}")
+
+    def _load(self, *criteria) -> Optional[dict]:
+        if self.app is None:
+            return None
+        with self.app.app_context():
+            row = LifecycleJob.query.filter(*criteria).order_by(LifecycleJob.created_at.desc()).first()
+            return row.to_dict() if row is not None else None
+
+    def _prune(self):
+        # Chamado com o lock: remove jobs concluídos há mais tempo que a retenção
+        cutoff = time.time() - self.retention
+        for job_id in [job_id for job_id, job in self.jobs.items()
+                       if job['_finished'] is not None and job['_finished'] < cutoff]:
+            del self.jobs[job_id]
+        if self.app is None:
+            return
+        try:
+            with self.app.app_context():
+                LifecycleJob.query.filter(
+                    LifecycleJob.finished_at < datetime.utcnow() - timedelta(seconds=self.retention)
+                ).delete(synchronize_session=False)
+                db.session.commit()
+        except Exception as e:
+            print(f"Erro ao limpar os jobs antigos: {e}")
+
+# Instância global dos jobs de início/parada
+lifecycle_jobs = LifecycleJobs()
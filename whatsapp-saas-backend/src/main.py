@@ -18,6 +18,19 @@ from src.routes.bots import bots_bp
 from src.routes.flows import flows_bp
 from src.routes.whatsapp import whatsapp_bp
 from src.routes.whatsapp_sessions import whatsapp_sessions_bp
+from src.routes.campaigns import campaigns_bp
+from src.routes.scheduled_messages import scheduled_messages_bp
+from src.flow_runner import flow_runner
+from src.message_ingestion import ingestion_pipeline
+from src.message_archive import message_archive
+from src.migrations import run_migrations
+from src.db_config import init_db
+from src.whatsapp_manager import whatsapp_manager
+from src.lifecycle_jobs import lifecycle_jobs
+from src.status_events import status_broker
+from src.outbound_queue import outbound_queue
+from src.campaign_engine import campaign_engine
+from src.message_scheduler import message_scheduler
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 
@@ -38,14 +51,31 @@ app.register_blueprint(bots_bp, url_prefix='/api')
 app.register_blueprint(flows_bp, url_prefix='/api')
 app.register_blueprint(whatsapp_bp, url_prefix='/api/whatsapp')
 app.register_blueprint(whatsapp_sessions_bp, url_prefix='/api/whatsapp-sessions')
+app.register_blueprint(campaigns_bp, url_prefix='/api')
+app.register_blueprint(scheduled_messages_bp, url_prefix='/api')
 
-# Configurar banco de dados
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(app)
+# Configurar banco de dados (DATABASE_URL, pool e timeouts via variáveis de ambiente)
+init_db(app)
 
 with app.app_context():
     db.create_all()
+    run_migrations()
+
+# Serviços em segundo plano (dependem do schema já criado)
+ingestion_pipeline.init_app(app)
+message_archive.init_app(app)
+
+# Com o reloader do modo debug só o processo filho atende requisições e deve religar os bots
+serving_process = __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+lifecycle_jobs.init_app(app)
+# Todo worker grava os eventos do SSE e repassa aos seus painéis os publicados pelos outros
+status_broker.init_app(app, relay=serving_process)
+whatsapp_manager.init_app(app, autostart=serving_process)
+# Depois do manager: só o worker supervisor despacha os envios e retoma os delays dos fluxos
+flow_runner.init_app(app)
+outbound_queue.init_app(app)
+campaign_engine.init_app(app)
+message_scheduler.init_app(app)
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -0,0 +1,267 @@
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from src.models import db
+from src.models.bot import Message
+
+Cursor = Tuple[datetime, int]
+
+# Formato de texto com largura fixa: a ordem lexicográfica é a ordem cronológica
+_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+_COLUMNS = ('id', 'bot_id', 'external_id', 'contact_number', 'contact_name', 'message_type',
+            'content', 'media_url', 'direction', 'status', 'timestamp')
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS messages ('
+    'id INTEGER PRIMARY KEY, bot_id INTEGER NOT NULL, external_id TEXT, '
+    'contact_number TEXT NOT NULL, contact_name TEXT, message_type TEXT NOT NULL, '
+    'content BLOB, media_url TEXT, direction TEXT NOT NULL, status TEXT, timestamp TEXT NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS ix_messages_bot_timestamp ON messages (bot_id, timestamp, id)',
+    'CREATE INDEX IF NOT EXISTS ix_messages_bot_contact_timestamp '
+    'ON messages (bot_id, contact_number, timestamp, id)',
+)
+
+
+def _month_start(value: datetime, months_back: int = 0) -> datetime:
+    month_index = value.year * 12 + value.month - 1 - months_back
+    return datetime(month_index // 12, month_index % 12 + 1, 1)
+
+
+class MessageArchive:
+    """Partições mensais frias do histórico, em arquivos SQLite compactados
+
+    Os meses recentes ficam na tabela `messages` do banco principal; os mais
+    antigos são movidos para um arquivo por mês (conteúdo comprimido com zlib)
+    e continuam sendo lidos pela API de histórico.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv('MESSAGE_ARCHIVE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+        self.directory = os.getenv('MESSAGE_ARCHIVE_DIR', os.path.join(
+            os.path.dirname(__file__), 'database', 'archive'
+        ))
+        self.hot_months = max(int(os.getenv('MESSAGE_ARCHIVE_HOT_MONTHS', 3)), 1)
+        self.interval = int(os.getenv('MESSAGE_ARCHIVE_INTERVAL_HOURS', 24)) * 3600
+        self.batch_size = int(os.getenv('MESSAGE_ARCHIVE_BATCH', 5000))
+
+        self.app = None
+        self._counts: Dict[Tuple[str, int, Optional[str]], int] = {}
+        self._counts_lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+
+    def init_app(self, app):
+        self.app = app
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def months(self) -> List[str]:
+        """Meses arquivados ('AAAA-MM'), do mais recente para o mais antigo"""
+        if not self.enabled or not os.path.isdir(self.directory):
+            return []
+        months = [name[9:-3] for name in os.listdir(self.directory)
+                  if name.startswith('messages-') and name.endswith('.db')]
+        return sorted(months, reverse=True)
+
+    def count(self, bot_id: int, contact_number: Optional[str] = None) -> int:
+        return sum(self._month_count(month, bot_id, contact_number) for month in self.months())
+
+    def window(self, bot_id: int, before: Optional[Cursor], limit: int,
+               contact_number: Optional[str] = None) -> List[Message]:
+        """Continua a paginação por cursor nas partições arquivadas"""
+        messages: List[Message] = []
+        for month in self.months():
+            if len(messages) >= limit:
+                break
+            if before is not None and month > before[0].strftime('%Y-%m'):
+                continue  # Partição inteira mais nova que o cursor
+
+            sql, params = self._where(bot_id, contact_number)
+            if before is not None:
+                sql += ' AND (timestamp, id) < (?, ?)'
+                params += (before[0].strftime(_TIMESTAMP_FORMAT), before[1])
+            messages.extend(self._select(month, sql, params, limit - len(messages), 0))
+        return messages
+
+    def page(self, bot_id: int, offset: int, limit: int,
+             contact_number: Optional[str] = None) -> List[Message]:
+        """Continua a paginação por página, pulando partições inteiras pelo COUNT"""
+        messages: List[Message] = []
+        sql, params = self._where(bot_id, contact_number)
+        for month in self.months():
+            if len(messages) >= limit:
+                break
+            size = self._month_count(month, bot_id, contact_number)
+            if offset >= size:
+                offset -= size
+                continue
+            messages.extend(self._select(month, sql, params, limit - len(messages), offset))
+            offset = 0
+        return messages
+
+    def delete_bot(self, bot_id: int):
+        """Remove o histórico arquivado de um bot excluído"""
+        for month in self.months():
+            with self._open(month, writable=True) as conn:
+                conn.execute('DELETE FROM messages WHERE bot_id = ?', (bot_id,))
+        self._clear_counts()
+
+    def rollover(self, now: Optional[datetime] = None) -> int:
+        """Move os meses fora da janela quente para os arquivos; retorna as mensagens movidas"""
+        cutoff = _month_start(now or datetime.utcnow(), self.hot_months - 1)
+        lock_file = self._try_lock()
+        if lock_file is None:
+            return 0  # Outro processo já está arquivando
+
+        moved = 0
+        try:
+            while True:
+                oldest = db.session.query(db.func.min(Message.timestamp)).filter(
+                    Message.timestamp < cutoff
+                ).scalar()
+                if oldest is None:
+                    break
+                moved += self._archive_month(_month_start(oldest))
+        finally:
+            lock_file.close()
+        if moved:
+            self._clear_counts()
+            print(f"{moved} mensagens movidas para o arquivo histórico")
+        return moved
+
+    def _archive_month(self, start: datetime) -> int:
+        end = _month_start(start, -1)
+        month = start.strftime('%Y-%m')
+        columns = [getattr(Message, column) for column in _COLUMNS]
+        moved = 0
+        last_id = 0
+
+        with self._open(month, writable=True) as conn:
+            for statement in _SCHEMA:
+                conn.execute(statement)
+
+            while True:
+                rows = db.session.query(*columns).filter(
+                    Message.timestamp >= start, Message.timestamp < end, Message.id > last_id
+                ).order_by(Message.id).limit(self.batch_size).all()
+                if not rows:
+                    break
+
+                # Grava no arquivo antes de apagar do banco principal; reexecutar é seguro
+                conn.executemany(
+                    f'INSERT OR IGNORE INTO messages ({", ".join(_COLUMNS)}) '
+                    f'VALUES ({", ".join("?" * len(_COLUMNS))})',
+                    [self._to_archive(row) for row in rows]
+                )
+                conn.commit()
+
+                ids = [row.id for row in rows]
+                Message.query.filter(Message.id.in_(ids)).delete(synchronize_session=False)
+                db.session.commit()
+
+                moved += len(rows)
+                last_id = ids[-1]
+
+            conn.execute('VACUUM')
+        return moved
+
+    def _run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    self.rollover()
+            except Exception as e:
+                print(f"Erro ao arquivar mensagens: {e}")
+            time.sleep(self.interval)
+
+    def _path(self, month: str) -> str:
+        return os.path.join(self.directory, f'messages-{month}.db')
+
+    @contextmanager
+    def _open(self, month: str, writable: bool = False) -> Iterator[sqlite3.Connection]:
+        if writable:
+            conn = sqlite3.connect(self._path(month), timeout=30)
+        else:
+            conn = sqlite3.connect(f'file:{self._path(month)}?mode=ro', uri=True)
+        try:
+            yield conn
+            if writable:
+                conn.commit()
+        finally:
+            conn.close()
+
+    def _try_lock(self):
+        os.makedirs(self.directory, exist_ok=True)
+        lock_file = open(os.path.join(self.directory, 'rollover.lock'), 'a')
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return None
+        return lock_file
+
+    def _month_count(self, month: str, bot_id: int, contact_number: Optional[str]) -> int:
+        key = (month, bot_id, contact_number)
+        with self._counts_lock:
+            cached = self._counts.get(key)
+        if cached is None:
+            sql, params = self._where(bot_id, contact_number)
+            with self._open(month) as conn:
+                cached = conn.execute(f'SELECT COUNT(*) FROM messages WHERE {sql}', params).fetchone()[0]
+            with self._counts_lock:
+                self._counts[key] = cached
+        return cached
+
+    def _clear_counts(self):
+        with self._counts_lock:
+            self._counts.clear()
+
+    @staticmethod
+    def _where(bot_id: int, contact_number: Optional[str]) -> Tuple[str, tuple]:
+        if contact_number:
+            return 'bot_id = ? AND contact_number = ?', (bot_id, contact_number)
+        return 'bot_id = ?', (bot_id,)
+
+    def _select(self, month: str, sql: str, params: tuple, limit: int, offset: int) -> List[Message]:
+        with self._open(month) as conn:
+            rows = conn.execute(
+                f'SELECT {", ".join(_COLUMNS)} FROM messages WHERE {sql} '
+                'ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?',
+                params + (limit, offset)
+            ).fetchall()
+        return [self._from_archive(row) for row in rows]
+
+    @staticmethod
+    def _to_archive(row) -> tuple:
+        values = dict(zip(_COLUMNS, row))
+        content = values['content']
+        values['content'] = zlib.compress(content.encode('utf-8')) if content is not None else None
+        values['timestamp'] = values['timestamp'].strftime(_TIMESTAMP_FORMAT)
+        return tuple(values[column] for column in _COLUMNS)
+
+    @staticmethod
+    def _from_archive(row: tuple) -> Message:
+        values = dict(zip(_COLUMNS, row))
+        if values['content'] is not None:
+            values['content'] = zlib.decompress(values['content']).decode('utf-8')
+        values['timestamp'] = datetime.strptime(values['timestamp'], _TIMESTAMP_FORMAT)
+        # Objeto fora da sessão: serve apenas para serialização (to_dict)
+        return Message(**values)
+
+# Instância global do arquivo de mensagens
+message_archive = MessageArchive()
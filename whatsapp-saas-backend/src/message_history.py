@@ -0,0 +1,96 @@
+import base64
+import math
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import func, literal, tuple_
+
+from src.models import db
+from src.models.bot import Message
+from src.message_archive import message_archive
+
+MAX_PAGE_SIZE = 500
+
+Cursor = Tuple[datetime, int]  # (timestamp, id) do último item entregue
+
+
+def encode_cursor(timestamp: datetime, item_id: int) -> str:
+    raw = f'{timestamp.isoformat()},{item_id}'
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(value: str) -> Cursor:
+    """Aceita o cursor opaco ou o formato legível 'timestamp,id'"""
+    value = value.strip()
+    if ',' not in value:
+        padded = value + '=' * (-len(value) % 4)
+        value = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+    timestamp, message_id = value.rsplit(',', 1)
+    return datetime.fromisoformat(timestamp), int(message_id)
+
+
+def _filtered(query, bot_id: int, contact_number: Optional[str]):
+    query = query.filter(Message.bot_id == bot_id)
+    if contact_number:
+        query = query.filter(Message.contact_number == contact_number)
+    return query
+
+
+def _count_hot(bot_id: int, contact_number: Optional[str] = None) -> int:
+    """COUNT resolvido apenas pelo índice (bot_id, [contact_number,] timestamp, id)"""
+    return _filtered(db.session.query(func.count(Message.id)), bot_id, contact_number).scalar()
+
+
+def count_messages(bot_id: int, contact_number: Optional[str] = None) -> int:
+    return _count_hot(bot_id, contact_number) + message_archive.count(bot_id, contact_number)
+
+
+def message_page(bot_id: int, page: int = 1, per_page: int = 50,
+                 contact_number: Optional[str] = None) -> Tuple[List[Message], int, int]:
+    """Retorna (mensagens, total, páginas) do histórico, mais recentes primeiro"""
+    page = max(page, 1)
+    per_page = min(max(per_page, 1), MAX_PAGE_SIZE)
+
+    # O OFFSET percorre só o índice; as linhas completas são lidas apenas para a página
+    offset = (page - 1) * per_page
+    page_ids = _filtered(db.session.query(Message.id), bot_id, contact_number).order_by(
+        Message.timestamp.desc(), Message.id.desc()
+    ).limit(per_page).offset(offset).subquery()
+
+    messages = Message.query.filter(Message.id.in_(db.select(page_ids.c.id))).order_by(
+        Message.timestamp.desc(), Message.id.desc()
+    ).all()
+
+    hot_total = _count_hot(bot_id, contact_number)
+    if len(messages) < per_page and message_archive.enabled:
+        # Meses arquivados são sempre mais antigos que os do banco principal
+        messages += message_archive.page(
+            bot_id, max(offset - hot_total, 0), per_page - len(messages), contact_number
+        )
+
+    total = hot_total + message_archive.count(bot_id, contact_number)
+    return messages, total, int(math.ceil(total / float(per_page))) if total else 0
+
+
+def message_window(bot_id: int, before: Optional[Cursor] = None, limit: int = 50,
+                   contact_number: Optional[str] = None) -> Tuple[List[Message], Optional[str]]:
+    """Paginação por cursor: busca pelo índice a partir da última mensagem vista"""
+    limit = min(max(limit, 1), MAX_PAGE_SIZE)
+
+    query = _filtered(Message.query, bot_id, contact_number)
+    if before is not None:
+        timestamp, message_id = before
+        query = query.filter(tuple_(Message.timestamp, Message.id) < tuple_(
+            literal(timestamp, Message.timestamp.type), literal(message_id)
+        ))
+
+    # Um item a mais indica se existe próxima página, sem precisar de COUNT
+    messages = query.order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit + 1).all()
+    if len(messages) <= limit and message_archive.enabled:
+        messages += message_archive.window(bot_id, before, limit + 1 - len(messages), contact_number)
+
+    next_cursor = None
+    if len(messages) > limit:
+        messages = messages[:limit]
+        next_cursor = encode_cursor(messages[-1].timestamp, messages[-1].id)
+    return messages, next_cursor
@@ -0,0 +1,367 @@
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import text
+
+from src.models import db
+from src.models.bot import Bot, Message
+from src.db_helpers import insert_ignore_keys
+from src.conversation_summary import record_messages
+from src.flow_runner import flow_runner
+from src.webhook_spool import webhook_spool
+
+
+def parse_webhook_payload(data: Optional[dict]) -> Optional[dict]:
+    """Extrai a mensagem recebida do corpo do webhook do bot Node"""
+    if not isinstance(data, dict):
+        return None
+
+    # O bot Node envia os campos no nível raiz; integrações antigas usam 'message'
+    message_data = data.get('message')
+    if not message_data and data.get('type') == 'message_received':
+        message_data = data
+    if not isinstance(message_data, dict) or not message_data.get('from'):
+        return None
+
+    message_type = message_data.get('messageType') or message_data.get('type') or 'text'
+    if message_type == 'chat':
+        message_type = 'text'
+
+    # whatsapp-web.js serializa o id como {'_serialized': ...}
+    external_id = message_data.get('id')
+    if isinstance(external_id, dict):
+        external_id = external_id.get('_serialized')
+
+    return {
+        'external_id': str(external_id) if external_id else None,
+        'contact_number': str(message_data.get('from', '')),
+        'content': message_data.get('body', ''),
+        'message_type': str(message_type)
+    }
+
+
+class RecentIds:
+    """Conjunto LRU dos ids de mensagem vistos recentemente"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._ids: 'OrderedDict[str, None]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check_and_add(self, external_id: str) -> bool:
+        """Registra o id; True se ele já tinha sido visto"""
+        with self._lock:
+            if external_id in self._ids:
+                self._ids.move_to_end(external_id)
+                return True
+            self._ids[external_id] = None
+            if len(self._ids) > self.capacity:
+                self._ids.popitem(last=False)
+            return False
+
+    def discard(self, external_id: str):
+        with self._lock:
+            self._ids.pop(external_id, None)
+
+
+class IngestionPipeline:
+    """Fila limitada que grava as mensagens recebidas em lotes"""
+
+    def __init__(self):
+        self.capacity = int(os.getenv('INGESTION_QUEUE_SIZE', 10000))
+        self.batch_size = int(os.getenv('INGESTION_BATCH_SIZE', 200))
+        self.batch_latency = int(os.getenv('INGESTION_BATCH_LATENCY_MS', 50)) / 1000.0
+        self.max_retries = int(os.getenv('INGESTION_MAX_RETRIES', 3))
+
+        self.app = None
+        self.queue: 'queue.Queue[dict]' = queue.Queue(maxsize=self.capacity)
+        self.recent_ids = RecentIds(int(os.getenv('INGESTION_DEDUP_CACHE_SIZE', 100000)))
+        self.stats: Dict[str, int] = {
+            'enqueued': 0,
+            'rejected': 0,
+            'duplicates': 0,
+            'written': 0,
+            'failed': 0,
+            'retries': 0,
+            'batches': 0
+        }
+        self._known_bots: Set[int] = set()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+
+    def init_app(self, app):
+        self.app = app
+
+        if webhook_spool.enabled:
+            pending = webhook_spool.open()
+            if pending:
+                print(f"Reprocessando {len(pending)} webhooks pendentes do spool")
+                threading.Thread(target=self._replay, args=(pending,), daemon=True).start()
+
+    def is_known_bot(self, bot_id: int) -> bool:
+        """Verifica se o bot existe, consultando o banco apenas uma vez por bot"""
+        if bot_id in self._known_bots:
+            return True
+        if db.session.query(Bot.id).filter_by(id=bot_id).first() is None:
+            return False
+        self._known_bots.add(bot_id)
+        return True
+
+    def forget_bot(self, bot_id: int):
+        self._known_bots.discard(bot_id)
+
+    def submit(self, bot_id: int, data: Optional[dict]) -> str:
+        """Recebe o corpo do webhook: 'queued', 'duplicate', 'ignored' ou 'full'"""
+        message = parse_webhook_payload(data)
+        if not message:
+            return 'ignored'
+
+        if self.queue.full():
+            with self._lock:
+                self.stats['rejected'] += 1
+            return 'full'
+
+        # Reenvios recentes são descartados sem tocar no disco nem no banco
+        external_id = message['external_id']
+        if external_id and self.recent_ids.check_and_add(external_id):
+            with self._lock:
+                self.stats['duplicates'] += 1
+            return 'duplicate'
+
+        accepted = False
+        try:
+            received_at = datetime.utcnow()
+            position = None
+            if webhook_spool.enabled:
+                # Persistido em disco antes de confirmar o recebimento
+                position = webhook_spool.append({
+                    'bot_id': bot_id,
+                    'payload': data,
+                    'received_at': received_at.isoformat()
+                })
+
+            accepted = self._put(bot_id, message, received_at, position, block=False)
+            if not accepted and position is not None:
+                # Não foi aceito: o remetente vai reenviar
+                webhook_spool.commit([position])
+        finally:
+            # Sem o aceite (fila cheia ou erro) o reenvio do bot não pode ser tratado como duplicado
+            if not accepted and external_id:
+                self.recent_ids.discard(external_id)
+        return 'queued' if accepted else 'full'
+
+    def _put(self, bot_id: int, message: dict, received_at: datetime,
+             position=None, block: bool = False) -> bool:
+        item = dict(message, bot_id=bot_id, received_at=received_at, spool_position=position)
+        try:
+            self.queue.put(item, block=block)
+        except queue.Full:
+            with self._lock:
+                self.stats['rejected'] += 1
+            return False
+
+        with self._lock:
+            self.stats['enqueued'] += 1
+        self._ensure_worker()
+        return True
+
+    def _replay(self, pending: list):
+        for position, record in pending:
+            message = parse_webhook_payload(record.get('payload'))
+            if not message:
+                webhook_spool.commit([position])
+                continue
+            try:
+                received_at = datetime.fromisoformat(record['received_at'])
+            except (KeyError, TypeError, ValueError):
+                received_at = datetime.utcnow()
+            if message['external_id']:
+                self.recent_ids.check_and_add(message['external_id'])
+            self._put(record['bot_id'], message, received_at, position, block=True)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+        stats.update({
+            'queue_depth': self.queue.qsize(),
+            'queue_capacity': self.capacity,
+            'spool_pending': webhook_spool.pending_count() if webhook_spool.enabled else 0,
+            'batch_size': self.batch_size,
+            'batch_latency_ms': int(self.batch_latency * 1000)
+        })
+        return stats
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+
+    def _next_batch(self) -> List[dict]:
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.batch_latency
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            with self.app.app_context():
+                if self._write(batch):
+                    self._dispatch(batch)
+
+    def _write(self, batch: List[dict]) -> bool:
+        """Insere o lote inteiro em uma única transação, ignorando ids já gravados"""
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                fresh, duplicates = self._split_duplicates(batch)
+                if fresh:
+                    inserted = insert_ignore_keys(Message, 'external_id', [self._row(item) for item in fresh])
+                    # Outro worker pode ter gravado o mesmo id depois da checagem: não conta no resumo nem dispara fluxo
+                    late = [item for item in fresh if item['external_id'] and item['external_id'] not in inserted]
+                    if late:
+                        fresh = [item for item in fresh if not item['external_id'] or item['external_id'] in inserted]
+                        duplicates += late
+                        with self._lock:
+                            self.stats['duplicates'] += len(late)
+                    record_messages([self._row(item) for item in fresh])
+                db.session.commit()
+                self._written(fresh, duplicates)
+                batch[:] = fresh
+                return True
+            except Exception as e:
+                db.session.rollback()
+                with self._lock:
+                    self.stats['retries'] += 1
+                print(f"Erro ao gravar lote de {len(batch)} mensagens (tentativa {attempt}): {e}")
+
+            if attempt >= self.max_retries:
+                written = self._write_one_by_one(batch)
+                if written is not None:
+                    return True
+                if not webhook_spool.enabled:
+                    with self._lock:
+                        self.stats['failed'] += len(batch)
+                    return False
+                # O banco não responde: o lote fica no spool e é tentado de novo
+
+            time.sleep(min(0.1 * 2 ** min(attempt, 6), 5))
+
+    def _split_duplicates(self, batch: List[dict]):
+        """Separa mensagens cujo id já existe no banco (ou se repete no lote)"""
+        external_ids = [item['external_id'] for item in batch if item['external_id']]
+        existing = set()
+        if external_ids:
+            existing = {row[0] for row in db.session.query(Message.external_id).filter(
+                Message.external_id.in_(external_ids)
+            )}
+
+        fresh, duplicates = [], []
+        for item in batch:
+            external_id = item['external_id']
+            if external_id and external_id in existing:
+                duplicates.append(item)
+                continue
+            if external_id:
+                existing.add(external_id)
+            fresh.append(item)
+
+        if duplicates:
+            with self._lock:
+                self.stats['duplicates'] += len(duplicates)
+        return fresh, duplicates
+
+    def _write_one_by_one(self, batch: List[dict]) -> Optional[List[dict]]:
+        """Isola registros inválidos; None se o banco estiver fora do ar"""
+        written = []
+        duplicates = []
+        rejected = []
+        for item in batch:
+            try:
+                row = self._row(item)
+                if item['external_id'] and item['external_id'] not in insert_ignore_keys(Message, 'external_id', [row]):
+                    db.session.rollback()
+                    duplicates.append(item)
+                    continue
+                record_messages([row])
+                db.session.commit()
+                written.append(item)
+            except Exception as e:
+                db.session.rollback()
+                rejected.append((item, e))
+
+        # Nenhum gravado pode ser um lote só de registros inválidos (ex.: número longo demais)
+        if not written and not duplicates and not self._database_reachable():
+            return None
+
+        # O banco respondeu, então os registros restantes são inválidos e descartados
+        for item, error in rejected:
+            print(f"Mensagem inválida do bot {item['bot_id']} ({item['contact_number']}) descartada: {error}")
+        with self._lock:
+            self.stats['failed'] += len(rejected)
+            self.stats['duplicates'] += len(duplicates)
+        self._written(written, duplicates + [item for item, _ in rejected])
+        batch[:] = written
+        return written
+
+    @staticmethod
+    def _database_reachable() -> bool:
+        try:
+            db.session.execute(text('SELECT 1'))
+            db.session.rollback()
+            return True
+        except Exception:
+            db.session.rollback()
+            return False
+
+    def _written(self, items: List[dict], discarded: Optional[List[dict]] = None):
+        with self._lock:
+            self.stats['written'] += len(items)
+            self.stats['batches'] += 1
+
+        positions = [item['spool_position'] for item in items + (discarded or [])
+                     if item.get('spool_position') is not None]
+        if positions:
+            webhook_spool.commit(positions)
+
+    @staticmethod
+    def _row(item: dict) -> dict:
+        return {
+            'bot_id': item['bot_id'],
+            'external_id': item['external_id'],
+            'contact_number': item['contact_number'],
+            'content': item['content'],
+            'message_type': item['message_type'],
+            'direction': 'incoming',
+            'status': 'sent',
+            'timestamp': item['received_at']
+        }
+
+    def _dispatch(self, batch: List[dict]):
+        for item in batch:
+            try:
+                flow_runner.handle_message(
+                    item['bot_id'], item['contact_number'], item['content'], item['message_type']
+                )
+            except Exception as e:
+                db.session.rollback()
+                print(f"Erro ao executar fluxo do bot {item['bot_id']}: {e}")
+
+# Instância global do pipeline de ingestão
+ingestion_pipeline = IngestionPipeline()
@@ -0,0 +1,389 @@
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+from sqlalchemy import and_, func, or_
+
+from src.models import db
+from src.models.scheduled_message import ScheduledMessage
+from src.models.campaign import Campaign
+from src.campaign_engine import campaign_engine
+from src.outbound_queue import outbound_queue
+from src.whatsapp_manager import whatsapp_manager
+
+# Agendamentos com send_at até este tanto no passado são aceitos e saem na hora
+PAST_TOLERANCE = timedelta(minutes=1)
+
+
+def parse_send_at(value: Union[str, int, float]) -> datetime:
+    """send_at em ISO 8601 (sem fuso vale UTC) ou timestamp Unix -> datetime UTC sem fuso"""
+    if isinstance(value, bool) or value in (None, ''):
+        raise ValueError('send_at é obrigatório')
+    try:
+        if isinstance(value, (int, float)):
+            moment = datetime.fromtimestamp(value, timezone.utc)
+        else:
+            moment = datetime.fromisoformat(str(value).strip())
+    except (ValueError, OverflowError, OSError):
+        raise ValueError('send_at deve estar no formato ISO 8601, ex.: 2025-01-31T14:30:00-03:00')
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    if moment < datetime.utcnow() - PAST_TOLERANCE:
+        raise ValueError('send_at está no passado')
+    return moment
+
+
+def _epoch(moment: datetime) -> float:
+    return moment.replace(tzinfo=timezone.utc).timestamp()
+
+
+class TimerWheel:
+    """Roda de tempo hierárquica: incluir e vencer um timer custam O(1)
+
+    São `levels` rodas de `slots` posições; a roda N conta voltas da roda N-1.
+    Cada timer fica na roda mais baixa que alcança o vencimento, e quando uma
+    roda completa a volta a próxima posição da roda de cima desce para as de
+    baixo. Timers além do alcance esperam a volta completa da roda mais alta.
+    Nunca vence antes da hora, e no máximo um tick depois.
+    """
+
+    def __init__(self, tick: float, slots: int = 64, levels: int = 3, now: Optional[float] = None):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.current = math.ceil((time.time() if now is None else now) / tick)  # Próximo tick a processar
+        self.size = 0
+        self._wheels: List[List[List[Tuple[int, int]]]] = [[[] for _ in range(slots)] for _ in range(levels)]
+        self._overflow: List[Tuple[int, int]] = []
+
+    def add(self, key: int, when: float):
+        self._place(key, max(math.ceil(when / self.tick), self.current))
+        self.size += 1
+
+    def next_tick_at(self) -> float:
+        """Momento em que o próximo tick pode ser processado"""
+        return self.current * self.tick
+
+    def advance(self, now: float) -> List[int]:
+        """Processa os ticks até `now` e retorna as chaves vencidas"""
+        expired = []
+        target = math.floor(now / self.tick)
+        while self.current <= target:
+            if self.current % self.slots == 0:
+                self._cascade()
+            index = self.current % self.slots
+            slot = self._wheels[0][index]
+            if slot:
+                self._wheels[0][index] = []
+                expired.extend(key for _, key in slot)
+            self.current += 1
+        self.size -= len(expired)
+        return expired
+
+    def _place(self, key: int, deadline: int):
+        for level in range(self.levels):
+            # Mesma volta da roda de cima: o timer cabe nesta roda
+            if deadline // self.slots ** (level + 1) == self.current // self.slots ** (level + 1):
+                self._wheels[level][(deadline // self.slots ** level) % self.slots].append((deadline, key))
+                return
+        self._overflow.append((deadline, key))
+
+    def _cascade(self):
+        # De cima para baixo: o que desce de uma roda pode descer de novo no mesmo tick
+        for level in range(self.levels, 0, -1):
+            if self.current % self.slots ** level:
+                continue
+            if level == self.levels:
+                timers, self._overflow = self._overflow, []
+            else:
+                index = (self.current // self.slots ** level) % self.slots
+                timers, self._wheels[level][index] = self._wheels[level][index], []
+            for deadline, key in timers:
+                self._place(key, deadline)
+
+
+class MessageScheduler:
+    """Envios agendados de mensagens e de campanhas
+
+    Os agendamentos ficam na tabela scheduled_messages. O worker supervisor
+    mantém em memória, numa roda de tempo, só os que vencem na próxima janela
+    (SCHEDULER_WINDOW_SECONDS), lidos pelo índice (status, send_at), e
+    acorda a cada tick apenas enquanto houver timers: milhões de envios
+    futuros não custam varredura nenhuma. Na hora, as mensagens vão para a fila
+    de envio e as campanhas são iniciadas. Como o estado está no banco, um
+    reinício só recarrega a janela, e os vencidos durante a parada saem logo.
+    """
+
+    def __init__(self):
+        self.tick = float(os.getenv('SCHEDULER_TICK_SECONDS', 1))
+        self.window = float(os.getenv('SCHEDULER_WINDOW_SECONDS', 3600))
+        self.poll_seconds = float(os.getenv('SCHEDULER_POLL_SECONDS', 1))
+        self.load_batch = int(os.getenv('SCHEDULER_LOAD_BATCH', 5000))
+        self.max_loaded = int(os.getenv('SCHEDULER_MAX_LOADED', 200000))
+        self.dispatch_batch = int(os.getenv('SCHEDULER_DISPATCH_BATCH', 500))
+        self.retry_seconds = float(os.getenv('SCHEDULER_RETRY_SECONDS', 5))
+
+        self.app = None
+        self.stats: Dict[str, int] = {
+            'loaded': 0,
+            'dispatched': 0,
+            'failed': 0
+        }
+        self._late_total = 0.0
+        self._late_max = 0.0
+        self.wheel: Optional[TimerWheel] = None  # Criada quando o worker vira supervisor
+        self._loaded: Set[int] = set()  # ids na roda
+        self._horizon: Optional[datetime] = None  # Agendados antes disto já estão na roda
+        self._cursor: Optional[Tuple[datetime, int]] = None  # (send_at, id) do último carregado
+        self._last_id = 0  # Maior id visto, para achar agendamentos novos de qualquer worker
+        self._added: List[Tuple[int, datetime]] = []  # Agendados neste worker, a incluir na roda
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._next_poll = 0.0
+
+    def init_app(self, app):
+        self.app = app
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def add(self, bot_id: int, contact_number: str, content: str, send_at: datetime,
+            media_url: Optional[str] = None) -> ScheduledMessage:
+        """Cria o agendamento na sessão atual; chame track() depois do commit"""
+        scheduled = ScheduledMessage(
+            bot_id=bot_id,
+            kind='message',
+            contact_number=contact_number,
+            content=content,
+            media_url=media_url,
+            send_at=send_at
+        )
+        db.session.add(scheduled)
+        return scheduled
+
+    def add_campaign(self, campaign: Campaign, send_at: datetime) -> ScheduledMessage:
+        """Agenda o início de uma campanha em rascunho; chame track() depois do commit"""
+        scheduled = ScheduledMessage(
+            bot_id=campaign.bot_id,
+            kind='campaign',
+            campaign_id=campaign.id,
+            send_at=send_at
+        )
+        db.session.add(scheduled)
+        return scheduled
+
+    def track(self, scheduled: List[ScheduledMessage]):
+        """Leva os agendamentos já gravados à roda (nos outros workers o supervisor os acha no banco)"""
+        if not whatsapp_manager.supervisor:
+            return
+        with self._condition:
+            self._added.extend((item.id, item.send_at) for item in scheduled)
+            self._condition.notify()
+
+    def cancel(self, scheduled: ScheduledMessage) -> bool:
+        """Cancela se ainda não saiu; o timer que sobra na roda é ignorado ao vencer"""
+        changed = ScheduledMessage.query.filter_by(id=scheduled.id, status='scheduled').update(
+            {'status': 'cancelled', 'updated_at': datetime.utcnow()}, synchronize_session=False
+        )
+        db.session.commit()
+        db.session.refresh(scheduled)
+        return bool(changed)
+
+    def metrics(self) -> dict:
+        with self._condition:
+            stats = dict(self.stats)
+        dispatched = stats['dispatched'] + stats['failed']
+        stats.update({
+            'timers': self.wheel.size if self.wheel else 0,
+            'loaded_until': self._horizon.isoformat() if self._horizon else None,
+            'late_ms_avg': round(self._late_total / dispatched * 1000, 2) if dispatched else None,
+            'late_ms_max': round(self._late_max * 1000, 2),
+            'tick_seconds': self.tick,
+            'window_seconds': self.window,
+            'scheduling': whatsapp_manager.supervisor
+        })
+        return stats
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._added:
+                    self._condition.wait(self._timeout())
+                added, self._added = self._added, []
+            try:
+                if not whatsapp_manager.supervisor:
+                    # Sem roda: só verifica de novo no próximo poll se virou supervisor
+                    self._next_poll = time.monotonic() + self.poll_seconds
+                    continue
+                if self.wheel is None:
+                    self._start()
+                for scheduled_id, send_at in added:
+                    # Os de depois do horizonte chegam pelo carregamento da janela
+                    if self._horizon is not None and send_at < self._horizon:
+                        self._track(scheduled_id, send_at)
+                if time.monotonic() >= self._next_poll:
+                    self._next_poll = time.monotonic() + self.poll_seconds
+                    self._poll_new()
+                if self._window_due():
+                    self._load_window()
+                due = self.wheel.advance(time.time())
+                if due:
+                    self._fire(due)
+            except Exception as e:
+                print(f"Erro no agendador de mensagens: {e}")
+                time.sleep(1)
+
+    def _timeout(self) -> float:
+        # Chamado com o lock
+        timeout = self._next_poll - time.monotonic()
+        if self.wheel is not None:
+            if self.wheel.size:
+                timeout = min(timeout, self.wheel.next_tick_at() - time.time())
+            if self._window_due():
+                timeout = 0
+        return max(timeout, 0.0)
+
+    def _window_due(self) -> bool:
+        if self._horizon is None:
+            return True
+        if len(self._loaded) >= self.max_loaded:
+            return False
+        # Recarrega com meia janela de antecedência
+        return self._horizon - datetime.utcnow() < timedelta(seconds=self.window / 2)
+
+    def _start(self):
+        """Estado inicial ao virar supervisor (na inicialização ou quando o anterior sai)"""
+        with self.app.app_context():
+            self._last_id = db.session.query(func.max(ScheduledMessage.id)).scalar() or 0
+        self.wheel = TimerWheel(self.tick)
+        self._loaded = set()
+        self._horizon = None
+        self._cursor = None
+
+    def _track(self, scheduled_id: int, send_at: datetime):
+        if scheduled_id in self._loaded:
+            return
+        self._loaded.add(scheduled_id)
+        self.wheel.add(scheduled_id, _epoch(send_at))
+
+    def _load_window(self):
+        """Próximo lote da janela, em ordem de (send_at, id) a partir do último carregado"""
+        target = datetime.utcnow() + timedelta(seconds=self.window)
+        limit = min(self.load_batch, self.max_loaded - len(self._loaded))
+        with self.app.app_context():
+            query = db.session.query(ScheduledMessage.id, ScheduledMessage.send_at).filter(
+                ScheduledMessage.status == 'scheduled', ScheduledMessage.send_at < target
+            )
+            if self._cursor is not None:
+                cursor_at, cursor_id = self._cursor
+                query = query.filter(or_(
+                    ScheduledMessage.send_at > cursor_at,
+                    and_(ScheduledMessage.send_at == cursor_at, ScheduledMessage.id > cursor_id)
+                ))
+            rows = query.order_by(ScheduledMessage.send_at, ScheduledMessage.id).limit(limit).all()
+
+        for scheduled_id, send_at in rows:
+            self._track(scheduled_id, send_at)
+        self.stats['loaded'] += len(rows)
+        if rows:
+            self._cursor = (rows[-1].send_at, rows[-1].id)
+        # Lote cheio: a janela só está garantida até o último carregado
+        self._horizon = target if len(rows) < limit else rows[-1].send_at
+
+    def _poll_new(self):
+        """Agendamentos gravados por outros workers dentro da janela já carregada (busca pela chave primária)"""
+        with self.app.app_context():
+            rows = db.session.query(
+                ScheduledMessage.id, ScheduledMessage.send_at, ScheduledMessage.status
+            ).filter(ScheduledMessage.id > self._last_id).order_by(ScheduledMessage.id).limit(self.load_batch).all()
+        for scheduled_id, send_at, status in rows:
+            if status == 'scheduled' and self._horizon is not None and send_at < self._horizon:
+                self._track(scheduled_id, send_at)
+        if rows:
+            self._last_id = rows[-1].id
+
+    def _fire(self, due: List[int]):
+        self._loaded.difference_update(due)
+        for start in range(0, len(due), self.dispatch_batch):
+            batch = due[start:start + self.dispatch_batch]
+            try:
+                self._dispatch_messages(batch)
+            except Exception as e:
+                # Continuam 'scheduled' no banco: voltam para a roda (os já disparados são ignorados ao vencer)
+                print(f"Erro ao disparar {len(batch)} agendamentos, nova tentativa em {self.retry_seconds}s: {e}")
+                retry_at = time.time() + self.retry_seconds
+                for scheduled_id in batch:
+                    self._loaded.add(scheduled_id)
+                    self.wheel.add(scheduled_id, retry_at)
+
+    def _dispatch_messages(self, ids: List[int]):
+        """Enfileira as mensagens vencidas em uma transação e inicia as campanhas"""
+        campaigns = []
+        with self.app.app_context():
+            rows = ScheduledMessage.query.filter(
+                ScheduledMessage.id.in_(ids), ScheduledMessage.status == 'scheduled'
+            ).order_by(ScheduledMessage.send_at, ScheduledMessage.id).all()
+            now = datetime.utcnow()
+            pairs = []
+            for row in rows:
+                if row.kind == 'campaign':
+                    campaigns.append(row.id)
+                    continue
+                # Condicional: o agendamento pode ter sido cancelado depois da leitura
+                changed = ScheduledMessage.query.filter_by(id=row.id, status='scheduled').update(
+                    {'status': 'dispatched', 'updated_at': now}, synchronize_session=False
+                )
+                if changed:
+                    pairs.append((row, outbound_queue.add(row.bot_id, row.contact_number, row.content,
+                                                          media_url=row.media_url)))
+            if pairs:
+                db.session.flush()
+                for row, message in pairs:
+                    row.message_id = message.id
+                db.session.commit()
+                outbound_queue.dispatch([message for _, message in pairs])
+                self._observe('dispatched', [row.send_at for row, _ in pairs])
+            else:
+                db.session.rollback()
+
+        for scheduled_id in campaigns:
+            self._start_campaign(scheduled_id)
+
+    def _start_campaign(self, scheduled_id: int):
+        with self.app.app_context():
+            row = db.session.get(ScheduledMessage, scheduled_id)
+            if row is None or row.status != 'scheduled':
+                return
+            changed = ScheduledMessage.query.filter_by(id=scheduled_id, status='scheduled').update(
+                {'status': 'dispatched', 'updated_at': datetime.utcnow()}, synchronize_session=False
+            )
+            if not changed:
+                db.session.rollback()
+                return
+            try:
+                # Grava o agendamento junto com a transição da campanha
+                campaign_engine.transition(row.campaign, 'start')
+                self._observe('dispatched', [row.send_at])
+            except ValueError as e:
+                db.session.rollback()
+                ScheduledMessage.query.filter_by(id=scheduled_id, status='scheduled').update(
+                    {'status': 'failed', 'error': str(e)[:255], 'updated_at': datetime.utcnow()},
+                    synchronize_session=False
+                )
+                db.session.commit()
+                self._observe('failed', [row.send_at])
+                print(f"Agendamento {scheduled_id}: campanha {row.campaign_id} não iniciada: {e}")
+
+    def _observe(self, key: str, due: List[datetime]):
+        now = time.time()
+        with self._condition:
+            self.stats[key] += len(due)
+            for send_at in due:
+                late = max(now - _epoch(send_at), 0.0)
+                self._late_total += late
+                self._late_max = max(self._late_max, late)
+
+# Instância global do agendador de mensagens
+message_scheduler = MessageScheduler()
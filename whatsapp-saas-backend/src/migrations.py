@@ -0,0 +1,108 @@
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import inspect, text
+
+from src.models import db
+
+# Migrações de schema aplicadas após o db.create_all().
+# db.create_all() cria tabelas novas, mas não altera tabelas existentes;
+# cada migração deve ser idempotente, pois bancos novos já nascem com o schema atual.
+Migration = Tuple[int, str, Callable]
+
+
+def _column_exists(connection, table: str, column: str) -> bool:
+    return any(col['name'] == column for col in inspect(connection).get_columns(table))
+
+
+def _create_index(connection, table: str, name: str, columns: str, unique: bool = False):
+    # CREATE INDEX IF NOT EXISTS não existe no MySQL: checa pelo inspector
+    if any(index['name'] == name for index in inspect(connection).get_indexes(table)):
+        return
+    connection.execute(text(f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON {table} ({columns})"))
+
+
+def _add_message_external_id(connection):
+    if not _column_exists(connection, 'messages', 'external_id'):
+        connection.execute(text('ALTER TABLE messages ADD COLUMN external_id VARCHAR(128)'))
+    _create_index(connection, 'messages', 'ix_messages_external_id', 'external_id', unique=True)
+
+
+def _add_message_history_indexes(connection):
+    _create_index(connection, 'messages', 'ix_messages_bot_timestamp', 'bot_id, timestamp, id')
+    _create_index(connection, 'messages', 'ix_messages_bot_contact_timestamp',
+                  'bot_id, contact_number, timestamp, id')
+
+
+def _backfill_conversations(connection):
+    # Tabela criada pelo db.create_all(); preenchida a partir do histórico existente
+    if connection.execute(text('SELECT 1 FROM conversations LIMIT 1')).first():
+        return
+    connection.execute(text(
+        'INSERT INTO conversations (bot_id, contact_number, last_message_at, unread_count, message_count, created_at) '
+        'SELECT bot_id, contact_number, MAX(timestamp), 0, COUNT(*), MIN(timestamp) '
+        'FROM messages GROUP BY bot_id, contact_number'
+    ))
+    for column, source in (('last_message_preview', 'SUBSTR(content, 1, 120)'),
+                           ('last_message_type', 'message_type'),
+                           ('last_direction', 'direction'),
+                           ('contact_name', 'contact_name')):
+        connection.execute(text(
+            f'UPDATE conversations SET {column} = ('
+            f'SELECT {source} FROM messages m '
+            'WHERE m.bot_id = conversations.bot_id AND m.contact_number = conversations.contact_number '
+            'ORDER BY m.timestamp DESC, m.id DESC LIMIT 1)'
+        ))
+
+
+def _add_bot_instance_socket_path(connection):
+    if not _column_exists(connection, 'bot_instances', 'socket_path'):
+        connection.execute(text('ALTER TABLE bot_instances ADD COLUMN socket_path VARCHAR(255)'))
+
+
+def _add_message_status_index(connection):
+    _create_index(connection, 'messages', 'ix_messages_status', 'status, id')
+
+
+def _widen_contact_number(connection):
+    # JIDs de grupo (ex.: 120363012345678901@g.us) não cabem em VARCHAR(20);
+    # o SQLite não impõe o tamanho do VARCHAR, então só os bancos servidor precisam do ALTER
+    dialect = connection.dialect.name
+    for table, nullable in (('messages', False), ('scheduled_messages', True)):
+        if dialect == 'postgresql':
+            connection.execute(text(f'ALTER TABLE {table} ALTER COLUMN contact_number TYPE VARCHAR(64)'))
+        elif dialect in ('mysql', 'mariadb'):
+            null = 'NULL' if nullable else 'NOT NULL'
+            connection.execute(text(f'ALTER TABLE {table} MODIFY contact_number VARCHAR(64) {null}'))
+
+
+MIGRATIONS: List[Migration] = [
+    (1, 'messages.external_id com índice único', _add_message_external_id),
+    (2, 'índices do histórico de mensagens', _add_message_history_indexes),
+    (3, 'resumo de conversas por contato', _backfill_conversations),
+    (4, 'bot_instances.socket_path', _add_bot_instance_socket_path),
+    (5, 'índice de messages.status para a fila de envio', _add_message_status_index),
+    (6, 'contact_number com 64 caracteres para JIDs de grupo', _widen_contact_number),
+]
+
+
+def run_migrations():
+    """Aplica as migrações pendentes (deve ser chamado dentro do app context)"""
+    with db.engine.begin() as connection:
+        connection.execute(text(
+            'CREATE TABLE IF NOT EXISTS schema_migrations ('
+            'version INTEGER PRIMARY KEY, description VARCHAR(255), applied_at TIMESTAMP)'
+        ))
+        applied = {row[0] for row in connection.execute(text('SELECT version FROM schema_migrations'))}
+
+    for version, description, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        with db.engine.begin() as connection:
+            migrate(connection)
+            connection.execute(
+                text('INSERT INTO schema_migrations (version, description, applied_at) '
+                     'VALUES (:version, :description, :applied_at)'),
+                {'version': version, 'description': description, 'applied_at': datetime.utcnow()}
+            )
+        print(f"Migração {version} aplicada: {description}")
@@ -4,4 +4,7 @@ db = SQLAlchemy()
 
 # Importar os modelos depois da criação do db para evitar importação circular
 from .user import User
-from .bot import Bot, Flow, FlowNode, NodeConnection, Message
+from .bot import (Bot, Flow, FlowNode, NodeConnection, Message, Conversation, BotInstance,
+                  LifecycleJob, BulkOperation, BulkOperationEvent, StatusEvent)
+from .campaign import Campaign, CampaignRecipient
+from .scheduled_message import ScheduledMessage
@@ -21,6 +21,8 @@ class Bot(db.Model):
     user = db.relationship('User', back_populates='bots')
     flows = db.relationship('Flow', backref='bot', lazy=True, cascade='all, delete-orphan')
     messages = db.relationship('Message', backref='bot', lazy=True, cascade='all, delete-orphan')
+    conversations = db.relationship('Conversation', backref='bot', lazy=True, cascade='all, delete-orphan')
+    instance = db.relationship('BotInstance', backref='bot', uselist=False, lazy=True, cascade='all, delete-orphan')
     
     def to_dict(self):
         return {
@@ -123,22 +125,31 @@ class NodeConnection(db.Model):
 
 class Message(db.Model):
     __tablename__ = 'messages'
+    __table_args__ = (
+        # Histórico por bot e por contato, sempre ordenado por timestamp
+        db.Index('ix_messages_bot_timestamp', 'bot_id', 'timestamp', 'id'),
+        db.Index('ix_messages_bot_contact_timestamp', 'bot_id', 'contact_number', 'timestamp', 'id'),
+        # Mensagens aguardando a fila de envio
+        db.Index('ix_messages_status', 'status', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     bot_id = db.Column(db.Integer, db.ForeignKey('bots.id'), nullable=False)
-    contact_number = db.Column(db.String(20), nullable=False)
+    external_id = db.Column(db.String(128), unique=True, index=True)  # id da mensagem no WhatsApp
+    contact_number = db.Column(db.String(64), nullable=False)
     contact_name = db.Column(db.String(100))
     message_type = db.Column(db.String(20), nullable=False)  # text, image, audio, video, document
     content = db.Column(db.Text)
     media_url = db.Column(db.String(255))
     direction = db.Column(db.String(10), nullable=False)  # incoming, outgoing
-    status = db.Column(db.String(20), default='sent')  # sent, delivered, read, failed
+    status = db.Column(db.String(20), default='sent')  # queued, sent, delivered, read, failed
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     
     def to_dict(self):
         return {
             'id': self.id,
             'bot_id': self.bot_id,
+            'external_id': self.external_id,
             'contact_number': self.contact_number,
             'contact_name': self.contact_name,
             'message_type': self.message_type,
@@ -149,3 +160,153 @@ class Message(db.Model):
             'timestamp': self.timestamp.isoformat() if self.timestamp else None
         }
 
+
+class Conversation(db.Model):
+    __tablename__ = 'conversations'
+    __table_args__ = (
+        # Resumo mantido a cada mensagem gravada: uma linha por contato do bot
+        db.UniqueConstraint('bot_id', 'contact_number', name='uq_conversations_bot_contact'),
+        db.Index('ix_conversations_bot_last_message', 'bot_id', 'last_message_at', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    bot_id = db.Column(db.Integer, db.ForeignKey('bots.id'), nullable=False)
+    contact_number = db.Column(db.String(64), nullable=False)
+    contact_name = db.Column(db.String(100))
+    last_message_at = db.Column(db.DateTime, nullable=False)
+    last_message_preview = db.Column(db.String(255))
+    last_message_type = db.Column(db.String(20))
+    last_direction = db.Column(db.String(10))  # incoming, outgoing
+    unread_count = db.Column(db.Integer, nullable=False, default=0)
+    message_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'bot_id': self.bot_id,
+            'contact_number': self.contact_number,
+            'contact_name': self.contact_name,
+            'last_message_at': self.last_message_at.isoformat() if self.last_message_at else None,
+            'last_message_preview': self.last_message_preview,
+            'last_message_type': self.last_message_type,
+            'last_direction': self.last_direction,
+            'unread_count': self.unread_count,
+            'message_count': self.message_count,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+class BotInstance(db.Model):
+    __tablename__ = 'bot_instances'
+    
+    # Registro dos processos compartilhado entre os workers; o supervisor é o único dono dos processos
+    bot_id = db.Column(db.Integer, db.ForeignKey('bots.id'), primary_key=True)
+    owner = db.Column(db.String(120))  # host:pid do worker supervisor
+    pid = db.Column(db.Integer)
+    port = db.Column(db.Integer)  # Porta TCP emprestada (transporte tcp)
+    socket_path = db.Column(db.String(255))  # Socket Unix (transporte unix)
+    status = db.Column(db.String(20), nullable=False, default='stopped')  # status do bot Node
+    qr_code = db.Column(db.Text)
+    supervision = db.Column(db.Text)  # JSON de WhatsAppManager.supervision_status()
+    desired_state = db.Column(db.String(10), nullable=False, default='stopped')  # running, stopped
+    generation = db.Column(db.Integer, nullable=False, default=0)  # pedidos vindos de outros workers
+    applied_generation = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)  # Erro do último pedido aplicado
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    lease_expires_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def to_dict(self):
+        return {
+            'bot_id': self.bot_id,
+            'owner': self.owner,
+            'pid': self.pid,
+            'port': self.port,
+            'socket_path': self.socket_path,
+            'status': self.status,
+            'qr_code': self.qr_code,
+            'supervision': json.loads(self.supervision) if self.supervision else None,
+            'desired_state': self.desired_state,
+            'generation': self.generation,
+            'applied_generation': self.applied_generation,
+            'error': self.error,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'heartbeat_at': self.heartbeat_at.isoformat() if self.heartbeat_at else None,
+            'lease_expires_at': self.lease_expires_at.isoformat() if self.lease_expires_at else None
+        }
+
+class LifecycleJob(db.Model):
+    __tablename__ = 'lifecycle_jobs'
+    
+    # Jobs de início/parada (LifecycleJobs), consultáveis de qualquer worker
+    id = db.Column(db.String(32), primary_key=True)
+    action = db.Column(db.String(10), nullable=False)  # start, stop, restart
+    bot_id = db.Column(db.Integer, nullable=False, index=True)  # Sem FK: o job continua consultável após excluir o bot
+    user_id = db.Column(db.Integer, nullable=False)
+    state = db.Column(db.String(20), nullable=False, default='running')  # running, succeeded, failed
+    step = db.Column(db.String(20), nullable=False, default='queued')
+    error = db.Column(db.Text)
+    bot_status = db.Column(db.String(20))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, index=True)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'action': self.action,
+            'bot_id': self.bot_id,
+            'user_id': self.user_id,
+            'state': self.state,
+            'step': self.step,
+            'error': self.error,
+            'bot_status': self.bot_status,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class BulkOperation(db.Model):
+    __tablename__ = 'bulk_operations'
+    
+    # Operações em lote (BulkLifecycle); os eventos ficam em bulk_operation_events
+    id = db.Column(db.String(32), primary_key=True)
+    action = db.Column(db.String(10), nullable=False)
+    user_id = db.Column(db.Integer)  # None: religamento na inicialização
+    total = db.Column(db.Integer, nullable=False, default=0)
+    concurrency = db.Column(db.Integer, nullable=False)
+    ramp_seconds = db.Column(db.Float, nullable=False)
+    state = db.Column(db.String(20), nullable=False, default='running')  # running, finished
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, index=True)
+    
+    def to_dict(self, events=None):
+        return {
+            'id': self.id,
+            'action': self.action,
+            'user_id': self.user_id,
+            'total': self.total,
+            'concurrency': self.concurrency,
+            'ramp_seconds': self.ramp_seconds,
+            'state': self.state,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'events': events if events is not None else []
+        }
+
+class BulkOperationEvent(db.Model):
+    __tablename__ = 'bulk_operation_events'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    operation_id = db.Column(db.String(32), db.ForeignKey('bulk_operations.id', ondelete='CASCADE'),
+                             nullable=False, index=True)
+    data = db.Column(db.Text, nullable=False)  # JSON do evento, como no stream NDJSON
+
+class StatusEvent(db.Model):
+    __tablename__ = 'status_events'
+    
+    # Eventos do SSE de sessões repassados entre os workers (StatusBroker); apagados após a retenção
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    origin = db.Column(db.String(120), nullable=False)  # host:pid do worker que publicou
+    data = db.Column(db.Text, nullable=False)  # JSON do evento
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
@@ -0,0 +1,85 @@
+from datetime import datetime
+import json
+from sqlalchemy import event
+from . import db
+
+class Campaign(db.Model):
+    __tablename__ = 'campaigns'
+    __table_args__ = (
+        db.Index('ix_campaigns_status', 'status'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    bot_id = db.Column(db.Integer, db.ForeignKey('bots.id'), nullable=False, index=True)
+    name = db.Column(db.String(100), nullable=False)
+    template = db.Column(db.Text, nullable=False)  # "Olá {{nome}}": colunas do CSV como variáveis
+    media_url = db.Column(db.String(255))
+    rate_per_minute = db.Column(db.Float)  # None: CAMPAIGN_RATE_PER_MINUTE
+    status = db.Column(db.String(20), nullable=False, default='draft')  # draft, running, paused, completed, cancelled
+    total = db.Column(db.Integer, nullable=False, default=0)
+    sent_count = db.Column(db.Integer, nullable=False, default=0)
+    failed_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Relacionamentos
+    bot = db.relationship('Bot', backref=db.backref('campaigns', lazy=True, cascade='all, delete-orphan'))
+    # passive_deletes: excluir a campanha não carrega os destinatários (podem ser milhões); ver _delete_recipients
+    recipients = db.relationship('CampaignRecipient', backref='campaign', lazy=True,
+                                 cascade='all, delete-orphan', passive_deletes=True)
+
+    def to_dict(self):
+        done = self.sent_count + self.failed_count
+        return {
+            'id': self.id,
+            'bot_id': self.bot_id,
+            'name': self.name,
+            'template': self.template,
+            'media_url': self.media_url,
+            'rate_per_minute': self.rate_per_minute,
+            'status': self.status,
+            'total': self.total,
+            'sent_count': self.sent_count,
+            'failed_count': self.failed_count,
+            'progress': round(done / self.total * 100, 2) if self.total else 0.0,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class CampaignRecipient(db.Model):
+    __tablename__ = 'campaign_recipients'
+    __table_args__ = (
+        # Um envio por número em cada campanha; a fila lê os pendentes em ordem de id
+        db.UniqueConstraint('campaign_id', 'contact_number', name='uq_campaign_recipients_contact'),
+        db.Index('ix_campaign_recipients_status', 'campaign_id', 'status', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    campaign_id = db.Column(db.Integer, db.ForeignKey('campaigns.id', ondelete='CASCADE'), nullable=False)
+    contact_number = db.Column(db.String(20), nullable=False)
+    variables = db.Column(db.Text)  # JSON com as demais colunas do CSV
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, queued, sent, failed, cancelled
+    message_id = db.Column(db.Integer)  # Message gerada (sem FK: o histórico antigo vai para o arquivo mensal)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'campaign_id': self.campaign_id,
+            'contact_number': self.contact_number,
+            'variables': json.loads(self.variables) if self.variables else {},
+            'status': self.status,
+            'message_id': self.message_id,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
+@event.listens_for(Campaign, 'before_delete')
+def _delete_recipients(mapper, connection, campaign):
+    # Em um DELETE só, também quando a campanha sai junto com o bot; o ON DELETE CASCADE
+    # não vale no SQLite (foreign_keys desligado) nem nas tabelas criadas antes dele
+    connection.execute(CampaignRecipient.__table__.delete().where(CampaignRecipient.campaign_id == campaign.id))
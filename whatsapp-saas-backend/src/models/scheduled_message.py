@@ -0,0 +1,44 @@
+from datetime import datetime
+from . import db
+
+class ScheduledMessage(db.Model):
+    __tablename__ = 'scheduled_messages'
+    __table_args__ = (
+        # O agendador carrega só a próxima janela: agendados em ordem de send_at
+        db.Index('ix_scheduled_messages_due', 'status', 'send_at', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    bot_id = db.Column(db.Integer, db.ForeignKey('bots.id'), nullable=False, index=True)
+    kind = db.Column(db.String(20), nullable=False, default='message')  # message, campaign
+    contact_number = db.Column(db.String(64))
+    content = db.Column(db.Text)
+    media_url = db.Column(db.String(255))
+    campaign_id = db.Column(db.Integer, db.ForeignKey('campaigns.id'), index=True)
+    send_at = db.Column(db.DateTime, nullable=False)  # UTC
+    status = db.Column(db.String(20), nullable=False, default='scheduled')  # scheduled, dispatched, cancelled, failed
+    message_id = db.Column(db.Integer)  # Message criada na fila de envio
+    error = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Relacionamentos
+    bot = db.relationship('Bot', backref=db.backref('scheduled_messages', lazy=True, cascade='all, delete-orphan'))
+    campaign = db.relationship('Campaign', backref=db.backref('schedules', lazy=True, cascade='all, delete-orphan'))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'bot_id': self.bot_id,
+            'kind': self.kind,
+            'contact_number': self.contact_number,
+            'content': self.content,
+            'media_url': self.media_url,
+            'campaign_id': self.campaign_id,
+            'send_at': self.send_at.isoformat() if self.send_at else None,
+            'status': self.status,
+            'message_id': self.message_id,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
@@ -0,0 +1,318 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from src.models import db
+from src.models.bot import Message
+from src.conversation_summary import record_messages
+from src.whatsapp_manager import whatsapp_manager
+
+# Quantos ids de mensagens já concluídas são lembrados para não enviá-las de novo
+FINISHED_IDS = 10000
+
+
+class TokenBucket:
+    """Até `capacity` envios seguidos, depois `rate` envios por segundo"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self, now: float) -> float:
+        """Consome uma ficha e retorna 0, ou os segundos até haver uma"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class OutboundQueue:
+    """Fila de envio de mensagens com limite de taxa por bot
+
+    As rotas e os fluxos gravam a mensagem como 'queued' e respondem na hora;
+    o worker supervisor envia pelos bots com um pool de threads, no máximo um
+    envio por bot de cada vez (a ordem da conversa é mantida) e dentro do balde
+    de fichas do bot, para não cair no bloqueio do WhatsApp. A thread de
+    despacho é a única que toca o banco: grava os status 'sent'/'failed' em
+    lote e busca as mensagens enfileiradas por outros workers.
+    """
+
+    def __init__(self):
+        self.workers = int(os.getenv('OUTBOUND_WORKERS', 8))
+        self.rate = float(os.getenv('OUTBOUND_RATE_PER_MINUTE', 30)) / 60.0
+        self.burst = float(os.getenv('OUTBOUND_BURST', 5))
+        self.max_attempts = int(os.getenv('OUTBOUND_MAX_ATTEMPTS', 3))
+        self.retry_seconds = float(os.getenv('OUTBOUND_RETRY_SECONDS', 10))
+        self.poll_seconds = float(os.getenv('OUTBOUND_POLL_SECONDS', 1))
+        self.poll_batch = int(os.getenv('OUTBOUND_POLL_BATCH', 500))
+        # A busca segue por id; de tempos em tempos recomeça do início para pegar
+        # mensagens com id menor gravadas depois (transações concorrentes)
+        self.rescan_seconds = float(os.getenv('OUTBOUND_RESCAN_SECONDS', 60))
+        # Quanto tempo uma mensagem espera o bot voltar (reinício, religamento) antes de falhar
+        self.offline_ttl = float(os.getenv('OUTBOUND_OFFLINE_TTL_SECONDS', 600))
+
+        self.app = None
+        self.stats: Dict[str, int] = {
+            'enqueued': 0,
+            'sent': 0,
+            'failed': 0,
+            'retries': 0
+        }
+        self._queues: Dict[int, Deque[dict]] = {}  # bot_id -> mensagens na ordem de envio
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._ready: List[Tuple[float, int, int]] = []  # (quando, seq, bot_id) dos bots com mensagens
+        self._scheduled: Set[int] = set()  # bots no heap
+        self._busy: Set[int] = set()  # bots com um envio em andamento
+        self._known: Set[int] = set()  # ids em memória, da fila até o status ser gravado
+        self._finished: 'OrderedDict[int, None]' = OrderedDict()  # gravados há pouco, para dispatch() atrasado
+        self._results: List[Tuple[dict, str]] = []  # (mensagem, 'sent' ou 'failed') a gravar
+        self._listeners: List[Callable[[List[Tuple[int, str]]], None]] = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='outbound')
+        self._thread: Optional[threading.Thread] = None
+        self._next_poll = 0.0
+        self._last_polled_id = 0
+        self._next_rescan = 0.0
+
+    def init_app(self, app):
+        self.app = app
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def add(self, bot_id: int, contact_number: str, content: str,
+            media_url: Optional[str] = None, message_type: Optional[str] = None) -> Message:
+        """Cria a mensagem 'queued' na sessão atual; chame dispatch() depois do commit"""
+        message = Message(
+            bot_id=bot_id,
+            contact_number=contact_number,
+            content=content,
+            media_url=media_url,
+            message_type=message_type or ('media' if media_url else 'text'),
+            direction='outgoing',
+            status='queued'
+        )
+        db.session.add(message)
+        record_messages([message])
+        return message
+
+    def dispatch(self, messages: Iterable[Message]):
+        """Entrega à fila as mensagens já gravadas (nos outros workers o supervisor as busca no banco)"""
+        if not whatsapp_manager.supervisor:
+            return
+        items = [self._item(message) for message in messages]
+        with self._condition:
+            for item in items:
+                self._push(item)
+            self._condition.notify()
+
+    def add_listener(self, callback: Callable[[List[Tuple[int, str]]], None]):
+        """callback([(message_id, status)]) na thread de despacho, depois que os status são gravados"""
+        self._listeners.append(callback)
+
+    def metrics(self) -> dict:
+        with self._condition:
+            stats = dict(self.stats)
+            stats.update({
+                'queued': sum(len(queue) for queue in self._queues.values()),
+                'bots_queued': sum(1 for queue in self._queues.values() if queue),
+                'in_flight': len(self._busy),
+                'workers': self.workers,
+                'rate_per_minute': round(self.rate * 60, 2),
+                'burst': self.burst,
+                'dispatching': whatsapp_manager.supervisor
+            })
+        return stats
+
+    def _push(self, item: dict, front: bool = False):
+        # Chamado com o lock
+        if not front:
+            if item['id'] in self._known or item['id'] in self._finished:
+                return
+            self.stats['enqueued'] += 1
+        self._known.add(item['id'])
+        bot_id = item['bot_id']
+        queue = self._queues.setdefault(bot_id, deque())
+        if front:
+            queue.appendleft(item)
+        else:
+            queue.append(item)
+        self._schedule(bot_id, item.get('retry_at', 0.0))
+
+    def _schedule(self, bot_id: int, when: float):
+        if bot_id in self._busy or bot_id in self._scheduled or not self._queues.get(bot_id):
+            return
+        self._scheduled.add(bot_id)
+        heapq.heappush(self._ready, (when, next(self._sequence), bot_id))
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._results and time.monotonic() < self._next_poll and not self._due():
+                    timeout = self._next_poll - time.monotonic()
+                    if self._ready:
+                        timeout = min(timeout, self._ready[0][0] - time.monotonic())
+                    self._condition.wait(max(timeout, 0))
+                results, self._results = self._results, []
+                sends = self._take_ready()
+
+            for item in sends:
+                self._executor.submit(self._send, item)
+            try:
+                if results:
+                    self._write_results(results)
+                if time.monotonic() >= self._next_poll:
+                    self._next_poll = time.monotonic() + self.poll_seconds
+                    if whatsapp_manager.supervisor:
+                        self._poll()
+            except Exception as e:
+                print(f"Erro na fila de envio: {e}")
+
+    def _due(self) -> bool:
+        return bool(self._ready) and self._ready[0][0] <= time.monotonic()
+
+    def _take_ready(self) -> List[dict]:
+        """Tira do heap os bots liberados pelo balde de fichas (chamado com o lock)"""
+        sends = []
+        now = time.monotonic()
+        while self._ready and self._ready[0][0] <= now:
+            _, _, bot_id = heapq.heappop(self._ready)
+            self._scheduled.discard(bot_id)
+            queue = self._queues.get(bot_id)
+            if not queue:
+                self._queues.pop(bot_id, None)
+                continue
+            bucket = self._buckets.get(bot_id)
+            if bucket is None:
+                bucket = self._buckets[bot_id] = TokenBucket(self.rate, self.burst)
+            wait = bucket.take(now)
+            if wait > 0:
+                self._schedule(bot_id, now + wait)
+                continue
+            self._busy.add(bot_id)
+            sends.append(queue.popleft())
+        return sends
+
+    def _send(self, item: dict):
+        """Roda no pool: só HTTP, o status é gravado pela thread de despacho"""
+        bot_id = item['bot_id']
+        offline = not whatsapp_manager.is_running(bot_id)
+        ok = False
+        if not offline:
+            try:
+                if item['media_url']:
+                    ok = whatsapp_manager.send_media(bot_id, item['contact_number'],
+                                                     item['media_url'], item['content'] or '')
+                else:
+                    ok = whatsapp_manager.send_message(bot_id, item['contact_number'], item['content'])
+            except Exception as e:
+                print(f"Erro ao enviar a mensagem {item['id']}: {e}")
+            item['attempts'] += 1
+
+        if ok:
+            status = 'sent'
+        elif offline:
+            # Bot fora do ar não gasta tentativas: a mensagem espera até offline_ttl
+            status = 'failed' if time.monotonic() - item['queued_at'] >= self.offline_ttl else None
+        else:
+            status = 'failed' if item['attempts'] >= self.max_attempts else None
+
+        with self._condition:
+            self._busy.discard(bot_id)
+            if status is None:
+                # Nova tentativa com backoff, antes das mensagens seguintes do mesmo bot
+                self.stats['retries'] += not offline
+                item['retry_at'] = time.monotonic() + self.retry_seconds * 2 ** max(item['attempts'] - 1, 0)
+                self._push(item, front=True)
+            else:
+                self._results.append((item, status))
+                if status == 'failed' and offline:
+                    # Falham também as mensagens do bot que já esperaram offline_ttl; as demais continuam
+                    now = time.monotonic()
+                    queue = self._queues.get(bot_id, deque())
+                    for pending in [p for p in queue if now - p['queued_at'] >= self.offline_ttl]:
+                        queue.remove(pending)
+                        self._results.append((pending, 'failed'))
+                self._schedule(bot_id, time.monotonic())
+            self._condition.notify()
+
+    def _write_results(self, results: List[Tuple[dict, str]]):
+        ids_by_status: Dict[str, List[int]] = {}
+        for item, status in results:
+            ids_by_status.setdefault(status, []).append(item['id'])
+
+        with self.app.app_context():
+            try:
+                for status, ids in ids_by_status.items():
+                    Message.query.filter(Message.id.in_(ids)).update({'status': status}, synchronize_session=False)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Erro ao gravar o status de {len(results)} mensagens enviadas: {e}")
+                with self._condition:
+                    self._results[:0] = results  # Tentado de novo no próximo ciclo
+                time.sleep(1)
+                return
+
+        # Só agora: uma busca anterior ao commit ainda veria as mensagens como 'queued'
+        with self._condition:
+            for status, ids in ids_by_status.items():
+                self.stats[status] += len(ids)
+                self._known.difference_update(ids)
+                for message_id in ids:
+                    self._finished[message_id] = None
+            while len(self._finished) > FINISHED_IDS:
+                self._finished.popitem(last=False)
+
+        outcomes = [(item['id'], status) for item, status in results]
+        for listener in self._listeners:
+            try:
+                listener(outcomes)
+            except Exception as e:
+                print(f"Erro ao notificar o resultado dos envios: {e}")
+
+    def _poll(self):
+        """Mensagens enfileiradas por outros workers ou antes de um reinício
+
+        Lê por keyset (id > último lido): as já em memória não são relidas a cada ciclo.
+        """
+        if time.monotonic() >= self._next_rescan:
+            self._next_rescan = time.monotonic() + self.rescan_seconds
+            self._last_polled_id = 0
+        with self.app.app_context():
+            messages = Message.query.filter(
+                Message.status == 'queued', Message.direction == 'outgoing',
+                Message.id > self._last_polled_id
+            ).order_by(Message.id).limit(self.poll_batch).all()
+            items = [self._item(message) for message in messages]
+        if items:
+            self._last_polled_id = items[-1]['id']
+
+        with self._condition:
+            for item in items:
+                self._push(item)
+            self._condition.notify()
+
+    @staticmethod
+    def _item(message: Message) -> dict:
+        return {
+            'id': message.id,
+            'bot_id': message.bot_id,
+            'contact_number': message.contact_number,
+            'content': message.content,
+            'media_url': message.media_url,
+            'attempts': 0,
+            'queued_at': time.monotonic()
+        }
+
+# Instância global da fila de envio
+outbound_queue = OutboundQueue()
@@ -1,7 +1,15 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from src.models.user import User, db
-from src.models.bot import Bot, Flow, FlowNode, NodeConnection, Message
+from src.models.bot import Bot, Flow, FlowNode, NodeConnection
+from src.flow_dispatcher import flow_dispatcher
+from src.message_ingestion import ingestion_pipeline
+from src.message_archive import message_archive
+from src.message_history import count_messages, decode_cursor, message_page, message_window
+from src.conversation_summary import conversation_window, mark_read
+from src.status_events import status_broker, session_info
+from src.whatsapp_manager import whatsapp_manager
+from src.outbound_queue import outbound_queue
 import json
 
 bots_bp = Blueprint('bots', __name__)
@@ -53,6 +61,7 @@ def create_bot():
         
         db.session.add(bot)
         db.session.commit()
+        status_broker.publish(bot.user_id, session_info(bot, whatsapp_manager.port_for(bot.id)))
         
         return jsonify({
             'message': 'Bot criado com sucesso',
@@ -136,8 +145,15 @@ def delete_bot(bot_id):
         if not bot:
             return jsonify({'error': 'Bot não encontrado'}), 404
         
+        # O processo não pode ficar órfão no registro depois que o bot some
+        whatsapp_manager.stop_instance_async(bot_id)
+        
         db.session.delete(bot)
         db.session.commit()
+        flow_dispatcher.invalidate_bot(bot_id)
+        ingestion_pipeline.forget_bot(bot_id)
+        message_archive.delete_bot(bot_id)
+        status_broker.publish_removed(bot.user_id, bot_id)
         
         return jsonify({'message': 'Bot excluído com sucesso'}), 200
         
@@ -168,6 +184,7 @@ def update_bot_status(bot_id):
             bot.qr_code = data['qr_code']
         
         db.session.commit()
+        status_broker.publish_session(bot.user_id, bot_id, bot.status, bot.qr_code)
         
         return jsonify({
             'message': 'Status do bot atualizado com sucesso',
@@ -229,6 +246,7 @@ def create_flow(bot_id):
         
         db.session.add(flow)
         db.session.commit()
+        flow_dispatcher.upsert_flow(flow)
         
         return jsonify({
             'message': 'Fluxo criado com sucesso',
@@ -249,30 +267,93 @@ def get_bot_messages(bot_id):
         if not bot:
             return jsonify({'error': 'Bot não encontrado'}), 404
         
+        contact_number = request.args.get('contact_number')
+        
+        # Modo cursor (?before=<cursor>&limit=): não usa OFFSET e o total é opcional
+        if 'before' in request.args or 'limit' in request.args:
+            before = None
+            if request.args.get('before'):
+                try:
+                    before = decode_cursor(request.args['before'])
+                except (ValueError, UnicodeDecodeError):
+                    return jsonify({'error': 'Cursor inválido'}), 400
+            
+            limit = request.args.get('limit', 50, type=int)
+            messages, next_cursor = message_window(bot_id, before, limit, contact_number)
+            
+            response = {
+                'messages': [message.to_dict() for message in messages],
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None
+            }
+            if request.args.get('include_total', '').lower() in ('1', 'true'):
+                response['total'] = count_messages(bot_id, contact_number)
+            return jsonify(response), 200
+        
         # Parâmetros de paginação
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 50, type=int)
-        contact_number = request.args.get('contact_number')
         
-        query = Message.query.filter_by(bot_id=bot_id)
+        messages, total, pages = message_page(bot_id, page, per_page, contact_number)
         
-        if contact_number:
-            query = query.filter_by(contact_number=contact_number)
+        return jsonify({
+            'messages': [message.to_dict() for message in messages],
+            'total': total,
+            'pages': pages,
+            'current_page': page
+        }), 200
         
-        messages = query.order_by(Message.timestamp.desc()).paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+    except Exception as e:
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@bots_bp.route('/bots/<int:bot_id>/conversations', methods=['GET'])
+@jwt_required()
+def get_bot_conversations(bot_id):
+    try:
+        user_id = get_jwt_identity()
+        bot = Bot.query.filter_by(id=bot_id, user_id=user_id).first()
+        
+        if not bot:
+            return jsonify({'error': 'Bot não encontrado'}), 404
+        
+        before = None
+        if request.args.get('before'):
+            try:
+                before = decode_cursor(request.args['before'])
+            except (ValueError, UnicodeDecodeError):
+                return jsonify({'error': 'Cursor inválido'}), 400
+        
+        limit = request.args.get('limit', 50, type=int)
+        conversations, next_cursor = conversation_window(bot_id, before, limit)
         
         return jsonify({
-            'messages': [message.to_dict() for message in messages.items],
-            'total': messages.total,
-            'pages': messages.pages,
-            'current_page': page
+            'conversations': [conversation.to_dict() for conversation in conversations],
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
         }), 200
         
     except Exception as e:
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
+@bots_bp.route('/bots/<int:bot_id>/conversations/<contact_number>/read', methods=['POST'])
+@jwt_required()
+def mark_conversation_read(bot_id, contact_number):
+    try:
+        user_id = get_jwt_identity()
+        bot = Bot.query.filter_by(id=bot_id, user_id=user_id).first()
+        
+        if not bot:
+            return jsonify({'error': 'Bot não encontrado'}), 404
+        
+        if not mark_read(bot_id, contact_number):
+            return jsonify({'error': 'Conversa não encontrada'}), 404
+        
+        return jsonify({'message': 'Conversa marcada como lida'}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
 @bots_bp.route('/bots/<int:bot_id>/send-message', methods=['POST'])
 @jwt_required()
 def send_message(bot_id):
@@ -291,26 +372,18 @@ def send_message(bot_id):
         
         contact_number = data['contact_number'].strip()
         content = data['content'].strip()
-        message_type = data.get('message_type', 'text')
         
-        # Aqui você integraria com o sistema de WhatsApp
-        # Por enquanto, apenas salvamos a mensagem no banco
-        
-        message = Message(
-            bot_id=bot_id,
-            contact_number=contact_number,
-            content=content,
-            message_type=message_type,
-            direction='outgoing'
-        )
-        
-        db.session.add(message)
+        # Enviada pela fila de envio, que atualiza o status para sent ou failed
+        message = outbound_queue.add(bot_id, contact_number, content, media_url=data.get('media_url'),
+                                     message_type=data.get('message_type'))
         db.session.commit()
+        outbound_queue.dispatch([message])
         
         return jsonify({
-            'message': 'Mensagem enviada com sucesso',
+            'message': 'Mensagem enfileirada para envio',
+            'message_id': message.id,
             'message_data': message.to_dict()
-        }), 200
+        }), 202
         
     except Exception as e:
         db.session.rollback()
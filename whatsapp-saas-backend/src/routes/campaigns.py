@@ -0,0 +1,260 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from src.models.user import db
+from src.models.bot import Bot
+from src.models.campaign import Campaign, CampaignRecipient
+from src.campaign_engine import campaign_engine, TRANSITIONS
+from src.message_scheduler import message_scheduler, parse_send_at
+
+campaigns_bp = Blueprint('campaigns', __name__)
+
+# Limite de destinatários por página em /campaigns/<id>/recipients
+MAX_RECIPIENTS_PAGE = 1000
+
+
+def _user_campaign(campaign_id: int):
+    user_id = get_jwt_identity()
+    return Campaign.query.join(Bot, Bot.id == Campaign.bot_id).filter(
+        Campaign.id == campaign_id, Bot.user_id == user_id
+    ).first()
+
+
+def _contacts_stream():
+    """CSV de contatos: arquivo 'contacts' do multipart ou o próprio corpo com Content-Type text/csv"""
+    if 'contacts' in request.files:
+        return request.files['contacts'].stream
+    if request.mimetype == 'text/csv':
+        return request.stream
+    return None
+
+@campaigns_bp.route('/bots/<int:bot_id>/campaigns', methods=['POST'])
+@jwt_required()
+def create_campaign(bot_id):
+    """Cria a campanha (rascunho); os contatos podem vir junto, no multipart, ou depois"""
+    try:
+        user_id = get_jwt_identity()
+        bot = Bot.query.filter_by(id=bot_id, user_id=user_id).first()
+
+        if not bot:
+            return jsonify({'error': 'Bot não encontrado'}), 404
+
+        # Multipart (com o CSV) ou JSON (contatos enviados depois)
+        data = request.form if request.files else (request.get_json(silent=True) or {})
+
+        # Validação dos campos obrigatórios
+        if not data.get('name') or not data.get('template'):
+            return jsonify({'error': 'Nome e template são obrigatórios'}), 400
+
+        rate_per_minute = data.get('rate_per_minute')
+        try:
+            rate_per_minute = float(rate_per_minute) if rate_per_minute not in (None, '') else None
+        except (TypeError, ValueError):
+            return jsonify({'error': 'rate_per_minute deve ser um número'}), 400
+        if rate_per_minute is not None and rate_per_minute <= 0:
+            return jsonify({'error': 'rate_per_minute deve ser maior que zero'}), 400
+
+        campaign = Campaign(
+            bot_id=bot_id,
+            name=data['name'].strip(),
+            template=data['template'],
+            media_url=(data.get('media_url') or '').strip() or None,
+            rate_per_minute=rate_per_minute
+        )
+        db.session.add(campaign)
+        db.session.commit()
+
+        response = {'message': 'Campanha criada com sucesso', 'campaign': campaign.to_dict()}
+        stream = _contacts_stream()
+        if stream is not None:
+            try:
+                response['import'] = campaign_engine.import_recipients(campaign, stream)
+            except (ValueError, UnicodeDecodeError) as e:
+                db.session.rollback()
+                response['import'] = {'error': f'CSV inválido: {e}'}
+            response['campaign'] = campaign.to_dict()
+
+        return jsonify(response), 201
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@campaigns_bp.route('/bots/<int:bot_id>/campaigns', methods=['GET'])
+@jwt_required()
+def get_campaigns(bot_id):
+    try:
+        user_id = get_jwt_identity()
+        bot = Bot.query.filter_by(id=bot_id, user_id=user_id).first()
+
+        if not bot:
+            return jsonify({'error': 'Bot não encontrado'}), 404
+
+        campaigns = Campaign.query.filter_by(bot_id=bot_id).order_by(Campaign.id.desc()).all()
+
+        return jsonify({
+            'campaigns': [campaign.to_dict() for campaign in campaigns]
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@campaigns_bp.route('/campaigns/<int:campaign_id>', methods=['GET'])
+@jwt_required()
+def get_campaign(campaign_id):
+    """Campanha com os contadores de progresso"""
+    try:
+        campaign = _user_campaign(campaign_id)
+
+        if not campaign:
+            return jsonify({'error': 'Campanha não encontrada'}), 404
+
+        counts = dict(db.session.query(CampaignRecipient.status, db.func.count()).filter_by(
+            campaign_id=campaign_id
+        ).group_by(CampaignRecipient.status).all())
+
+        return jsonify({
+            'campaign': campaign.to_dict(),
+            'recipients': {status: counts.get(status, 0)
+                           for status in ('pending', 'queued', 'sent', 'failed', 'cancelled')}
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@campaigns_bp.route('/campaigns/<int:campaign_id>', methods=['DELETE'])
+@jwt_required()
+def delete_campaign(campaign_id):
+    try:
+        campaign = _user_campaign(campaign_id)
+
+        if not campaign:
+            return jsonify({'error': 'Campanha não encontrada'}), 404
+
+        if campaign.status == 'running':
+            return jsonify({'error': 'Pause ou cancele a campanha antes de excluí-la'}), 400
+
+        db.session.delete(campaign)
+        db.session.commit()
+
+        return jsonify({'message': 'Campanha excluída com sucesso'}), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@campaigns_bp.route('/campaigns/<int:campaign_id>/recipients', methods=['POST'])
+@jwt_required()
+def upload_recipients(campaign_id):
+    """Acrescenta contatos de um CSV (streaming) a uma campanha em rascunho ou pausada"""
+    try:
+        campaign = _user_campaign(campaign_id)
+
+        if not campaign:
+            return jsonify({'error': 'Campanha não encontrada'}), 404
+
+        if campaign.status not in ('draft', 'paused'):
+            return jsonify({'error': 'Só é possível incluir contatos em campanhas em rascunho ou pausadas'}), 400
+
+        stream = _contacts_stream()
+        if stream is None:
+            return jsonify({'error': "Envie o CSV no campo 'contacts' ou com Content-Type text/csv"}), 400
+
+        try:
+            result = campaign_engine.import_recipients(campaign, stream)
+        except (ValueError, UnicodeDecodeError) as e:
+            db.session.rollback()
+            return jsonify({'error': f'CSV inválido: {e}'}), 400
+
+        return jsonify({'import': result, 'campaign': campaign.to_dict()}), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@campaigns_bp.route('/campaigns/<int:campaign_id>/recipients', methods=['GET'])
+@jwt_required()
+def get_recipients(campaign_id):
+    """Resultado por destinatário (?status=&after=<id>&limit=)"""
+    try:
+        campaign = _user_campaign(campaign_id)
+
+        if not campaign:
+            return jsonify({'error': 'Campanha não encontrada'}), 404
+
+        limit = min(max(request.args.get('limit', 100, type=int), 1), MAX_RECIPIENTS_PAGE)
+        query = CampaignRecipient.query.filter(
+            CampaignRecipient.campaign_id == campaign_id,
+            CampaignRecipient.id > request.args.get('after', 0, type=int)
+        )
+        if request.args.get('status'):
+            query = query.filter(CampaignRecipient.status == request.args['status'])
+        recipients = query.order_by(CampaignRecipient.id).limit(limit + 1).all()
+
+        has_more = len(recipients) > limit
+        recipients = recipients[:limit]
+        return jsonify({
+            'recipients': [recipient.to_dict() for recipient in recipients],
+            'next_after': recipients[-1].id if has_more else None,
+            'has_more': has_more
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@campaigns_bp.route('/campaigns/<int:campaign_id>/schedule', methods=['POST'])
+@jwt_required()
+def schedule_campaign(campaign_id):
+    """Agenda o início de uma campanha em rascunho para send_at"""
+    try:
+        campaign = _user_campaign(campaign_id)
+
+        if not campaign:
+            return jsonify({'error': 'Campanha não encontrada'}), 404
+
+        if campaign.status != 'draft':
+            return jsonify({'error': 'Só é possível agendar campanhas em rascunho'}), 400
+
+        if not campaign.total:
+            return jsonify({'error': 'A campanha não tem destinatários'}), 400
+
+        try:
+            send_at = parse_send_at((request.get_json(silent=True) or {}).get('send_at'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        scheduled = message_scheduler.add_campaign(campaign, send_at)
+        db.session.commit()
+        message_scheduler.track([scheduled])
+
+        return jsonify({
+            'campaign': campaign.to_dict(),
+            'scheduled_message': scheduled.to_dict()
+        }), 201
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@campaigns_bp.route('/campaigns/<int:campaign_id>/<action>', methods=['POST'])
+@jwt_required()
+def campaign_action(campaign_id, action):
+    """start, pause, resume ou cancel"""
+    try:
+        if action not in TRANSITIONS:
+            return jsonify({'error': 'Ação não encontrada'}), 404
+
+        campaign = _user_campaign(campaign_id)
+
+        if not campaign:
+            return jsonify({'error': 'Campanha não encontrada'}), 404
+
+        try:
+            campaign_engine.transition(campaign, action)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        return jsonify({'campaign': campaign.to_dict()}), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Erro interno do servidor'}), 500
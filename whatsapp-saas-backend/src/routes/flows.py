@@ -2,6 +2,8 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from src.models.user import User, db
 from src.models.bot import Bot, Flow, FlowNode, NodeConnection
+from src.flow_dispatcher import flow_dispatcher
+from src.flow_engine import flow_engine
 import json
 
 flows_bp = Blueprint('flows', __name__)
@@ -63,6 +65,8 @@ def update_flow(flow_id):
             flow.is_active = bool(data['is_active'])
         
         db.session.commit()
+        flow_dispatcher.upsert_flow(flow)
+        flow_engine.invalidate(flow_id)
         
         return jsonify({
             'message': 'Fluxo atualizado com sucesso',
@@ -88,8 +92,11 @@ def delete_flow(flow_id):
         if not flow:
             return jsonify({'error': 'Fluxo não encontrado'}), 404
         
+        bot_id = flow.bot_id
         db.session.delete(flow)
         db.session.commit()
+        flow_dispatcher.remove_flow(bot_id, flow_id)
+        flow_engine.invalidate(flow_id)
         
         return jsonify({'message': 'Fluxo excluído com sucesso'}), 200
         
@@ -162,6 +169,7 @@ def create_flow_node(flow_id):
         
         db.session.add(node)
         db.session.commit()
+        flow_engine.invalidate(flow_id)
         
         return jsonify({
             'message': 'Nó criado com sucesso',
@@ -207,6 +215,7 @@ def update_flow_node(flow_id, node_id):
             node.order_index = data['order_index']
         
         db.session.commit()
+        flow_engine.invalidate(flow_id)
         
         return jsonify({
             'message': 'Nó atualizado com sucesso',
@@ -235,6 +244,7 @@ def delete_flow_node(flow_id, node_id):
         
         db.session.delete(node)
         db.session.commit()
+        flow_engine.invalidate(flow_id)
         
         return jsonify({'message': 'Nó excluído com sucesso'}), 200
         
@@ -285,6 +295,7 @@ def create_node_connection(flow_id):
         
         db.session.add(connection)
         db.session.commit()
+        flow_engine.invalidate(flow_id)
         
         return jsonify({
             'message': 'Conexão criada com sucesso',
@@ -315,6 +326,7 @@ def delete_node_connection(flow_id, connection_id):
         
         db.session.delete(connection)
         db.session.commit()
+        flow_engine.invalidate(flow_id)
         
         return jsonify({'message': 'Conexão excluída com sucesso'}), 200
         
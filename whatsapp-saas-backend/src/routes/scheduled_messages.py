@@ -0,0 +1,142 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from src.models.user import db
+from src.models.bot import Bot
+from src.models.scheduled_message import ScheduledMessage
+from src.message_scheduler import message_scheduler, parse_send_at
+
+scheduled_messages_bp = Blueprint('scheduled_messages', __name__)
+
+# Limite de agendamentos por requisição (lista em 'messages') e por página da listagem
+MAX_SCHEDULE_BATCH = 1000
+MAX_SCHEDULED_PAGE = 1000
+
+
+def _user_scheduled(scheduled_id: int):
+    user_id = get_jwt_identity()
+    return ScheduledMessage.query.join(Bot, Bot.id == ScheduledMessage.bot_id).filter(
+        ScheduledMessage.id == scheduled_id, Bot.user_id == user_id
+    ).first()
+
+@scheduled_messages_bp.route('/bots/<int:bot_id>/scheduled-messages', methods=['POST'])
+@jwt_required()
+def schedule_messages(bot_id):
+    """Agenda uma mensagem, ou várias em 'messages', para send_at (ISO 8601 ou timestamp Unix)"""
+    try:
+        user_id = get_jwt_identity()
+        bot = Bot.query.filter_by(id=bot_id, user_id=user_id).first()
+
+        if not bot:
+            return jsonify({'error': 'Bot não encontrado'}), 404
+
+        data = request.get_json(silent=True) or {}
+        items = data.get('messages') if 'messages' in data else [data]
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': "'messages' deve ser uma lista não vazia"}), 400
+        if len(items) > MAX_SCHEDULE_BATCH:
+            return jsonify({'error': f'No máximo {MAX_SCHEDULE_BATCH} mensagens por requisição'}), 400
+
+        scheduled = []
+        for index, item in enumerate(items):
+            item = item if isinstance(item, dict) else {}
+            # Validação dos campos obrigatórios
+            if not item.get('contact_number') or not (item.get('content') or item.get('media_url')):
+                db.session.rollback()
+                return jsonify({'error': 'Número do contato e conteúdo são obrigatórios', 'index': index}), 400
+            try:
+                send_at = parse_send_at(item.get('send_at'))
+            except ValueError as e:
+                db.session.rollback()
+                return jsonify({'error': str(e), 'index': index}), 400
+
+            scheduled.append(message_scheduler.add(
+                bot_id,
+                str(item['contact_number']).strip(),
+                (item.get('content') or '').strip(),
+                send_at,
+                media_url=(item.get('media_url') or '').strip() or None
+            ))
+        db.session.commit()
+        message_scheduler.track(scheduled)
+
+        return jsonify({
+            'message': 'Mensagens agendadas com sucesso',
+            'scheduled_messages': [item.to_dict() for item in scheduled]
+        }), 201
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@scheduled_messages_bp.route('/bots/<int:bot_id>/scheduled-messages', methods=['GET'])
+@jwt_required()
+def get_scheduled_messages(bot_id):
+    """Agendamentos do bot (?status=&after=<id>&limit=)"""
+    try:
+        user_id = get_jwt_identity()
+        bot = Bot.query.filter_by(id=bot_id, user_id=user_id).first()
+
+        if not bot:
+            return jsonify({'error': 'Bot não encontrado'}), 404
+
+        limit = min(max(request.args.get('limit', 100, type=int), 1), MAX_SCHEDULED_PAGE)
+        query = ScheduledMessage.query.filter(
+            ScheduledMessage.bot_id == bot_id,
+            ScheduledMessage.id > request.args.get('after', 0, type=int)
+        )
+        if request.args.get('status'):
+            query = query.filter(ScheduledMessage.status == request.args['status'])
+        scheduled = query.order_by(ScheduledMessage.id).limit(limit + 1).all()
+
+        has_more = len(scheduled) > limit
+        scheduled = scheduled[:limit]
+        return jsonify({
+            'scheduled_messages': [item.to_dict() for item in scheduled],
+            'next_after': scheduled[-1].id if has_more else None,
+            'has_more': has_more
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@scheduled_messages_bp.route('/scheduled-messages/<int:scheduled_id>', methods=['GET'])
+@jwt_required()
+def get_scheduled_message(scheduled_id):
+    try:
+        scheduled = _user_scheduled(scheduled_id)
+
+        if not scheduled:
+            return jsonify({'error': 'Agendamento não encontrado'}), 404
+
+        return jsonify({'scheduled_message': scheduled.to_dict()}), 200
+
+    except Exception as e:
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@scheduled_messages_bp.route('/scheduled-messages/<int:scheduled_id>', methods=['DELETE'])
+@jwt_required()
+def cancel_scheduled_message(scheduled_id):
+    """Cancela um agendamento que ainda não saiu"""
+    try:
+        scheduled = _user_scheduled(scheduled_id)
+
+        if not scheduled:
+            return jsonify({'error': 'Agendamento não encontrado'}), 404
+
+        if not message_scheduler.cancel(scheduled):
+            return jsonify({'error': f"Agendamento com status '{scheduled.status}' não pode ser cancelado"}), 400
+
+        return jsonify({
+            'message': 'Agendamento cancelado',
+            'scheduled_message': scheduled.to_dict()
+        }), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@scheduled_messages_bp.route('/scheduler/metrics', methods=['GET'])
+@jwt_required()
+def scheduler_metrics():
+    """Métricas do agendador de mensagens"""
+    return jsonify(message_scheduler.metrics()), 200
@@ -1,8 +1,12 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from src.models.user import User, db
 from src.models.bot import Bot, Message
-from src.whatsapp_manager import whatsapp_manager
+from src.whatsapp_manager import whatsapp_manager, bot_status_for
+from src.message_ingestion import ingestion_pipeline
+from src.lifecycle_jobs import lifecycle_jobs
+from src.bulk_lifecycle import bulk_lifecycle, BULK_ACTIONS
+from src.outbound_queue import outbound_queue
 
 whatsapp_bp = Blueprint('whatsapp', __name__)
 
@@ -16,19 +20,19 @@ def start_bot(bot_id):
         if not bot:
             return jsonify({'error': 'Bot não encontrado'}), 404
         
-        # Iniciar instância do WhatsApp
-        success = whatsapp_manager.create_instance(bot_id, bot.to_dict())
-        
-        if success:
-            bot.status = 'connecting'
-            db.session.commit()
-            
+        # Iniciar instância do WhatsApp em segundo plano; o progresso fica no job
+        job = lifecycle_jobs.start(bot)
+        if job is None:
             return jsonify({
-                'message': 'Bot iniciado com sucesso',
-                'status': 'connecting'
-            }), 200
-        else:
-            return jsonify({'error': 'Falha ao iniciar o bot'}), 500
+                'error': 'Já existe uma operação em andamento para este bot',
+                'job': lifecycle_jobs.active_for(bot_id)
+            }), 409
+        
+        return jsonify({
+            'message': 'Início do bot agendado',
+            'job_id': job['id'],
+            'job': job
+        }), 202
             
     except Exception as e:
         return jsonify({'error': 'Erro interno do servidor'}), 500
@@ -43,21 +47,93 @@ def stop_bot(bot_id):
         if not bot:
             return jsonify({'error': 'Bot não encontrado'}), 404
         
-        # Parar instância do WhatsApp
-        success = whatsapp_manager.stop_instance(bot_id)
+        # Parar instância do WhatsApp em segundo plano; o progresso fica no job
+        job = lifecycle_jobs.stop(bot)
+        if job is None:
+            return jsonify({
+                'error': 'Já existe uma operação em andamento para este bot',
+                'job': lifecycle_jobs.active_for(bot_id)
+            }), 409
         
-        if success:
-            bot.status = 'inactive'
-            bot.qr_code = None
-            db.session.commit()
+        return jsonify({
+            'message': 'Parada do bot agendada',
+            'job_id': job['id'],
+            'job': job
+        }), 202
             
-            return jsonify({
-                'message': 'Bot parado com sucesso',
-                'status': 'inactive'
-            }), 200
+    except Exception as e:
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@whatsapp_bp.route('/bots/bulk', methods=['POST'])
+@jwt_required()
+def bulk_bots():
+    """Inicia, para ou reinicia vários bots; o resultado de cada um chega em NDJSON"""
+    try:
+        user_id = get_jwt_identity()
+        data = request.get_json() or {}
+        
+        action = data.get('action')
+        if action not in BULK_ACTIONS:
+            return jsonify({'error': f"Ação inválida (use {', '.join(BULK_ACTIONS)})"}), 400
+        
+        query = Bot.query.filter_by(user_id=user_id)
+        if data.get('bot_ids'):
+            bot_ids = [int(bot_id) for bot_id in data['bot_ids']]
+            bots = query.filter(Bot.id.in_(bot_ids)).order_by(Bot.id).all()
+            missing = sorted(set(bot_ids) - {bot.id for bot in bots})
+            if missing:
+                return jsonify({'error': 'Bots não encontrados', 'bot_ids': missing}), 404
+        elif data.get('select') == 'active':
+            # Os que estavam rodando (ex.: antes de o servidor reiniciar)
+            bots = query.filter(Bot.status.in_(('active', 'connecting'))).order_by(Bot.id).all()
+        elif data.get('select') == 'all':
+            bots = query.order_by(Bot.id).all()
         else:
-            return jsonify({'error': 'Falha ao parar o bot'}), 500
-            
+            return jsonify({'error': "Informe 'bot_ids' ou 'select' ('active' ou 'all')"}), 400
+        
+        operation = bulk_lifecycle.run(
+            action, [bot.to_dict() for bot in bots], user_id=int(user_id),
+            concurrency=data.get('concurrency'), ramp_seconds=data.get('ramp_seconds')
+        )
+        
+        # A operação continua mesmo se o cliente desconectar; o estado fica em /bulk/<id>
+        response = Response(bulk_lifecycle.stream(operation), mimetype='application/x-ndjson')
+        response.headers['X-Operation-Id'] = operation['id']
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+        
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Parâmetros inválidos'}), 400
+    except Exception as e:
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@whatsapp_bp.route('/bulk/<operation_id>', methods=['GET'])
+@jwt_required()
+def get_bulk_operation(operation_id):
+    try:
+        user_id = get_jwt_identity()
+        operation = bulk_lifecycle.get(operation_id)
+        
+        if not operation or str(operation['user_id']) != str(user_id):
+            return jsonify({'error': 'Operação não encontrada'}), 404
+        
+        return jsonify({'operation': operation}), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@whatsapp_bp.route('/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_job(job_id):
+    try:
+        user_id = get_jwt_identity()
+        job = lifecycle_jobs.get(job_id)
+        
+        if not job or str(job['user_id']) != str(user_id):
+            return jsonify({'error': 'Job não encontrado'}), 404
+        
+        return jsonify({'job': job}), 200
+        
     except Exception as e:
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
@@ -76,8 +152,9 @@ def get_bot_status(bot_id):
         
         if instance_status:
             # Atualizar status no banco se necessário
-            if bot.status != instance_status:
-                bot.status = instance_status
+            status = bot_status_for(instance_status.get('status'))
+            if status and bot.status != status:
+                bot.status = status
                 db.session.commit()
         
         # Verificar QR code
@@ -88,7 +165,8 @@ def get_bot_status(bot_id):
         
         return jsonify({
             'status': bot.status,
-            'qr_code': bot.qr_code
+            'qr_code': bot.qr_code,
+            'supervisor': whatsapp_manager.supervision_status(bot_id)
         }), 200
         
     except Exception as e:
@@ -117,30 +195,19 @@ def send_whatsapp_message(bot_id):
         if bot.status != 'active':
             return jsonify({'error': 'Bot não está ativo'}), 400
         
-        # Enviar mensagem através do gerenciador
-        success = whatsapp_manager.send_message(bot_id, number, message)
-        
-        if success:
-            # Salvar mensagem no banco
-            msg_record = Message(
-                bot_id=bot_id,
-                contact_number=number,
-                content=message,
-                message_type='text',
-                direction='outgoing',
-                status='sent'
-            )
-            db.session.add(msg_record)
-            db.session.commit()
-            
-            return jsonify({
-                'message': 'Mensagem enviada com sucesso',
-                'message_data': msg_record.to_dict()
-            }), 200
-        else:
-            return jsonify({'error': 'Falha ao enviar mensagem'}), 500
+        # Gravada como 'queued': a fila de envio manda pelo bot e atualiza o status
+        msg_record = outbound_queue.add(bot_id, number, message)
+        db.session.commit()
+        outbound_queue.dispatch([msg_record])
+        
+        return jsonify({
+            'message': 'Mensagem enfileirada para envio',
+            'message_id': msg_record.id,
+            'message_data': msg_record.to_dict()
+        }), 202
             
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
 @whatsapp_bp.route('/bots/<int:bot_id>/send-media', methods=['POST'])
@@ -167,30 +234,38 @@ def send_whatsapp_media(bot_id):
         if bot.status != 'active':
             return jsonify({'error': 'Bot não está ativo'}), 400
         
-        # Enviar mídia através do gerenciador
-        success = whatsapp_manager.send_media(bot_id, number, file_url, caption)
-        
-        if success:
-            # Salvar mensagem no banco
-            msg_record = Message(
-                bot_id=bot_id,
-                contact_number=number,
-                content=caption,
-                media_url=file_url,
-                message_type='media',
-                direction='outgoing',
-                status='sent'
-            )
-            db.session.add(msg_record)
-            db.session.commit()
-            
-            return jsonify({
-                'message': 'Mídia enviada com sucesso',
-                'message_data': msg_record.to_dict()
-            }), 200
-        else:
-            return jsonify({'error': 'Falha ao enviar mídia'}), 500
+        # Gravada como 'queued': a fila de envio manda pelo bot e atualiza o status
+        msg_record = outbound_queue.add(bot_id, number, caption, media_url=file_url)
+        db.session.commit()
+        outbound_queue.dispatch([msg_record])
+        
+        return jsonify({
+            'message': 'Mídia enfileirada para envio',
+            'message_id': msg_record.id,
+            'message_data': msg_record.to_dict()
+        }), 202
             
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@whatsapp_bp.route('/bots/<int:bot_id>/messages/<int:message_id>', methods=['GET'])
+@jwt_required()
+def outbound_message_status(bot_id, message_id):
+    """Status de uma mensagem enviada pela fila (queued, sent ou failed)"""
+    try:
+        user_id = get_jwt_identity()
+        bot = Bot.query.filter_by(id=bot_id, user_id=user_id).first()
+        
+        if not bot:
+            return jsonify({'error': 'Bot não encontrado'}), 404
+        
+        message = Message.query.filter_by(id=message_id, bot_id=bot_id).first()
+        if not message:
+            return jsonify({'error': 'Mensagem não encontrada'}), 404
+        
+        return jsonify({'message_data': message.to_dict()}), 200
+        
     except Exception as e:
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
@@ -198,34 +273,47 @@ def send_whatsapp_media(bot_id):
 def webhook_receiver(bot_id):
     """Recebe webhooks das instâncias de bots"""
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True)
         
         # Verificar se o bot existe
-        bot = Bot.query.get(bot_id)
-        if not bot:
+        if not ingestion_pipeline.is_known_bot(bot_id):
             return jsonify({'error': 'Bot não encontrado'}), 404
         
-        # Processar mensagem recebida
-        message_data = data.get('message', {})
-        
-        if message_data:
-            # Salvar mensagem no banco
-            msg_record = Message(
-                bot_id=bot_id,
-                contact_number=message_data.get('from', ''),
-                content=message_data.get('body', ''),
-                message_type=message_data.get('type', 'text'),
-                direction='incoming'
-            )
-            db.session.add(msg_record)
-            db.session.commit()
-            
-            # Aqui você pode implementar lógica de processamento de fluxos
-            # Por exemplo, verificar se a mensagem corresponde a algum trigger
-            # e executar o fluxo correspondente
+        # Gravada no spool e enfileirada; banco e fluxos ficam com o worker de ingestão
+        result = ingestion_pipeline.submit(bot_id, data)
+        
+        if result == 'ignored':
+            # Eventos que não são mensagens recebidas são apenas confirmados
+            return jsonify({'status': 'received'}), 200
+        
+        if result == 'duplicate':
+            # Reenvio de uma mensagem já recebida
+            return jsonify({'status': 'duplicate'}), 200
         
-        return jsonify({'status': 'received'}), 200
+        if result == 'full':
+            response = jsonify({'error': 'Fila de ingestão cheia, tente novamente'})
+            response.headers['Retry-After'] = '1'
+            return response, 429
+        
+        return jsonify({'status': 'queued'}), 202
         
     except Exception as e:
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
+@whatsapp_bp.route('/ingestion/metrics', methods=['GET'])
+@jwt_required()
+def ingestion_metrics():
+    """Métricas da fila de ingestão de mensagens"""
+    return jsonify(ingestion_pipeline.metrics()), 200
+
+@whatsapp_bp.route('/transport/metrics', methods=['GET'])
+@jwt_required()
+def transport_metrics():
+    """Métricas das conexões HTTP do backend com os bots deste worker"""
+    return jsonify(whatsapp_manager.http.metrics()), 200
+
+@whatsapp_bp.route('/outbound/metrics', methods=['GET'])
+@jwt_required()
+def outbound_metrics():
+    """Métricas da fila de envio de mensagens"""
+    return jsonify(outbound_queue.metrics()), 200
@@ -1,17 +1,18 @@
-from flask import Blueprint, request, jsonify, render_template_string
+from flask import Blueprint, request, jsonify, render_template_string, Response
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from src.models.user import User, db
 from src.models.bot import Bot
-import subprocess
-import os
-import json
-import signal
-import psutil
+from src.flow_dispatcher import flow_dispatcher
+from src.message_ingestion import ingestion_pipeline
+from src.message_archive import message_archive
+from src.whatsapp_manager import whatsapp_manager, bot_status_for
+from src.lifecycle_jobs import lifecycle_jobs
+from src.status_events import status_broker, session_info
+from src.outbound_queue import outbound_queue
 
 whatsapp_sessions_bp = Blueprint('whatsapp_sessions', __name__)
 
-# Armazenar processos ativos
-active_sessions = {}
+# Os processos dos bots ficam no registro do whatsapp_manager, o mesmo usado por /api/whatsapp
 
 @whatsapp_sessions_bp.route('/sessions', methods=['GET'])
 @jwt_required()
@@ -27,17 +28,7 @@ def get_sessions():
         # Buscar bots do usuário
         bots = Bot.query.filter_by(user_id=int(user_id)).all()
         
-        sessions = []
-        for bot in bots:
-            session_info = {
-                'id': str(bot.id),
-                'description': bot.name,
-                'status': bot.status,
-                'qr_code': bot.qr_code,
-                'ready': bot.status == 'active',
-                'port': 8000 + bot.id
-            }
-            sessions.append(session_info)
+        sessions = [session_info(bot, whatsapp_manager.port_for(bot.id)) for bot in bots]
         
         return jsonify({
             'sessions': sessions,
@@ -48,6 +39,26 @@ def get_sessions():
         print(f"[ERROR] Erro ao listar sessões: {e}")
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
+@whatsapp_sessions_bp.route('/events', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def session_events():
+    """Stream SSE com o status e o QR code das sessões do usuário"""
+    try:
+        user_id = int(get_jwt_identity())
+        
+        # Uma consulta por conexão; depois disso só chegam as mudanças, sem banco
+        snapshot = [session_info(bot, whatsapp_manager.port_for(bot.id))
+                    for bot in Bot.query.filter_by(user_id=user_id).all()]
+        
+        response = Response(status_broker.stream(user_id, snapshot), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'  # nginx: não acumular o stream
+        return response
+        
+    except Exception as e:
+        print(f"[ERROR] Erro ao abrir stream de eventos: {e}")
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
 @whatsapp_sessions_bp.route('/sessions', methods=['POST'])
 @jwt_required()
 def create_session():
@@ -75,16 +86,12 @@ def create_session():
         
         db.session.add(bot)
         db.session.commit()
+        session = session_info(bot, whatsapp_manager.port_for(bot.id))
+        status_broker.publish(bot.user_id, session)
         
         return jsonify({
             'message': 'Sessão criada com sucesso',
-            'session': {
-                'id': str(bot.id),
-                'description': bot.name,
-                'status': bot.status,
-                'ready': False,
-                'port': 8000 + bot.id
-            }
+            'session': session
         }), 201
         
     except Exception as e:
@@ -103,53 +110,24 @@ def start_session(session_id):
         if not bot:
             return jsonify({'error': 'Sessão não encontrada'}), 404
         
-        # Verificar se já está rodando
-        if session_id in active_sessions:
+        # Verificar se já está rodando (por esta API ou por /api/whatsapp)
+        if whatsapp_manager.is_running(bot.id):
             return jsonify({'error': 'Sessão já está ativa'}), 400
         
-        # Iniciar processo Node.js
-        try:
-            port = 8000 + bot.id
-            webhook_url = f"http://localhost:5000/api/whatsapp/webhook/{bot.id}"
-            
-            # Comando para iniciar o bot
-            cmd = [
-                'node',
-                '/home/ubuntu/dashurx/whatsapp-saas-backend/src/whatsapp_module/whatsapp_bot.js',
-                str(bot.id),
-                str(port),
-                webhook_url
-            ]
-            
-            # Iniciar processo
-            process = subprocess.Popen(
-                cmd,
-                cwd='/home/ubuntu/dashurx/whatsapp-saas-backend',
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                preexec_fn=os.setsid
-            )
-            
-            # Armazenar processo
-            active_sessions[session_id] = {
-                'process': process,
-                'port': port,
-                'bot_id': bot.id
-            }
-            
-            # Atualizar status no banco
-            bot.status = 'connecting'
-            db.session.commit()
-            
+        # O processo sobe em segundo plano; status e QR code chegam pelo stream de eventos
+        job = lifecycle_jobs.start(bot)
+        if job is None:
             return jsonify({
-                'message': 'Sessão iniciada com sucesso',
-                'status': 'connecting',
-                'port': port
-            }), 200
-            
-        except Exception as e:
-            print(f"[ERROR] Erro ao iniciar processo: {e}")
-            return jsonify({'error': 'Falha ao iniciar sessão'}), 500
+                'error': 'Já existe uma operação em andamento para esta sessão',
+                'job': lifecycle_jobs.active_for(bot.id)
+            }), 409
+        
+        return jsonify({
+            'message': 'Sessão iniciada com sucesso',
+            'status': 'connecting',
+            'port': whatsapp_manager.port_for(bot.id),
+            'job_id': job['id']
+        }), 202
         
     except Exception as e:
         print(f"[ERROR] Erro ao iniciar sessão: {e}")
@@ -166,36 +144,19 @@ def stop_session(session_id):
         if not bot:
             return jsonify({'error': 'Sessão não encontrada'}), 404
         
-        # Parar processo se estiver rodando
-        if session_id in active_sessions:
-            try:
-                process = active_sessions[session_id]['process']
-                
-                # Tentar parar graciosamente
-                os.killpg(os.getpgid(process.pid), signal.SIGTERM)
-                
-                # Aguardar um pouco
-                try:
-                    process.wait(timeout=5)
-                except subprocess.TimeoutExpired:
-                    # Forçar parada se necessário
-                    os.killpg(os.getpgid(process.pid), signal.SIGKILL)
-                
-                # Remover da lista de sessões ativas
-                del active_sessions[session_id]
-                
-            except Exception as e:
-                print(f"[ERROR] Erro ao parar processo: {e}")
-        
-        # Atualizar status no banco
-        bot.status = 'inactive'
-        bot.qr_code = None
-        db.session.commit()
+        # O manager encerra o Node e o Chromium sem prender a requisição; o job grava 'inactive'
+        job = lifecycle_jobs.stop(bot)
+        if job is None:
+            return jsonify({
+                'error': 'Já existe uma operação em andamento para esta sessão',
+                'job': lifecycle_jobs.active_for(bot.id)
+            }), 409
         
         return jsonify({
             'message': 'Sessão parada com sucesso',
-            'status': 'inactive'
-        }), 200
+            'status': 'inactive',
+            'job_id': job['id']
+        }), 202
         
     except Exception as e:
         print(f"[ERROR] Erro ao parar sessão: {e}")
@@ -212,49 +173,22 @@ def get_session_status(session_id):
         if not bot:
             return jsonify({'error': 'Sessão não encontrada'}), 404
         
-        # Verificar se o processo ainda está rodando
-        is_running = False
-        if session_id in active_sessions:
-            try:
-                process = active_sessions[session_id]['process']
-                is_running = process.poll() is None
-                
-                if not is_running:
-                    # Processo morreu, remover da lista
-                    del active_sessions[session_id]
-                    bot.status = 'inactive'
-                    bot.qr_code = None
-                    db.session.commit()
-            except:
-                is_running = False
-        
-        # Tentar obter QR code se estiver conectando
-        qr_code = None
-        if is_running and session_id in active_sessions:
-            try:
-                import requests
-                port = active_sessions[session_id]['port']
-                response = requests.get(f'http://localhost:{port}/qr', timeout=2)
-                if response.status_code == 200:
-                    qr_data = response.json()
-                    if qr_data.get('status') and qr_data.get('qrCode'):
-                        qr_code = qr_data['qrCode']
-                        
-                        # Atualizar no banco se mudou
-                        if bot.qr_code != qr_code:
-                            bot.qr_code = qr_code
-                            db.status = 'qr_ready'
-                            db.session.commit()
-            except:
-                pass
+        # Status e QR code chegam por eventos do bot; a memória é mais recente que o banco
+        status = bot.status
+        qr_code = bot.qr_code
+        is_running = whatsapp_manager.is_running(bot.id)
+        if is_running:
+            instance_status = whatsapp_manager.get_instance_status(bot.id) or {}
+            status = bot_status_for(instance_status.get('status')) or status
+            qr_code = instance_status.get('qrCode')
         
         return jsonify({
             'id': session_id,
-            'status': bot.status,
-            'qr_code': bot.qr_code,
-            'ready': bot.status == 'active',
+            'status': status,
+            'qr_code': qr_code,
+            'ready': status == 'active',
             'running': is_running,
-            'port': 8000 + bot.id if is_running else None
+            'port': whatsapp_manager.port_for(bot.id) if is_running else None
         }), 200
         
     except Exception as e:
@@ -273,17 +207,15 @@ def delete_session(session_id):
             return jsonify({'error': 'Sessão não encontrada'}), 404
         
         # Parar processo se estiver rodando
-        if session_id in active_sessions:
-            try:
-                process = active_sessions[session_id]['process']
-                os.killpg(os.getpgid(process.pid), signal.SIGKILL)
-                del active_sessions[session_id]
-            except:
-                pass
+        whatsapp_manager.stop_instance_async(bot.id)
         
         # Deletar do banco
         db.session.delete(bot)
         db.session.commit()
+        flow_dispatcher.invalidate_bot(bot.id)
+        ingestion_pipeline.forget_bot(bot.id)
+        message_archive.delete_bot(bot.id)
+        status_broker.publish_removed(bot.user_id, bot.id)
         
         return jsonify({
             'message': 'Sessão deletada com sucesso'
@@ -305,7 +237,7 @@ def send_message_session(session_id):
         if not bot:
             return jsonify({'error': 'Sessão não encontrada'}), 404
         
-        if session_id not in active_sessions:
+        if not whatsapp_manager.is_running(bot.id):
             return jsonify({'error': 'Sessão não está ativa'}), 400
         
         data = request.get_json()
@@ -313,35 +245,17 @@ def send_message_session(session_id):
         if not data.get('number') or not data.get('message'):
             return jsonify({'error': 'Número e mensagem são obrigatórios'}), 400
         
-        # Enviar mensagem via API do bot
-        try:
-            import requests
-            port = active_sessions[session_id]['port']
-            
-            response = requests.post(f'http://localhost:{port}/send-message', 
-                json={
-                    'number': data['number'],
-                    'message': data['message']
-                },
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                return jsonify({
-                    'message': 'Mensagem enviada com sucesso',
-                    'response': response.json()
-                }), 200
-            else:
-                return jsonify({
-                    'error': 'Falha ao enviar mensagem',
-                    'details': response.text
-                }), response.status_code
-                
-        except Exception as e:
-            print(f"[ERROR] Erro ao enviar mensagem: {e}")
-            return jsonify({'error': 'Falha na comunicação com o bot'}), 500
+        # Mesma fila de envio de /api/whatsapp: responde sem esperar o bot
+        message = outbound_queue.add(bot.id, data['number'].strip(), data['message'].strip())
+        db.session.commit()
+        outbound_queue.dispatch([message])
+        return jsonify({
+            'message': 'Mensagem enfileirada para envio',
+            'message_id': message.id
+        }), 202
         
     except Exception as e:
+        db.session.rollback()
         print(f"[ERROR] Erro ao enviar mensagem: {e}")
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
@@ -567,6 +481,7 @@ def whatsapp_interface():
         const API_BASE = '/api/whatsapp-sessions';
         let sessions = [];
         let refreshInterval;
+        let eventSource;
 
         // Obter token JWT do localStorage (assumindo que está armazenado lá)
         function getAuthToken() {
@@ -619,6 +534,37 @@ def whatsapp_interface():
             }
         }
 
+        // Receber a lista e as mudanças de status e QR code em tempo real (SSE)
+        function connectEvents() {
+            eventSource = new EventSource(`${API_BASE}/events?jwt=${encodeURIComponent(getAuthToken())}`);
+            eventSource.addEventListener('snapshot', (event) => {
+                sessions = JSON.parse(event.data).sessions;
+                renderSessions();
+            });
+            eventSource.addEventListener('session', (event) => {
+                applySessionEvent(JSON.parse(event.data));
+                renderSessions();
+            });
+            eventSource.onerror = () => {
+                // Quedas de rede reconectam sozinhas; um erro HTTP (ex.: token expirado) fecha o stream
+                if (eventSource.readyState === EventSource.CLOSED && !refreshInterval) {
+                    refreshInterval = setInterval(loadSessions, 5000);
+                }
+            };
+        }
+
+        // Aplicar a mudança de uma sessão à lista atual
+        function applySessionEvent(update) {
+            const index = sessions.findIndex(session => session.id === update.id);
+            if (update.removed) {
+                if (index !== -1) sessions.splice(index, 1);
+            } else if (index === -1) {
+                if (update.description !== undefined) sessions.push(update);
+            } else {
+                sessions[index] = { ...sessions[index], ...update };
+            }
+        }
+
         // Renderizar sessões
         function renderSessions() {
             const container = document.getElementById('sessions-container');
@@ -778,14 +724,21 @@ def whatsapp_interface():
 
         // Inicializar
         document.addEventListener('DOMContentLoaded', function() {
-            loadSessions();
+            if (window.EventSource && getAuthToken()) {
+                connectEvents();
+                return;
+            }
             
-            // Atualizar sessões a cada 5 segundos
+            // Sem suporte a SSE: atualizar sessões a cada 5 segundos
+            loadSessions();
             refreshInterval = setInterval(loadSessions, 5000);
         });
 
-        // Limpar interval ao sair da página
+        // Fechar o stream e limpar o interval ao sair da página
         window.addEventListener('beforeunload', function() {
+            if (eventSource) {
+                eventSource.close();
+            }
             if (refreshInterval) {
                 clearInterval(refreshInterval);
             }
@@ -0,0 +1,181 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, Optional, Set
+
+from sqlalchemy import func
+
+from src.models import db
+from src.models.bot import StatusEvent
+from src.instance_registry import instance_registry
+
+# Comentário enviado periodicamente para manter a conexão aberta em proxies
+HEARTBEAT_SECONDS = float(os.getenv('STATUS_EVENTS_HEARTBEAT', 15))
+
+# Eventos mais novos que isto são relidos a cada consulta: no PostgreSQL e no MySQL um id
+# menor pode ficar visível depois de um maior, se a transação dele terminar por último
+SETTLE_SECONDS = 10
+
+# Intervalo entre as limpezas da tabela status_events
+PRUNE_INTERVAL = 60
+
+
+def session_info(bot, port: int) -> dict:
+    """Estado completo de uma sessão (formato de GET /sessions)"""
+    return {
+        'id': str(bot.id),
+        'description': bot.name,
+        'status': bot.status,
+        'qr_code': bot.qr_code,
+        'ready': bot.status == 'active',
+        'port': port
+    }
+
+
+def session_event(bot_id: int, status: Optional[str], qr_code: Optional[str] = None,
+                  running: Optional[bool] = None) -> dict:
+    """Mudança de estado de uma sessão; campos omitidos mantêm o valor do painel"""
+    event = {
+        'id': str(bot_id),
+        'status': status,
+        'qr_code': qr_code,
+        'ready': status == 'active'
+    }
+    if running is not None:
+        event['running'] = running
+    return event
+
+
+class _Subscriber:
+    __slots__ = ('pending', 'ready')
+
+    def __init__(self):
+        self.pending: Dict[str, dict] = {}  # sessão -> último estado ainda não enviado
+        self.ready = threading.Event()
+
+
+class StatusBroker:
+    """Distribui as mudanças de status e QR code das sessões para os painéis abertos
+
+    Cada conexão SSE assina os eventos do seu usuário. Os eventos de uma mesma
+    sessão são agrupados enquanto o cliente não os lê (só o último estado é
+    enviado), então um painel lento nunca acumula fila. Cada evento também vai
+    para a tabela status_events, de onde os outros workers o repassam aos
+    painéis conectados a eles.
+    """
+
+    def __init__(self):
+        self.poll_seconds = float(os.getenv('STATUS_EVENTS_POLL_SECONDS', 1))
+        self.retention = int(os.getenv('STATUS_EVENTS_RETENTION_SECONDS', 300))
+        self.app = None
+        self._subscribers: Dict[int, Set[_Subscriber]] = {}
+        self._lock = threading.Lock()
+        self._floor = 0  # Eventos até este id já foram repassados
+        self._relayed: Set[int] = set()  # Ids acima do piso já repassados
+        self._pruned_at = 0.0
+
+    def init_app(self, app, relay: bool = True):
+        """Começa a gravar os eventos; com relay, repassa os dos outros workers em segundo plano"""
+        self.app = app
+        with app.app_context():
+            self._floor = db.session.query(func.max(StatusEvent.id)).scalar() or 0
+        if relay:
+            threading.Thread(target=self._relay_loop, daemon=True).start()
+
+    def publish(self, user_id: Optional[int], event: dict):
+        if user_id is None:
+            return
+        self._deliver(int(user_id), event)
+        self._share(int(user_id), event)
+
+    def publish_session(self, user_id: Optional[int], bot_id: int, status: Optional[str],
+                        qr_code: Optional[str] = None, running: Optional[bool] = None):
+        self.publish(user_id, session_event(bot_id, status, qr_code, running))
+
+    def publish_removed(self, user_id: Optional[int], bot_id: int):
+        self.publish(user_id, {'id': str(bot_id), 'removed': True})
+
+    def stream(self, user_id: int, snapshot: list) -> Iterator[str]:
+        """Gera o corpo text/event-stream: a lista inicial e depois as mudanças"""
+        subscriber = _Subscriber()
+        with self._lock:
+            self._subscribers.setdefault(int(user_id), set()).add(subscriber)
+        try:
+            yield self._format('snapshot', {'sessions': snapshot})
+            while True:
+                if not subscriber.ready.wait(HEARTBEAT_SECONDS):
+                    yield ': ping\n\n'
+                    continue
+                with self._lock:
+                    subscriber.ready.clear()
+                    events, subscriber.pending = list(subscriber.pending.values()), {}
+                for event in events:
+                    yield self._format('session', event)
+        finally:
+            # Cliente desconectou (GeneratorExit) ou o servidor está encerrando
+            with self._lock:
+                subscribers = self._subscribers.get(int(user_id))
+                if subscribers is not None:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del self._subscribers[int(user_id)]
+
+    def relay(self):
+        """Entrega aos painéis deste worker os eventos publicados pelos outros"""
+        now = datetime.utcnow()
+        with self.app.app_context():
+            rows = db.session.query(StatusEvent.id, StatusEvent.user_id, StatusEvent.data, StatusEvent.created_at) \
+                .filter(StatusEvent.id > self._floor, StatusEvent.origin != instance_registry.owner) \
+                .order_by(StatusEvent.id).all()
+            if time.monotonic() - self._pruned_at >= PRUNE_INTERVAL:
+                self._pruned_at = time.monotonic()
+                StatusEvent.query.filter(StatusEvent.created_at < now - timedelta(seconds=self.retention)) \
+                    .delete(synchronize_session=False)
+                db.session.commit()
+
+        settled = now - timedelta(seconds=SETTLE_SECONDS)
+        for event_id, user_id, data, created_at in rows:
+            if event_id not in self._relayed:
+                self._relayed.add(event_id)
+                self._deliver(user_id, json.loads(data))
+            if created_at < settled:
+                self._floor = event_id
+        self._relayed = {event_id for event_id in self._relayed if event_id > self._floor}
+
+    def _deliver(self, user_id: int, event: dict):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+            for subscriber in subscribers:
+                subscriber.pending[event['id']] = event
+        for subscriber in subscribers:
+            subscriber.ready.set()
+
+    def _share(self, user_id: int, event: dict):
+        # Em conexão própria: não mexe na sessão do request que publicou
+        if self.app is None:
+            return
+        try:
+            with self.app.app_context(), db.engine.begin() as connection:
+                connection.execute(StatusEvent.__table__.insert().values(
+                    user_id=user_id, origin=instance_registry.owner,
+                    data=json.dumps(event), created_at=datetime.utcnow()
+                ))
+        except Exception as e:
+            print(f"Erro ao gravar o evento de status: {e}")
+
+    def _relay_loop(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            try:
+                self.relay()
+            except Exception as e:
+                print(f"Erro ao repassar os eventos de status: {e}")
+
+    @staticmethod
+    def _format(event: str, data: dict) -> str:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Instância global dos eventos de status
+status_broker = StatusBroker()
@@ -0,0 +1,261 @@
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+Position = Tuple[int, int]  # (segmento, offset final do registro)
+
+# Cabeçalho de cada registro: tamanho do payload + CRC32
+_HEADER = struct.Struct('>II')
+
+
+class WebhookSpool:
+    """Log em disco, segmentado, onde os webhooks são gravados antes da confirmação
+
+    Cada processo usa um diretório próprio (slot) protegido por lock de arquivo.
+    Os registros são gravados com fsync em grupo; o checkpoint marca até onde
+    as mensagens já foram gravadas no banco e tudo depois dele é reprocessado
+    quando o backend reinicia.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv('WEBHOOK_SPOOL_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+        self.base_dir = os.getenv('WEBHOOK_SPOOL_DIR', os.path.join(
+            os.path.dirname(__file__), 'database', 'spool'
+        ))
+        self.segment_size = int(os.getenv('WEBHOOK_SPOOL_SEGMENT_MB', 16)) * 1024 * 1024
+        self.fsync_interval = int(os.getenv('WEBHOOK_SPOOL_FSYNC_MS', 5)) / 1000.0
+
+        self.directory: Optional[str] = None
+        self._lock_file = None
+        self._file = None
+        self._segment = 0
+        self._offset = 0
+
+        self._lock = threading.Lock()
+        self._synced = threading.Condition(self._lock)
+        self._written_seq = 0  # registros gravados no arquivo
+        self._synced_seq = 0  # registros com fsync concluído
+        self._sync_requested = threading.Event()
+        self._syncer: Optional[threading.Thread] = None
+
+        self._outstanding: 'OrderedDict[Position, bool]' = OrderedDict()  # posição -> gravado no banco
+        self._checkpoint: Position = (0, 0)
+        self._checkpoint_lock = threading.Lock()
+
+    def open(self) -> List[Tuple[Position, dict]]:
+        """Abre o spool deste processo e retorna os registros ainda não gravados no banco"""
+        os.makedirs(self.base_dir, exist_ok=True)
+        self.directory = self._acquire_slot()
+        self._checkpoint = self._read_checkpoint()
+
+        pending = list(self._read_after(self.directory, self._checkpoint))
+        segments = self._segments(self.directory)
+        self._segment = (segments[-1] if segments else self._checkpoint[0]) + 1
+        self._open_segment()
+
+        for position, _ in pending:
+            self._outstanding[position] = False
+
+        # Spools de processos que não existem mais são adotados por este
+        for record in self._adopt_orphans():
+            pending.append((self.append(record), record))
+
+        self._delete_segments_before(self._checkpoint[0])
+        return pending
+
+    def append(self, record: dict) -> Position:
+        """Grava o registro e só retorna depois do fsync"""
+        payload = json.dumps(record, separators=(',', ':')).encode('utf-8')
+        data = _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+        with self._lock:
+            if self._offset >= self.segment_size:
+                self._rotate()
+            self._file.write(data)
+            self._offset += len(data)
+            position = (self._segment, self._offset)
+            self._outstanding[position] = False
+            self._written_seq += 1
+            ticket = self._written_seq
+
+        self._ensure_syncer()
+        self._sync_requested.set()
+
+        with self._synced:
+            while self._synced_seq < ticket:
+                self._synced.wait()
+        return position
+
+    def commit(self, positions: List[Position]):
+        """Marca registros como gravados no banco e avança o checkpoint"""
+        with self._lock:
+            for position in positions:
+                if position in self._outstanding:
+                    self._outstanding[position] = True
+
+            checkpoint = None
+            while self._outstanding:
+                position, done = next(iter(self._outstanding.items()))
+                if not done:
+                    break
+                self._outstanding.popitem(last=False)
+                checkpoint = position
+
+        if checkpoint is None:
+            return
+        with self._checkpoint_lock:
+            if checkpoint <= self._checkpoint:
+                return
+            previous = self._checkpoint[0]
+            self._checkpoint = checkpoint
+            self._write_checkpoint(checkpoint)
+            if checkpoint[0] > previous:
+                self._delete_segments_before(checkpoint[0])
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._outstanding)
+
+    def _acquire_slot(self) -> str:
+        slot = 0
+        while True:
+            directory = os.path.join(self.base_dir, f'slot-{slot}')
+            os.makedirs(directory, exist_ok=True)
+            lock_file = open(os.path.join(directory, 'lock'), 'a')
+            if fcntl is None:
+                self._lock_file = lock_file
+                return directory
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                slot += 1
+                continue
+            self._lock_file = lock_file
+            return directory
+
+    def _adopt_orphans(self) -> Iterator[dict]:
+        if fcntl is None:
+            return
+        for name in sorted(os.listdir(self.base_dir)):
+            directory = os.path.join(self.base_dir, name)
+            if directory == self.directory or not name.startswith('slot-'):
+                continue
+            with open(os.path.join(directory, 'lock'), 'a') as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    continue  # Slot em uso por outro processo
+                checkpoint = self._read_checkpoint(directory)
+                for _, record in self._read_after(directory, checkpoint):
+                    yield record
+                for segment in self._segments(directory):
+                    os.remove(self._segment_path(segment, directory))
+
+    def _open_segment(self):
+        self._file = open(self._segment_path(self._segment), 'ab')
+        self._offset = self._file.tell()
+
+    def _rotate(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._segment += 1
+        self._open_segment()
+
+    def _ensure_syncer(self):
+        if self._syncer is not None and self._syncer.is_alive():
+            return
+        with self._lock:
+            if self._syncer is None or not self._syncer.is_alive():
+                self._syncer = threading.Thread(target=self._sync_loop, daemon=True)
+                self._syncer.start()
+
+    def _sync_loop(self):
+        while True:
+            self._sync_requested.wait()
+            self._sync_requested.clear()
+            # Aguardar um pouco para agrupar vários registros em um único fsync
+            time.sleep(self.fsync_interval)
+
+            with self._lock:
+                target = self._written_seq
+                self._file.flush()
+                fileno = self._file.fileno()
+            try:
+                os.fsync(fileno)
+            except OSError as e:
+                print(f"Erro no fsync do spool de webhooks: {e}")
+            with self._synced:
+                self._synced_seq = max(self._synced_seq, target)
+                self._synced.notify_all()
+
+    def _segment_path(self, segment: int, directory: Optional[str] = None) -> str:
+        return os.path.join(directory or self.directory, f'segment-{segment:012d}.log')
+
+    @staticmethod
+    def _segments(directory: str) -> List[int]:
+        segments = []
+        for name in os.listdir(directory):
+            if name.startswith('segment-') and name.endswith('.log'):
+                segments.append(int(name[8:-4]))
+        return sorted(segments)
+
+    def _read_after(self, directory: str, checkpoint: Position) -> Iterator[Tuple[Position, dict]]:
+        for segment in self._segments(directory):
+            if segment < checkpoint[0]:
+                continue
+            with open(self._segment_path(segment, directory), 'rb') as segment_file:
+                offset = 0
+                while True:
+                    header = segment_file.read(_HEADER.size)
+                    if len(header) < _HEADER.size:
+                        break
+                    size, crc = _HEADER.unpack(header)
+                    payload = segment_file.read(size)
+                    if len(payload) < size or zlib.crc32(payload) != crc:
+                        # Registro incompleto (queda durante a escrita)
+                        print(f"Registro corrompido ignorado no spool {directory}, segmento {segment}")
+                        break
+                    offset += _HEADER.size + size
+                    if (segment, offset) <= checkpoint:
+                        continue
+                    yield (segment, offset), json.loads(payload.decode('utf-8'))
+
+    def _read_checkpoint(self, directory: Optional[str] = None) -> Position:
+        path = os.path.join(directory or self.directory, 'checkpoint')
+        try:
+            with open(path) as checkpoint_file:
+                segment, offset = checkpoint_file.read().split()
+                return int(segment), int(offset)
+        except (OSError, ValueError):
+            return (0, 0)
+
+    def _write_checkpoint(self, checkpoint: Position):
+        path = os.path.join(self.directory, 'checkpoint')
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as checkpoint_file:
+            checkpoint_file.write(f'{checkpoint[0]} {checkpoint[1]}')
+        os.replace(temp_path, path)
+
+    def _delete_segments_before(self, segment: int):
+        for old_segment in self._segments(self.directory):
+            if old_segment >= segment:
+                break
+            try:
+                os.remove(self._segment_path(old_segment))
+            except OSError:
+                pass
+
+# Instância global do spool de webhooks
+webhook_spool = WebhookSpool()
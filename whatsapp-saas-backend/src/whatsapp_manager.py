@@ -1,110 +1,332 @@
 import os
 import sys
 import json
+import random
 import threading
 import time
 import requests
+from collections import deque
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 import subprocess
 import signal
+import tempfile
+from sqlalchemy.engine import make_url
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from src.models import db
+from src.models.bot import Bot
+from src.instance_monitor import InstanceMonitor
+from src.status_events import status_broker
+from src.instance_registry import instance_registry
+from src.bot_transport import BotHttpClient, PortAllocator, bot_url
+
+# Status reportado pelo bot Node -> status do Bot no banco
+NODE_STATUS_TO_BOT = {
+    'ready': 'active',
+    'authenticated': 'connecting',
+    'qr_ready': 'connecting',
+    'disconnected': 'connecting',
+    'auth_failure': 'error',
+    'error': 'error'
+}
+
+# Linhas finais de stdout/stderr guardadas para diagnosticar quedas
+OUTPUT_TAIL_LINES = 50
+
+# Status em que o bot ainda está conectando (consultado com mais frequência)
+SETTLED_NODE_STATUSES = ('ready',)
+
+# Prefixo das linhas de evento que o bot Node escreve no stdout (ver whatsapp_bot.js)
+EVENT_PREFIX = '@@dashurx-event '
+
+
+def bot_status_for(node_status: Optional[str]) -> Optional[str]:
+    return NODE_STATUS_TO_BOT.get(node_status)
+
+
+def parse_event(line: str) -> Optional[dict]:
+    """Evento de uma linha do stdout do bot; None se for uma linha de log comum"""
+    if not line.startswith(EVENT_PREFIX):
+        return None
+    try:
+        event = json.loads(line[len(EVENT_PREFIX):])
+    except ValueError:
+        return None
+    return event if isinstance(event, dict) else None
+
 
 class WhatsAppManager:
-    """Gerenciador de instâncias de bots do WhatsApp"""
+    """Gerenciador de instâncias de bots do WhatsApp
+
+    Cada instância é supervisionada: se o processo Node cair sem ter sido
+    parado pela API, ele é reiniciado com backoff exponencial (com jitter),
+    respeitando um limite de reinícios por hora. Todas as instâncias são
+    acompanhadas por um único loop (InstanceMonitor), sem threads por bot.
+    
+    É o único registro de processos de bots: as duas APIs de ciclo de vida
+    (/api/whatsapp e /api/whatsapp-sessions) iniciam e param bots por aqui.
+    Um lock por bot serializa início, parada e reinício, então dois pedidos
+    simultâneos nunca sobem dois Chromium com a mesma sessão e porta.
+    
+    Cada processo recebe um endereço emprestado: um socket Unix em BOT_RUN_DIR
+    (padrão em sistemas POSIX, sem a pilha TCP de loopback) ou uma porta livre
+    da faixa WHATSAPP_BASE_PORT + BOT_PORT_RANGE_SIZE, devolvida quando ele sai.
+    
+    Status e QR code chegam por eventos que o bot escreve no stdout; a tabela
+    em memória (`instances`) é a fonte de verdade e só bots que não enviam
+    eventos são consultados por HTTP.
+    
+    Com vários workers, só o que obtém o lock de arquivo é supervisor e dono
+    dos processos; ele publica o estado na tabela bot_instances (InstanceRegistry).
+    Nos demais, os mesmos métodos leem o registro e enviam pedidos de início e
+    parada que o supervisor aplica, e um seguidor assume se o supervisor sair.
+    """
     
     def __init__(self):
         self.instances: Dict[int, Dict] = {}  # bot_id -> instance_data
+        self.supervision: Dict[int, Dict] = {}  # bot_id -> histórico de quedas e reinícios
         self.base_port = int(os.getenv('WHATSAPP_BASE_PORT', 8000))
+        self.transport = os.getenv('BOT_TRANSPORT', 'unix' if os.name == 'posix' else 'tcp').lower()
+        self.run_dir = os.getenv('BOT_RUN_DIR', os.path.join(tempfile.gettempdir(), 'dashurx'))
+        self.ports = PortAllocator(self.base_port, int(os.getenv('BOT_PORT_RANGE_SIZE', 10000)))
+        self.node_binary = os.getenv('WHATSAPP_NODE_BIN', 'node')
+        self.webhook_base_url = os.getenv('WHATSAPP_WEBHOOK_BASE_URL', 'http://localhost:5000').rstrip('/')
         self.whatsapp_module_path = os.path.join(
             os.path.dirname(__file__), 
             'whatsapp_module'
         )
+        self.restart_base_delay = float(os.getenv('BOT_RESTART_BASE_DELAY', 2))
+        self.restart_max_delay = float(os.getenv('BOT_RESTART_MAX_DELAY', 300))
+        self.max_restarts_per_hour = int(os.getenv('BOT_RESTART_MAX_PER_HOUR', 10))
+        self.stable_seconds = int(os.getenv('BOT_RESTART_STABLE_SECONDS', 300))
+        self.autostart = os.getenv('BOT_AUTOSTART', 'true').lower() in ('1', 'true', 'yes')
+        self.status_interval_fast = float(os.getenv('BOT_STATUS_INTERVAL_FAST', 2))
+        self.status_interval_slow = float(os.getenv('BOT_STATUS_INTERVAL_SLOW', 30))
+        self.start_timeout = float(os.getenv('BOT_START_TIMEOUT', 120))
+        self.stop_timeout = float(os.getenv('BOT_STOP_TIMEOUT', 10))
+        
+        # Cliente HTTP compartilhado: conexões keep-alive com cada bot (um socket ou porta por bot)
+        self.http = BotHttpClient()
+        self.send_timeout = float(os.getenv('BOT_HTTP_SEND_TIMEOUT', 30))
+        
+        self.monitor = InstanceMonitor(workers=int(os.getenv('BOT_MONITOR_WORKERS', 4)))
+        self.app = None
+        self.registry = instance_registry
+        self.supervisor = True  # False nos workers que só seguem o registro
+        self._applying = set()  # bots com pedido de outro worker em andamento
+        self._stop_events: Dict[int, threading.Event] = {}
+        self._bot_locks: Dict[int, threading.RLock] = {}
+        self._bot_locks_lock = threading.Lock()
+        self._callbacks_lock = threading.Lock()
+        self._supervisor_lock = None
+    
+    def init_app(self, app, autostart: bool = True):
+        """Elege o supervisor entre os workers; ele religa, em segundo plano, os bots que estavam rodando"""
+        self.app = app
+        self.registry.init_app(app)
+        if not autostart:
+            return  # Processo que não atende requisições (pai do reloader)
+        
+        self._supervisor_lock = self._acquire_supervisor_lock()
+        if self._supervisor_lock is not None:
+            self._become_supervisor()
+        else:
+            self.supervisor = False
+            self.monitor.call_later(self.registry.poll_seconds, self.monitor.submit, self._follow)
         
     def create_instance(self, bot_id: int, bot_data: dict) -> bool:
-        """Cria uma nova instância do bot"""
-        try:
+        """Cria uma nova instância do bot e aguarda o handshake (uso fora de requisições)"""
+        done = threading.Event()
+        result = {'ok': False}
+        
+        def on_done(ok: bool, error: Optional[str]):
+            result['ok'] = ok
+            done.set()
+        
+        self.start_instance(bot_id, bot_data, on_done=on_done)
+        done.wait(self.start_timeout + self.stop_timeout + 5)
+        return result['ok']
+    
+    def start_instance(self, bot_id: int, bot_data: dict,
+                       on_done: Optional[Callable[[bool, Optional[str]], None]] = None,
+                       on_step: Optional[Callable[[str], None]] = None):
+        """Inicia o bot sem bloquear
+        
+        on_step(etapa) informa o progresso; on_done(ok, erro) roda no pool do monitor
+        quando o bot confirma a inicialização pelo stdout (handshake), sai ou estoura o prazo.
+        """
+        on_done = on_done or (lambda ok, error: None)
+        on_step = on_step or (lambda step: None)
+        if not self.supervisor:
+            self._start_remote(bot_id, on_done, on_step)
+            return
+        self.registry.desire(bot_id, 'running')
+        self._start(bot_id, bot_data, on_done, on_step)
+    
+    def _start(self, bot_id: int, bot_data: dict, on_done: Callable, on_step: Callable):
+        with self._bot_lock(bot_id):
             if bot_id in self.instances:
-                self.stop_instance(bot_id)
-            
-            port = self.base_port + bot_id
-            
-            # Criar diretório de sessões se não existir
-            sessions_dir = os.path.join(self.whatsapp_module_path, 'sessions')
-            os.makedirs(sessions_dir, exist_ok=True)
+                # A porta e a sessão só ficam livres quando o processo anterior terminar
+                on_step('stopping_previous')
+                self._stop_local(bot_id, on_done=lambda: self._start(bot_id, bot_data, on_done, on_step))
+                return
             
-            # Configurar argumentos para o bot
-            bot_script = os.path.join(self.whatsapp_module_path, 'whatsapp_bot.js')
-            webhook_url = bot_data.get('webhook_url', '')
+            # Início manual: zera o backoff e o limite, mas mantém o histórico de quedas
+            supervision = self._supervision(bot_id)
+            supervision['attempt'] = 0
+            supervision['restarts'].clear()
+            supervision['state'] = 'running'
+            stop_event = threading.Event()
+            self._stop_events[bot_id] = stop_event
             
-            # Iniciar o processo do bot
+            on_step('spawning')
+            try:
+                instance = self._spawn(bot_id, bot_data, on_started=on_done)
+            except Exception as e:
+                stop_event.set()
+                supervision['state'] = 'stopped'
+                print(f"Erro ao criar instância do bot {bot_id}: {e}")
+                on_done(False, str(e))
+                return
+        
+        if 'on_started' in instance:
+            on_step('waiting_handshake')
+        self.monitor.call_later(self.start_timeout, self._check_started, bot_id, instance)
+    
+    def _spawn(self, bot_id: int, bot_data: dict, on_started: Optional[Callable] = None) -> dict:
+        """Inicia o processo Node do bot e o registra no monitor (chamado com o lock do bot)"""
+        port, socket_path = self._lease_endpoint(bot_id)
+        env = {**os.environ}
+        if port is not None:
+            env['PORT'] = str(port)
+        
+        # Criar diretório de sessões se não existir
+        sessions_dir = os.path.join(self.whatsapp_module_path, 'sessions')
+        os.makedirs(sessions_dir, exist_ok=True)
+        
+        # Configurar argumentos para o bot
+        bot_script = os.path.join(self.whatsapp_module_path, 'whatsapp_bot.js')
+        
+        # Iniciar o processo do bot em um grupo próprio, para parar o Chromium junto
+        try:
             process = subprocess.Popen([
-                'node', bot_script, str(bot_id), str(port), webhook_url
+                self.node_binary, bot_script, str(bot_id), socket_path or str(port), self.webhook_url_for(bot_id)
             ], cwd=self.whatsapp_module_path,
                stdout=subprocess.PIPE, 
                stderr=subprocess.PIPE,
-               env={**os.environ, 'PORT': str(port)})
-            
-            self.instances[bot_id] = {
-                'process': process,
-                'port': port,
-                'status': 'starting',
-                'created_at': datetime.utcnow(),
-                'bot_data': bot_data,
-                'qr_code': None
-            }
-            
-            # Aguardar um pouco para o processo inicializar
-            time.sleep(3)
-            
-            # Verificar se o processo ainda está rodando
-            if process.poll() is not None:
-                # Processo falhou
-                stderr_output = process.stderr.read().decode('utf-8')
-                print(f"Erro ao iniciar bot {bot_id}: {stderr_output}")
-                return False
-            
-            # Monitorar o processo em thread separada
-            threading.Thread(
-                target=self._monitor_instance, 
-                args=(bot_id,), 
-                daemon=True
-            ).start()
-            
-            return True
-            
-        except Exception as e:
-            print(f"Erro ao criar instância do bot {bot_id}: {e}")
-            return False
+               env=env,
+               start_new_session=hasattr(os, 'killpg'))
+        except Exception:
+            self.ports.release(port)
+            raise
+        
+        instance = {
+            'process': process,
+            'port': port,
+            'socket_path': socket_path,
+            'status': 'starting',
+            'created_at': datetime.utcnow(),
+            'started_at': time.time(),
+            'status_checked_at': 0.0,
+            'bot_data': bot_data,
+            'qr_code': None,
+            'push': False,  # True depois do primeiro evento recebido pelo stdout
+            'output': deque(maxlen=OUTPUT_TAIL_LINES)
+        }
+        if on_started is not None:
+            instance['on_started'] = on_started  # Chamado no handshake (primeiro evento)
+        self.instances[bot_id] = instance
+        
+        def on_output(stream: str, line: str):
+            event = parse_event(line) if stream == 'stdout' else None
+            if event is not None:
+                self._on_event(bot_id, instance, event)
+            else:
+                instance['output'].append(line)
+        
+        self.monitor.watch(
+            process,
+            on_output=on_output,
+            on_exit=lambda exit_code: self._on_exit(bot_id, instance, exit_code)
+        )
+        self.monitor.call_later(self.status_interval_fast, self._poll_status, bot_id, instance)
+        self.monitor.submit(self._record, bot_id, instance)
+        return instance
     
     def stop_instance(self, bot_id: int) -> bool:
-        """Para uma instância do bot"""
-        try:
-            if bot_id not in self.instances:
+        """Para uma instância do bot e aguarda o processo terminar (uso fora de requisições)"""
+        done = threading.Event()
+        if not self.stop_instance_async(bot_id, on_done=done.set):
+            return False
+        done.wait(self.stop_timeout + 5)
+        return True
+    
+    def stop_instance_async(self, bot_id: int, on_done: Optional[Callable[[], None]] = None) -> bool:
+        """Pede a parada do bot sem bloquear; on_done() roda quando o processo terminar"""
+        if not self.supervisor:
+            return self._stop_remote(bot_id, on_done)
+        self.registry.desire(bot_id, 'stopped')
+        return self._stop_local(bot_id, on_done)
+    
+    def _stop_local(self, bot_id: int, on_done: Optional[Callable[[], None]] = None) -> bool:
+        with self._bot_lock(bot_id):
+            instance = self.instances.get(bot_id)
+            if instance is None:
                 return False
             
-            instance = self.instances[bot_id]
-            process = instance['process']
+            # Parada pedida pela API: o supervisor não deve reiniciar
+            stop_event = self._stop_events.get(bot_id)
+            if stop_event is not None:
+                stop_event.set()
+            self._supervision(bot_id)['state'] = 'stopped'
+            instance['status'] = 'stopping'
             
-            # Tentar parar graciosamente
-            process.terminate()
+            with self._callbacks_lock:
+                instance.setdefault('on_stopped', []).append(on_done or (lambda: None))
+                exited = instance.get('exited', False)
+            if exited:
+                # O processo já tinha caído (ex.: aguardando reinício): nada a esperar
+                self._stopped(bot_id, instance)
+                return True
             
-            # Aguardar até 10 segundos
             try:
-                process.wait(timeout=10)
-            except subprocess.TimeoutExpired:
-                # Forçar parada
-                process.kill()
-                process.wait()
-            
-            del self.instances[bot_id]
+                # Tentar parar graciosamente; quem não sair no prazo é finalizado com o grupo
+                instance['process'].terminate()
+            except OSError:
+                pass
+            self.monitor.call_later(self.stop_timeout, self._kill, instance['process'])
             return True
-            
-        except Exception as e:
-            print(f"Erro ao parar instância do bot {bot_id}: {e}")
-            return False
+    
+    def is_running(self, bot_id: int) -> bool:
+        """True se o processo do bot está de pé e não está sendo parado"""
+        if not self.supervisor:
+            return self.registry.is_live(self.registry.get(bot_id))
+        instance = self.instances.get(bot_id)
+        return (instance is not None and not instance.get('exited')
+                and instance['status'] != 'stopping' and instance['process'].poll() is None)
+    
+    def port_for(self, bot_id: int) -> Optional[int]:
+        """Porta TCP do bot em execução; None se parado ou escutando em socket Unix"""
+        endpoint = self._endpoint(bot_id)
+        return endpoint[0] if endpoint is not None else None
+    
+    def webhook_url_for(self, bot_id: int) -> str:
+        """Webhook interno que recebe as mensagens do bot (ver webhook_receiver)"""
+        return f'{self.webhook_base_url}/api/whatsapp/webhook/{bot_id}'
     
     def get_instance_status(self, bot_id: int) -> Optional[dict]:
         """Retorna o status de uma instância"""
+        if not self.supervisor:
+            instance = self.registry.get(bot_id)
+            if not self.registry.is_live(instance):
+                return None
+            return {'status': instance['status'], 'qrCode': instance['qr_code']}
+        
         if bot_id not in self.instances:
             return None
         
@@ -114,17 +336,11 @@ class WhatsAppManager:
         if process.poll() is not None:
             return {'status': 'stopped', 'message': 'Processo parado'}
         
-        # Tentar obter status via API
-        try:
-            port = instance['port']
-            response = requests.get(f'http://localhost:{port}/status', timeout=5)
-            if response.status_code == 200:
-                status_data = response.json()
-                instance['status'] = status_data.get('status', 'unknown')
-                instance['qr_code'] = status_data.get('qrCode')
+        # Sem eventos pelo stdout, o monitor consulta o bot; só vai ao processo se o valor estiver velho
+        if not instance['push'] and time.time() - instance['status_checked_at'] > self.status_interval_fast:
+            status_data = self._fetch_status(instance)
+            if status_data is not None:
                 return status_data
-        except requests.RequestException:
-            pass
         
         return {
             'status': instance['status'],
@@ -133,12 +349,19 @@ class WhatsAppManager:
     
     def get_instance_qr(self, bot_id: int) -> Optional[str]:
         """Retorna o QR code de uma instância"""
+        if not self.supervisor:
+            instance = self.registry.get(bot_id)
+            return instance['qr_code'] if self.registry.is_live(instance) else None
+        
         if bot_id not in self.instances:
             return None
-            
+        
+        instance = self.instances[bot_id]
+        if instance['push']:
+            return instance['qr_code']
+        
         try:
-            port = self.instances[bot_id]['port']
-            response = requests.get(f'http://localhost:{port}/qr', timeout=5)
+            response = self.http.get(self._url(instance, '/qr'))
             if response.status_code == 200:
                 data = response.json()
                 if data.get('status'):
@@ -151,15 +374,14 @@ class WhatsAppManager:
     def send_message(self, bot_id: int, number: str, message: str) -> bool:
         """Envia mensagem através de uma instância"""
         try:
-            if bot_id not in self.instances:
+            endpoint = self._endpoint(bot_id)
+            if endpoint is None:
                 return False
             
-            port = self.instances[bot_id]['port']
-            
-            response = requests.post(f'http://localhost:{port}/send-message', json={
+            response = self.http.post(bot_url(*endpoint, '/send-message'), json={
                 'number': number,
                 'message': message
-            }, timeout=30)
+            }, timeout=self.send_timeout)
             
             return response.status_code == 200
             
@@ -170,16 +392,15 @@ class WhatsAppManager:
     def send_media(self, bot_id: int, number: str, media_url: str, caption: str = '') -> bool:
         """Envia mídia através de uma instância"""
         try:
-            if bot_id not in self.instances:
+            endpoint = self._endpoint(bot_id)
+            if endpoint is None:
                 return False
             
-            port = self.instances[bot_id]['port']
-            
-            response = requests.post(f'http://localhost:{port}/send-media', json={
+            response = self.http.post(bot_url(*endpoint, '/send-media'), json={
                 'number': number,
                 'mediaUrl': media_url,
                 'caption': caption
-            }, timeout=30)
+            }, timeout=self.send_timeout)
             
             return response.status_code == 200
             
@@ -187,37 +408,462 @@ class WhatsAppManager:
             print(f"Erro ao enviar mídia pelo bot {bot_id}: {e}")
             return False
     
-    def _monitor_instance(self, bot_id: int):
-        """Monitora uma instância do bot"""
-        while bot_id in self.instances:
+    def supervision_status(self, bot_id: int) -> Optional[dict]:
+        """Reinícios, último código de saída e estado do supervisor de um bot"""
+        if not self.supervisor:
+            instance = self.registry.get(bot_id)
+            return instance['supervision'] if instance is not None else None
+        supervision = self.supervision.get(bot_id)
+        if supervision is None:
+            return None
+        return {
+            'state': supervision['state'],
+            'restart_count': supervision['restart_count'],
+            'last_exit_code': supervision['last_exit_code'],
+            'last_exit_at': supervision['last_exit_at'],
+            'last_output': supervision['last_output'],
+            'next_restart_at': supervision['next_restart_at']
+        }
+    
+    def _endpoint(self, bot_id: int) -> Optional[Tuple[Optional[int], Optional[str]]]:
+        """(porta, socket) do bot em execução"""
+        if not self.supervisor:
+            # Os bots escutam no host local: qualquer worker do mesmo host fala direto com eles
+            instance = self.registry.get(bot_id)
+            if not self.registry.is_live(instance):
+                return None
+        else:
+            instance = self.instances.get(bot_id)
+            if instance is None:
+                return None
+        return instance['port'], instance['socket_path']
+    
+    @staticmethod
+    def _url(instance: dict, path: str) -> str:
+        return bot_url(instance['port'], instance['socket_path'], path)
+    
+    def _lease_endpoint(self, bot_id: int) -> Tuple[Optional[int], Optional[str]]:
+        if self.transport == 'unix':
+            # Um socket por bot; o próprio bot remove o arquivo que sobrou de uma execução anterior
+            os.makedirs(self.run_dir, mode=0o700, exist_ok=True)
+            return None, os.path.join(self.run_dir, f'bot_{bot_id}.sock')
+        return self.ports.acquire(), None
+    
+    def _release_endpoint(self, instance: dict):
+        self.ports.release(instance['port'])
+        if instance['socket_path']:
             try:
-                instance = self.instances[bot_id]
-                process = instance['process']
-                
-                # Verificar se o processo ainda está rodando
-                if process.poll() is not None:
-                    # Processo parou
-                    instance['status'] = 'stopped'
-                    print(f"Bot {bot_id} parou inesperadamente")
-                    break
-                
-                # Verificar status via API
-                status_data = self.get_instance_status(bot_id)
-                if status_data:
-                    instance['status'] = status_data.get('status', 'unknown')
-                    instance['qr_code'] = status_data.get('qrCode')
-                
-                time.sleep(5)  # Verificar a cada 5 segundos
-                
-            except Exception as e:
-                print(f"Erro no monitoramento do bot {bot_id}: {e}")
-                break
+                os.unlink(instance['socket_path'])
+            except OSError:
+                pass
+    
+    def _fetch_status(self, instance: dict) -> Optional[dict]:
+        try:
+            response = self.http.get(self._url(instance, '/status'))
+            if response.status_code == 200:
+                status_data = response.json()
+                if instance['push']:
+                    return status_data  # Um evento chegou durante a consulta e é mais recente
+                instance['status'] = status_data.get('status', 'unknown')
+                instance['qr_code'] = status_data.get('qrCode')
+                instance['status_checked_at'] = time.time()
+                return status_data
+        except (requests.RequestException, ValueError):
+            pass
+        return None
+    
+    def _on_event(self, bot_id: int, instance: dict, data: dict):
+        """Evento do bot (roda na thread do monitor: atualiza a memória e delega o banco)"""
+        if not instance['push']:
+            instance['push'] = True
+            self._started(instance, True)  # Handshake: o processo subiu e o canal de eventos funciona
+        if 'status' not in data:
+            return  # 'hello' sem status: apenas confirma o canal de eventos
+        
+        instance['status'] = data['status']
+        instance['qr_code'] = data.get('qrCode')
+        instance['status_checked_at'] = time.time()
+        
+        bot_status = bot_status_for(instance['status'])
+        if bot_status and bot_status != instance.get('bot_status'):
+            instance['bot_status'] = bot_status
+            self.monitor.submit(self._sync_bot_status, bot_id, instance)
+        self.monitor.submit(self._record, bot_id, instance)
+        self._publish(bot_id, instance, instance.get('bot_status'))
+    
+    def _sync_bot_status(self, bot_id: int, instance: dict):
+        # Lê o valor atual em vez do evento: gravações fora de ordem no pool convergem
+        if self.instances.get(bot_id) is instance and instance.get('bot_status'):
+            self._set_bot_status(bot_id, instance['bot_status'])
+    
+    def _poll_status(self, bot_id: int, instance: dict):
+        """Consulta periódica do status: rápida enquanto conecta, lenta depois de pronto"""
+        if self.instances.get(bot_id) is not instance or instance['process'].poll() is not None:
+            return  # Instância substituída ou encerrada
+        if instance['push']:
+            return  # O bot envia os próprios eventos; não é preciso consultar
+        
+        if self._fetch_status(instance) is not None:
+            bot_status = bot_status_for(instance['status'])
+            if bot_status and bot_status != instance.get('bot_status'):
+                instance['bot_status'] = bot_status
+                self._set_bot_status(bot_id, bot_status)
+        
+        settled = instance['status'] in SETTLED_NODE_STATUSES
+        interval = self.status_interval_slow if settled else self.status_interval_fast
+        self.monitor.call_later(interval, self._poll_status, bot_id, instance)
+    
+    def _on_exit(self, bot_id: int, instance: dict, exit_code: int):
+        """Chamado pelo monitor quando o processo de um bot termina"""
+        # O Chromium de um Node que caiu seguraria a sessão e impediria o reinício
+        self._kill_group(instance['process'])
+        self._release_endpoint(instance)
+        with self._callbacks_lock:
+            instance['exited'] = True
+            stopping = 'on_stopped' in instance
+        if stopping:
+            self._started(instance, False, 'Bot parado durante a inicialização')
+            self._stopped(bot_id, instance)
+            return
+        
+        stop_event = self._stop_events.get(bot_id)
+        if self.instances.get(bot_id) is not instance or stop_event is None or stop_event.is_set():
+            self._started(instance, False, 'Bot parado durante a inicialização')
+            return  # Parada pedida pela API ou instância já substituída
+        
+        if 'on_started' in instance:
+            # Saiu antes do handshake: falha de inicialização, não uma queda a ser reiniciada
+            stop_event.set()
+            with self._bot_lock(bot_id):
+                if self.instances.get(bot_id) is instance:
+                    self.instances.pop(bot_id, None)
+            self._supervision(bot_id)['state'] = 'stopped'
+            self.monitor.submit(self._release, bot_id)
+            error = self._tail(instance) or f'Código de saída {exit_code}'
+            print(f"Erro ao iniciar bot {bot_id}: {error}")
+            self._started(instance, False, error)
+            return
+        
+        supervision = self._supervision(bot_id)
+        now = time.time()
+        
+        instance['status'] = 'stopped'
+        supervision['last_exit_code'] = exit_code
+        supervision['last_exit_at'] = datetime.utcnow().isoformat()
+        supervision['last_output'] = self._tail(instance)
+        print(f"Bot {bot_id} parou inesperadamente (código {exit_code})")
+        
+        # Um processo que ficou de pé por tempo suficiente recomeça o backoff do início
+        if now - instance['started_at'] >= self.stable_seconds:
+            supervision['attempt'] = 0
+        
+        restarts = supervision['restarts']
+        while restarts and now - restarts[0] > 3600:
+            restarts.popleft()
+        if len(restarts) >= self.max_restarts_per_hour:
+            supervision['state'] = 'gave_up'
+            supervision['next_restart_at'] = None
+            self._set_bot_status(bot_id, 'error')
+            self._publish(bot_id, instance, 'error', running=False)
+            self.monitor.submit(self._record, bot_id, instance)
+            print(f"Bot {bot_id} caiu {len(restarts)} vezes na última hora; reinício automático suspenso")
+            return
+        
+        # Backoff exponencial com jitter, para não reiniciar vários bots em sincronia
+        delay = min(self.restart_max_delay, self.restart_base_delay * 2 ** supervision['attempt'])
+        delay = random.uniform(delay / 2, delay)
+        supervision['attempt'] += 1
+        supervision['state'] = 'backoff'
+        supervision['next_restart_at'] = datetime.utcfromtimestamp(now + delay).isoformat()
+        self._set_bot_status(bot_id, 'error')
+        self._publish(bot_id, instance, 'error', running=False)
+        self.monitor.submit(self._record, bot_id, instance)
+        
+        self.monitor.call_later(delay, self._respawn, bot_id, instance, stop_event, delay)
+    
+    def _respawn(self, bot_id: int, previous: dict, stop_event: threading.Event, delay: float):
+        with self._bot_lock(bot_id):
+            if stop_event.is_set() or self.instances.get(bot_id) is not previous:
+                return  # Parado ou reiniciado manualmente durante a espera
+            
+            supervision = self._supervision(bot_id)
+            supervision['restarts'].append(time.time())
+            supervision['restart_count'] += 1
+            supervision['state'] = 'running'
+            supervision['next_restart_at'] = None
+            print(f"Reiniciando bot {bot_id} (reinício {supervision['restart_count']}, aguardou {delay:.1f}s)")
+            
+            # Se morrer de novo na inicialização, o monitor avisa e o ciclo se repete
+            instance = self._spawn(bot_id, previous['bot_data'])
+        self._set_bot_status(bot_id, 'connecting')
+        self._publish(bot_id, instance, 'connecting')
+    
+    def _started(self, instance: dict, ok: bool, error: Optional[str] = None):
+        """Entrega o resultado da inicialização uma única vez"""
+        callback = instance.pop('on_started', None)
+        if callback is not None:
+            self.monitor.submit(callback, ok, error)
+    
+    def _check_started(self, bot_id: int, instance: dict):
+        if 'on_started' not in instance or instance.get('exited'):
+            return
+        self._started(instance, False, f'O bot não confirmou a inicialização em {self.start_timeout:.0f}s')
+        if self.instances.get(bot_id) is instance:
+            self._stop_local(bot_id)
+    
+    def _stopped(self, bot_id: int, instance: dict):
+        with self._callbacks_lock:
+            callbacks: List[Callable] = instance.pop('on_stopped', [])
+        instance['status'] = 'stopped'
+        with self._bot_lock(bot_id):
+            if self.instances.get(bot_id) is instance:
+                self.instances.pop(bot_id, None)
+        self.monitor.submit(self._release, bot_id)
+        for callback in callbacks:
+            self.monitor.submit(callback)
+    
+    @classmethod
+    def _kill(cls, process: subprocess.Popen):
+        if process.poll() is None:
+            process.kill()  # Não saiu no prazo após o SIGTERM
+        cls._kill_group(process)
+    
+    @staticmethod
+    def _kill_group(process: subprocess.Popen):
+        """Finaliza o que sobrou do grupo do bot (Chromium e seus filhos)"""
+        if not hasattr(os, 'killpg'):
+            return
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+    
+    @staticmethod
+    def _publish(bot_id: int, instance: dict, status: Optional[str], running: bool = True):
+        """Envia o estado aos painéis abertos do dono do bot (SSE)"""
+        status_broker.publish_session(instance['bot_data'].get('user_id'), bot_id, status,
+                                      instance['qr_code'] if running else None, running)
+    
+    def _bot_lock(self, bot_id: int) -> threading.RLock:
+        # Reentrante: o início chama a parada do processo anterior com o lock já adquirido
+        with self._bot_locks_lock:
+            return self._bot_locks.setdefault(bot_id, threading.RLock())
+    
+    def _supervision(self, bot_id: int) -> dict:
+        if bot_id not in self.supervision:
+            self.supervision[bot_id] = {
+                'state': 'stopped',  # running, backoff, gave_up, stopped
+                'attempt': 0,
+                'restart_count': 0,
+                'restarts': deque(),
+                'last_exit_code': None,
+                'last_exit_at': None,
+                'last_output': None,
+                'next_restart_at': None
+            }
+        return self.supervision[bot_id]
+    
+    def _set_bot_status(self, bot_id: int, status: str):
+        """Mantém o Bot.status do banco coerente com o processo"""
+        if self.app is None:
+            return
+        try:
+            with self.app.app_context():
+                bot = db.session.get(Bot, bot_id)
+                if bot is not None and bot.status != status:
+                    bot.status = status
+                    db.session.commit()
+        except Exception as e:
+            print(f"Erro ao atualizar status do bot {bot_id}: {e}")
+    
+    def _become_supervisor(self):
+        self.supervisor = True
+        self.monitor.call_later(self.registry.heartbeat_seconds, self._heartbeat)
+        self.monitor.call_later(self.registry.poll_seconds, self._reconcile)
+        threading.Thread(target=self._take_over, daemon=True).start()
+    
+    def _take_over(self):
+        # Processos de um supervisor que caiu continuam de pé segurando portas e sessões
+        for instance in self.registry.orphans():
+            if self._is_bot_process(instance['pid']):
+                print(f"Finalizando o processo órfão do bot {instance['bot_id']} (pid {instance['pid']})")
+                try:
+                    os.killpg(instance['pid'], signal.SIGKILL)
+                except (ProcessLookupError, PermissionError):
+                    pass
+            self.registry.release(instance['bot_id'])
+            with self.app.app_context():
+                bot = db.session.get(Bot, instance['bot_id'])
+                user_id, status = (bot.user_id, bot.status) if bot is not None else (None, None)
+            status_broker.publish_session(user_id, instance['bot_id'], status, None, running=False)
+        if self.autostart:
+            self._autostart()
+    
+    def _follow(self):
+        """Worker seguidor: assume a supervisão se o supervisor sair (o SSE vem de status_broker)"""
+        self._supervisor_lock = self._acquire_supervisor_lock()
+        if self._supervisor_lock is not None:
+            print(f"Worker {self.registry.owner} assumiu a supervisão dos bots")
+            self._become_supervisor()
+            return
+        self.monitor.call_later(self.registry.poll_seconds, self.monitor.submit, self._follow)
+    
+    def _start_remote(self, bot_id: int, on_done: Callable, on_step: Callable):
+        generation = self.registry.request(bot_id, 'running')
+        if generation is None:
+            on_done(False, 'Falha ao registrar o pedido para o supervisor')
+            return
+        on_step('waiting_supervisor')
+        deadline = time.time() + self.start_timeout + self.stop_timeout + 5
+        self.monitor.submit(self._await_request, bot_id, generation, deadline,
+                            lambda error: on_done(error is None, error))
+    
+    def _stop_remote(self, bot_id: int, on_done: Optional[Callable[[], None]]) -> bool:
+        instance = self.registry.get(bot_id)
+        if instance is None or (instance['desired_state'] == 'stopped' and not self.registry.is_live(instance)):
+            return False
+        generation = self.registry.request(bot_id, 'stopped')
+        if generation is None:
+            return False
+        on_done = on_done or (lambda: None)
+        deadline = time.time() + self.stop_timeout + 5
+        self.monitor.submit(self._await_request, bot_id, generation, deadline, lambda error: on_done())
+        return True
+    
+    def _await_request(self, bot_id: int, generation: int, deadline: float, callback: Callable):
+        """Aguarda, sem ocupar o pool, o supervisor aplicar o pedido; callback(erro)"""
+        instance = self.registry.get(bot_id)
+        if instance is None:
+            callback('Bot não encontrado')
+        elif instance['applied_generation'] >= generation:
+            callback(instance['error'])
+        elif time.time() >= deadline:
+            callback('O supervisor não aplicou o pedido no prazo')
+        else:
+            self.monitor.call_later(self.registry.poll_seconds, self.monitor.submit,
+                                    self._await_request, bot_id, generation, deadline, callback)
+    
+    def _reconcile(self):
+        self.monitor.submit(self._apply_requests)
+        self.monitor.call_later(self.registry.poll_seconds, self._reconcile)
+    
+    def _apply_requests(self):
+        """Aplica os pedidos de início e parada gravados pelos outros workers"""
+        from src.lifecycle_jobs import lifecycle_jobs  # lifecycle_jobs depende deste módulo
+        
+        for instance in self.registry.pending():
+            bot_id, generation = instance['bot_id'], instance['generation']
+            if bot_id in self._applying:
+                continue
+            with self.app.app_context():
+                bot = db.session.get(Bot, bot_id)
+                bot_data = bot.to_dict() if bot is not None else None
+            if bot_data is None:
+                self.registry.applied(bot_id, generation, 'Bot não encontrado')
+                continue
+            
+            self._applying.add(bot_id)
+            action = 'start' if instance['desired_state'] == 'running' else 'stop'
+            job = lifecycle_jobs.launch(action, bot_data, on_finish=lambda job, bot_id=bot_id, generation=generation:
+                                        self._request_applied(bot_id, generation, job))
+            if job is None:
+                self._applying.discard(bot_id)  # Outro job em andamento: fica para o próximo ciclo
+    
+    def _request_applied(self, bot_id: int, generation: int, job: dict):
+        self.registry.applied(bot_id, generation, job['error'])
+        self._applying.discard(bot_id)
+    
+    def _heartbeat(self):
+        self.monitor.submit(self._renew_leases)
+        self.monitor.call_later(self.registry.heartbeat_seconds, self._heartbeat)
+    
+    def _renew_leases(self):
+        self.registry.heartbeat()
+        # Bot excluído por outro worker: o pedido de parada some junto com a linha do registro
+        running = list(self.instances)
+        for bot_id in set(running) - self.registry.existing_bots(running):
+            print(f"Parando o bot {bot_id}, excluído do banco")
+            self._stop_local(bot_id)
+    
+    def _record(self, bot_id: int, instance: dict):
+        """Publica no registro o estado atual do processo (no pool; gravações fora de ordem convergem)"""
+        if self.app is None or self.instances.get(bot_id) is not instance:
+            return
+        exited = instance.get('exited', False)
+        self.registry.record(
+            bot_id,
+            pid=None if exited else instance['process'].pid,
+            port=instance['port'],
+            socket_path=instance['socket_path'],
+            status=instance['status'],
+            qr_code=None if exited else instance['qr_code'],
+            started_at=instance['created_at'],
+            supervision=json.dumps(self.supervision_status(bot_id))
+        )
+    
+    def _release(self, bot_id: int):
+        if self.app is None or bot_id in self.instances:
+            return  # Um novo processo já ocupa o registro
+        self.registry.release(bot_id, supervision=json.dumps(self.supervision_status(bot_id)))
+    
+    def _autostart(self):
+        bots = [bot for bot in self.registry.desired_running() if bot['id'] not in self.instances]
+        if not bots:
+            return
+        
+        # Com concorrência e rampa limitadas (importado aqui: bulk_lifecycle depende deste módulo)
+        from src.bulk_lifecycle import bulk_lifecycle
+        print(f"Religando {len(bots)} bots que estavam ativos antes do reinício do backend")
+        operation = bulk_lifecycle.run('start', bots)
+        bulk_lifecycle.wait(operation)
+        summary = operation['events'][-1]
+        print(f"Bots religados: {summary['succeeded']} iniciados, {summary['failed']} com erro")
+    
+    def _supervisor_lock_path(self) -> str:
+        """SUPERVISOR_LOCK_PATH ou, por padrão, ao lado do arquivo do SQLite (src/database nos bancos servidor)"""
+        path = os.getenv('SUPERVISOR_LOCK_PATH')
+        if path:
+            return path
+        url = make_url(self.app.config['SQLALCHEMY_DATABASE_URI'])
+        if url.get_backend_name() == 'sqlite' and url.database and url.database != ':memory:':
+            return os.path.join(os.path.dirname(os.path.abspath(url.database)), 'supervisor.lock')
+        return os.path.join(os.path.dirname(__file__), 'database', 'supervisor.lock')
+    
+    def _acquire_supervisor_lock(self):
+        lock_path = self._supervisor_lock_path()
+        os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+        lock_file = open(lock_path, 'a')
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return None
+        return lock_file
+    
+    @staticmethod
+    def _is_bot_process(pid: int) -> bool:
+        # Sem /proc (ex.: macOS) não há como confirmar que o pid ainda é do bot: não finaliza
+        try:
+            with open(f'/proc/{pid}/cmdline', 'rb') as cmdline:
+                return b'whatsapp_bot.js' in cmdline.read()
+        except OSError:
+            return False
+    
+    @staticmethod
+    def _tail(instance: dict, lines: int = 10) -> str:
+        return '\n'.join(list(instance['output'])[-lines:])
     
     def cleanup_all(self):
-        """Para todas as instâncias"""
-        bot_ids = list(self.instances.keys())
-        for bot_id in bot_ids:
-            self.stop_instance(bot_id)
+        """Para todas as instâncias (em paralelo)"""
+        pending = []
+        for bot_id in list(self.instances.keys()):
+            done = threading.Event()
+            # Sem alterar desired_state: o próximo supervisor religa os mesmos bots
+            if self._stop_local(bot_id, on_done=done.set):
+                pending.append(done)
+        for done in pending:
+            done.wait(self.stop_timeout + 5)
 
 # Instância global do gerenciador
 whatsapp_manager = WhatsAppManager()
@@ -10,6 +10,9 @@ const mime = require('mime-types');
 const fs = require('fs');
 const path = require('path');
 
+// Prefixo das linhas de evento lidas pelo backend no stdout do processo
+const EVENT_PREFIX = '@@dashurx-event ';
+
 class WhatsAppBot {
     constructor(botId, config = {}) {
         this.botId = botId;
@@ -22,6 +25,9 @@ class WhatsAppBot {
         
         this.app = express();
         this.server = http.createServer(this.app);
+        // O backend mantém as conexões abertas entre envios; o padrão do Node (5s) as fecharia
+        this.server.keepAliveTimeout = Number(process.env.BOT_KEEP_ALIVE_MS || 65000);
+        this.server.headersTimeout = this.server.keepAliveTimeout + 1000;
         this.io = socketIO(this.server, {
             cors: {
                 origin: "*",
@@ -208,7 +214,7 @@ class WhatsAppBot {
         return `${cleanNumber}@c.us`;
     }
 
-    async sendToWebhook(data) {
+    async sendToWebhook(data, attempt = 1) {
         if (!this.config.webhookUrl) return;
         
         try {
@@ -219,6 +225,16 @@ class WhatsAppBot {
                 }
             });
         } catch (error) {
+            // Reenviar em falhas de rede, 429 e 5xx (o backend ignora ids repetidos)
+            const status = error.response ? error.response.status : null;
+            const retryable = status === null || status === 429 || status >= 500;
+            const maxAttempts = parseInt(process.env.WEBHOOK_MAX_ATTEMPTS || '5');
+            
+            if (retryable && attempt < maxAttempts) {
+                const delay = Math.min(500 * Math.pow(2, attempt - 1), 15000) * (0.5 + Math.random() / 2);
+                setTimeout(() => this.sendToWebhook(data, attempt + 1), delay);
+                return;
+            }
             console.error('Erro ao enviar webhook:', error.message);
         }
     }
@@ -258,6 +274,7 @@ class WhatsAppBot {
         } catch (error) {
             console.error(`Erro ao inicializar bot ${this.botId}:`, error);
             this.status = 'error';
+            this.publishState();
         }
     }
 
@@ -268,6 +285,7 @@ class WhatsAppBot {
                 if (!err) {
                     this.qrCode = url;
                     this.status = 'qr_ready';
+                    this.publishState();
                     this.io.emit('qr', url);
                     this.io.emit('status', { status: this.status, message: 'QR Code gerado' });
                 }
@@ -279,6 +297,7 @@ class WhatsAppBot {
             this.isReady = true;
             this.status = 'ready';
             this.qrCode = null;
+            this.publishState();
             this.io.emit('ready', { botId: this.botId, message: 'Bot conectado e pronto!' });
             this.io.emit('status', { status: this.status, message: 'Bot conectado' });
         });
@@ -286,6 +305,7 @@ class WhatsAppBot {
         this.client.on('authenticated', () => {
             console.log(`Bot ${this.botId} autenticado`);
             this.status = 'authenticated';
+            this.publishState();
             this.io.emit('authenticated', { botId: this.botId, message: 'Bot autenticado!' });
         });
 
@@ -293,6 +313,7 @@ class WhatsAppBot {
             console.error(`Falha na autenticação do bot ${this.botId}`);
             this.status = 'auth_failure';
             this.isReady = false;
+            this.publishState();
             this.io.emit('auth_failure', { botId: this.botId, message: 'Falha na autenticação' });
         });
 
@@ -301,6 +322,7 @@ class WhatsAppBot {
             this.status = 'disconnected';
             this.isReady = false;
             this.qrCode = null;
+            this.publishState();
             this.io.emit('disconnected', { botId: this.botId, reason, message: 'Bot desconectado' });
         });
 
@@ -309,6 +331,7 @@ class WhatsAppBot {
             const messageData = {
                 type: 'message_received',
                 botId: this.botId,
+                id: message.id ? message.id._serialized : null,
                 from: message.from,
                 to: message.to,
                 body: message.body,
@@ -328,12 +351,20 @@ class WhatsAppBot {
     }
 
     async start() {
+        // Porta TCP ou caminho de socket Unix, conforme o endereço escolhido pelo backend
+        const isSocket = isNaN(Number(this.config.port));
+        if (isSocket && fs.existsSync(this.config.port)) {
+            fs.unlinkSync(this.config.port); // Socket que sobrou de uma execução anterior
+        }
+        const listenArgs = isSocket ? [this.config.port] : [this.config.port, '0.0.0.0'];
+
         return new Promise((resolve, reject) => {
-            this.server.listen(this.config.port, '0.0.0.0', (error) => {
+            this.server.listen(...listenArgs, (error) => {
                 if (error) {
                     reject(error);
                 } else {
-                    console.log(`Bot ${this.botId} rodando na porta ${this.config.port}`);
+                    console.log(`Bot ${this.botId} rodando em ${this.config.port}`);
+                    this.emitEvent('hello', { port: this.config.port, ...this.getStatus() });
                     resolve();
                 }
             });
@@ -348,12 +379,26 @@ class WhatsAppBot {
             this.server.close();
             this.isReady = false;
             this.status = 'stopped';
+            this.publishState();
             console.log(`Bot ${this.botId} parado`);
         } catch (error) {
             console.error(`Erro ao parar bot ${this.botId}:`, error);
         }
     }
 
+    // Transições de estado enviadas ao backend pelo stdout (uma linha JSON por evento)
+    emitEvent(event, data = {}) {
+        process.stdout.write(EVENT_PREFIX + JSON.stringify({ event, botId: this.botId, ...data }) + '\n');
+    }
+
+    publishState() {
+        this.emitEvent('status', {
+            status: this.status,
+            isReady: this.isReady,
+            qrCode: this.qrCode
+        });
+    }
+
     getStatus() {
         return {
             botId: this.botId,
@@ -368,24 +413,28 @@ class WhatsAppBot {
 // Se executado diretamente
 if (require.main === module) {
     const botId = process.argv[2] || '1';
-    const port = process.argv[3] || (8000 + parseInt(botId));
+    const port = process.argv[3] || (8000 + parseInt(botId)); // Porta ou caminho do socket Unix
     const webhookUrl = process.argv[4] || null;
 
     const bot = new WhatsAppBot(botId, { port, webhookUrl });
     
-    bot.initialize().then(() => {
-        return bot.start();
+    // A porta sobe antes do navegador: o evento 'hello' confirma ao backend que o bot iniciou,
+    // e as rotas respondem 'Bot não está conectado' até o cliente ficar pronto
+    bot.start().then(() => {
+        return bot.initialize();
     }).catch((error) => {
         console.error('Erro ao iniciar bot:', error);
         process.exit(1);
     });
 
-    // Graceful shutdown
-    process.on('SIGINT', async () => {
+    // Graceful shutdown (SIGTERM é o sinal enviado pelo backend ao parar o bot)
+    const shutdown = async () => {
         console.log('Parando bot...');
         await bot.stop();
         process.exit(0);
-    });
+    };
+    process.on('SIGINT', shutdown);
+    process.on('SIGTERM', shutdown);
 }
 
 module.exports = WhatsAppBot;
@@ -0,0 +1,42 @@
+import pytest
+from flask import Flask
+
+from src.db_config import init_db
+from src.migrations import run_migrations
+from src.models import db, Bot, User
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """Aplicação mínima com um banco SQLite próprio, sem os serviços em segundo plano"""
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'app.db'}")
+    app = Flask(__name__)
+    init_db(app)
+    with app.app_context():
+        db.create_all()
+        run_migrations()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def make_bot():
+    """Cria um usuário com um bot no app context atual e retorna o bot"""
+    def make(name: str = 'bot') -> Bot:
+        user = User(username=f'dono-{name}', email=f'{name}@example.com')
+        user.set_password('x')
+        db.session.add(user)
+        db.session.flush()
+        bot = Bot(name=name, user_id=user.id)
+        db.session.add(bot)
+        db.session.commit()
+        return bot
+    return make
+
+
+@pytest.fixture
+def bot_id(app, make_bot):
+    with app.app_context():
+        return make_bot().id
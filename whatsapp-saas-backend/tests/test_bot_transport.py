@@ -0,0 +1,163 @@
+import os
+import socket
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+import requests
+
+from src.bot_transport import BotHttpClient, PortAllocator, bot_url
+from src.whatsapp_manager import whatsapp_manager
+
+
+class _BotHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, como o servidor do bot
+    failures = {}  # rota -> quantas respostas 503 antes de 200
+
+    def _reply(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        remaining = self.failures.get(self.path, 0)
+        if remaining:
+            self.failures[self.path] = remaining - 1
+        status = 503 if remaining else 200
+        body = b'{"ok": true}'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _reply
+    do_POST = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ('localhost', 0)  # O BaseHTTPRequestHandler espera (host, porta)
+
+
+@pytest.fixture
+def bot_socket(tmp_path):
+    path = str(tmp_path / 'bot_1.sock')
+    _BotHandler.failures = {}
+    server = _UnixServer(path, _BotHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield path
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv('BOT_HTTP_RETRY_BACKOFF', '0')
+    client = BotHttpClient()
+    yield client
+    client.close()
+
+
+def _listening_port() -> socket.socket:
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('', 0))
+    listener.listen()
+    return listener
+
+
+def test_port_in_use_by_another_worker_is_skipped():
+    listener = _listening_port()
+    port = listener.getsockname()[1]
+    try:
+        first, second = PortAllocator(port, 50), PortAllocator(port, 50)
+        # A porta do bot do outro worker está ocupada: nenhum dos dois a empresta
+        leased = first.acquire()
+        assert leased != port
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as bot:
+            bot.bind(('', leased))
+            bot.listen()
+            other = second.acquire()
+        assert other not in (port, leased)
+    finally:
+        listener.close()
+
+
+def test_released_port_is_not_reused_right_away():
+    listener = _listening_port()
+    start = listener.getsockname()[1] + 1
+    listener.close()
+    ports = PortAllocator(start, 20)
+    first = ports.acquire()
+    ports.release(first)
+    second = ports.acquire()
+    assert second != first
+    assert second in range(start, start + 20)
+
+
+def test_exhausted_range_raises():
+    listener = _listening_port()
+    try:
+        with pytest.raises(RuntimeError):
+            PortAllocator(listener.getsockname()[1], 1).acquire()
+    finally:
+        listener.close()
+
+
+def test_release_endpoint_removes_the_stale_socket(tmp_path, monkeypatch):
+    monkeypatch.setattr(whatsapp_manager, 'transport', 'unix')
+    monkeypatch.setattr(whatsapp_manager, 'run_dir', str(tmp_path / 'run'))
+    port, socket_path = whatsapp_manager._lease_endpoint(7)
+    assert port is None and socket_path.endswith('bot_7.sock')
+    open(socket_path, 'w').close()
+
+    whatsapp_manager._release_endpoint({'port': None, 'socket_path': socket_path})
+    assert not os.path.exists(socket_path)
+    # Já removido: não falha
+    whatsapp_manager._release_endpoint({'port': None, 'socket_path': socket_path})
+
+
+def test_connections_are_reused(client, bot_socket):
+    for _ in range(3):
+        assert client.get(bot_url(None, bot_socket, '/status')).status_code == 200
+    client.post(bot_url(None, bot_socket, '/send-message'), json={'number': '55', 'message': 'oi'})
+
+    metrics = client.metrics()
+    assert metrics['requests'] == 4
+    assert metrics['connections_opened'] == 1
+    assert metrics['connection_reuse'] == 0.75
+    assert metrics['pools'] == 1
+    assert metrics['retries'] == 0
+
+
+def test_get_is_retried_on_503(client, bot_socket):
+    _BotHandler.failures = {'/status': 2}
+    assert client.get(bot_url(None, bot_socket, '/status')).status_code == 200
+    metrics = client.metrics()
+    assert metrics['retries'] == 2
+    assert metrics['requests'] == 1
+    assert metrics['server_errors'] == 0
+
+
+def test_post_is_not_retried_on_503(client, bot_socket):
+    _BotHandler.failures = {'/send-message': 1}
+    response = client.post(bot_url(None, bot_socket, '/send-message'), json={})
+    assert response.status_code == 503
+    metrics = client.metrics()
+    assert metrics['retries'] == 0
+    assert metrics['server_errors'] == 1
+
+
+def test_connection_failure_is_retried_then_raises(client, tmp_path):
+    with pytest.raises(requests.ConnectionError):
+        client.post(bot_url(None, str(tmp_path / 'ausente.sock'), '/send-message'), json={})
+    metrics = client.metrics()
+    assert metrics['retries'] == client.retries
+    assert metrics['errors'] == 1
+    assert metrics['timeouts'] == 0
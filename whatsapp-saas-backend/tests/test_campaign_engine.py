@@ -0,0 +1,120 @@
+import io
+import json
+
+import pytest
+from sqlalchemy import event
+
+from src.campaign_engine import CampaignEngine, campaign_engine, normalize_number
+from src.models import db, Bot, Message
+from src.models.campaign import Campaign, CampaignRecipient
+from src.outbound_queue import outbound_queue
+from src.whatsapp_manager import whatsapp_manager
+
+
+@pytest.fixture
+def campaign(app, bot_id):
+    with app.app_context():
+        campaign = Campaign(bot_id=bot_id, name='Promo', template='Olá {{nome}}')
+        db.session.add(campaign)
+        db.session.commit()
+        yield campaign
+
+
+def _csv(content: str) -> io.BytesIO:
+    return io.BytesIO(content.encode('utf-8'))
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('+55 (11) 99999-0001', '5511999990001'),
+    ('5511999990001@c.us', '5511999990001'),
+    ('1234567', None),
+    ('1' * 21, None),
+    ('', None),
+    (None, None),
+])
+def test_normalize_number(value, expected):
+    assert normalize_number(value) == expected
+
+
+def test_import_recipients(campaign):
+    result = campaign_engine.import_recipients(campaign, _csv(
+        '\ufeffnome;Telefone\n'  # BOM do Excel
+        'Ana;+55 11 99999-0001\n'
+        'Bia;123\n'
+        '\n'
+        'Ana de novo;5511999990001\n'
+        'Caio;5511999990002\n'
+    ))
+
+    assert result == {'imported': 2, 'invalid': 1, 'duplicates': 1, 'truncated': False, 'total': 2}
+    recipients = CampaignRecipient.query.filter_by(campaign_id=campaign.id).order_by(CampaignRecipient.id).all()
+    assert [recipient.contact_number for recipient in recipients] == ['5511999990001', '5511999990002']
+    assert json.loads(recipients[0].variables) == {'nome': 'Ana', 'Telefone': '+55 11 99999-0001'}
+
+
+def test_import_recipients_truncates_at_limit(campaign, monkeypatch):
+    monkeypatch.setattr(campaign_engine, 'max_recipients', 2)
+    monkeypatch.setattr(campaign_engine, 'upload_batch', 1)
+    rows = ''.join(f'55119999900{n:02d}\n' for n in range(5))
+
+    result = campaign_engine.import_recipients(campaign, _csv('number\n' + rows))
+
+    assert result['truncated'] is True
+    assert result['total'] == 2
+
+
+def test_import_recipients_rejects_empty_csv(campaign):
+    with pytest.raises(ValueError):
+        campaign_engine.import_recipients(campaign, _csv(''))
+
+
+def test_transition_requires_recipients(campaign):
+    with pytest.raises(ValueError):
+        campaign_engine.transition(campaign, 'start')
+    with pytest.raises(ValueError):
+        campaign_engine.transition(campaign, 'launch')
+    assert db.session.get(Campaign, campaign.id).status == 'draft'
+
+
+def test_release_renders_the_template_per_recipient(app, campaign, monkeypatch):
+    campaign_engine.import_recipients(campaign, _csv('nome,numero\nAna,5511999990001\nBia,5511999990002\n'))
+    engine = CampaignEngine()
+    engine.app = app
+    dispatched = []
+    monkeypatch.setattr(whatsapp_manager, 'is_running', lambda bot_id: True)
+    monkeypatch.setattr(outbound_queue, 'dispatch',
+                        lambda messages: dispatched.extend(message.content for message in messages))
+
+    state = engine._activate(campaign)
+    engine._release(state)
+
+    assert dispatched == ['Olá Ana']  # balde com uma ficha
+    with app.app_context():
+        message = Message.query.one()
+        assert (message.contact_number, message.content, message.status) == ('5511999990001', 'Olá Ana', 'queued')
+        recipient = CampaignRecipient.query.filter_by(contact_number='5511999990001').one()
+        assert (recipient.status, recipient.message_id) == ('queued', message.id)
+
+
+def test_delete_does_not_load_recipients(app, campaign, bot_id):
+    rows = ''.join(f'55119999{n:05d}\n' for n in range(50))
+    campaign_engine.import_recipients(campaign, _csv('numero\n' + rows))
+    statements = []
+
+    def listener(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            db.session.delete(db.session.get(Bot, bot_id))
+            db.session.commit()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        assert CampaignRecipient.query.count() == 0
+        assert Campaign.query.count() == 0
+
+    # Um DELETE em lote, sem SELECT dos destinatários
+    recipient_statements = [statement for statement in statements if 'campaign_recipients' in statement]
+    assert len(recipient_statements) == 1
+    assert recipient_statements[0].startswith('DELETE FROM campaign_recipients WHERE')
@@ -0,0 +1,55 @@
+import time
+
+import pytest
+
+from src.conversation_store import ConversationState, ConversationStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setenv('CONVERSATION_DB_PATH', str(tmp_path / 'conversations.db'))
+    monkeypatch.setenv('CONVERSATION_CACHE_SECONDS', '0.2')
+    return ConversationStore()
+
+
+def _write_elsewhere(store, state):
+    # Outro worker: mesmo arquivo, cache próprio
+    other = ConversationStore()
+    other.db_path = store.db_path
+    other.put(state)
+    other.flush()
+
+
+def test_put_get_delete(store):
+    store.put(ConversationState(1, '55', 10, 20, variables={'nome': 'Ana'}, waiting='input'))
+    store.flush()
+    state = store.get(1, '55')
+    assert (state.flow_id, state.node_id, state.variables) == (10, 20, {'nome': 'Ana'})
+    store.delete(1, '55')
+    store.flush()
+    assert store.get(1, '55') is None
+
+
+def test_negative_cache_expires(store):
+    assert store.get(1, '55') is None
+    _write_elsewhere(store, ConversationState(1, '55', 10, 20, waiting='input'))
+    assert store.get(1, '55') is None  # Ainda no cache negativo
+    time.sleep(0.25)
+    assert store.get(1, '55').node_id == 20
+
+
+def test_positive_cache_expires(store):
+    store.put(ConversationState(1, '55', 10, 20, waiting='input'))
+    store.flush()
+    assert store.get(1, '55').node_id == 20
+    _write_elsewhere(store, ConversationState(1, '55', 10, 30, waiting='input'))
+    time.sleep(0.25)
+    assert store.get(1, '55').node_id == 30
+
+
+def test_due_delays(store):
+    now = time.time()
+    store.put(ConversationState(1, '55', 10, 20, waiting='delay', resume_at=now - 1))
+    store.put(ConversationState(1, '56', 10, 20, waiting='delay', resume_at=now + 60))
+    store.put(ConversationState(1, '57', 10, 20, waiting='input'))
+    assert [state.contact_number for state in store.due_delays(now, 10)] == ['55']
@@ -0,0 +1,101 @@
+from src.flow_dispatcher import BotTriggerIndex, normalize_text
+
+
+def test_normalize_text():
+    assert normalize_text('  Olá   MUNDO ') == 'olá mundo'
+    assert normalize_text(None) == ''
+
+
+def test_exact_keyword_wins_over_prefix():
+    index = BotTriggerIndex(1)
+    index.add(1, 'keyword', 'oi')
+    index.add(2, 'keyword', 'oi tudo bem')
+    assert index.match('Oi tudo bem') == 2
+    assert index.match('oi, quero saber') == 1
+    assert index.match('oiii') is None
+
+
+def test_longest_prefix_respects_word_boundary():
+    index = BotTriggerIndex(1)
+    index.add(1, 'keyword', 'menu')
+    index.add(2, 'keyword', 'menu principal')
+    assert index.match('menu principal agora') == 2
+    assert index.match('menu!') == 1
+    assert index.match('menus') is None
+
+
+def test_remove_and_replace():
+    index = BotTriggerIndex(1)
+    index.add(1, 'keyword', 'oi, olá')
+    index.remove(1)
+    assert index.match('oi') is None
+    index.add(1, 'keyword', 'tchau')
+    index.add(1, 'keyword', 'adeus')
+    assert index.match('tchau') is None
+    assert index.match('adeus') == 1
+    assert len(index) == 1
+
+
+def test_patterns_media_and_catch_all():
+    index = BotTriggerIndex(1)
+    index.add(1, 'regex', r'pedido \d+')
+    index.add(2, 'media', None)
+    index.add(3, 'message', None)
+    assert index.match('meu pedido 123 atrasou') == 1
+    assert index.match('', message_type='image') == 2
+    assert index.match('qualquer coisa') == 3
+
+
+def test_backreference_uses_fallback():
+    index = BotTriggerIndex(1)
+    index.add(1, 'regex', r'(\w)\1')
+    index.add(2, 'regex', 'preço')
+    assert index.match('aa') == 1
+    assert index.match('qual o preço?') == 2
+
+
+def test_global_inline_flags_do_not_break_other_patterns():
+    index = BotTriggerIndex(1)
+    index.add(1, 'regex', '(?i)oi')
+    index.add(2, 'regex', 'preço')
+    assert index.match('preço') == 2
+    assert index.match('OI') == 1
+
+
+def test_invalid_pattern_is_ignored():
+    index = BotTriggerIndex(1)
+    index.add(1, 'regex', '(')
+    index.add(2, 'regex', 'ok')
+    assert index.match('ok') == 2
+
+
+def test_lowest_flow_id_wins_when_several_patterns_match():
+    index = BotTriggerIndex(1)
+    index.add(5, 'regex', 'pedido')
+    index.add(3, 'regex', 'atrasado')
+    index.add(9, 'regex', r'(\w)\1')  # no fallback
+    index.add(1, 'regex', 'cancelar')
+    # 'pedido' casa mais à esquerda, mas o fluxo 3 tem id menor
+    assert index.match('pedido atrasado') == 3
+    assert index.match('pedido atrasado, quero cancelar') == 1
+    assert index.match('pedido') == 5
+    assert index.match('pedido 11') == 5
+    assert index.match('ss') == 9
+
+
+def test_fallback_pattern_with_lower_id_wins():
+    index = BotTriggerIndex(1)
+    index.add(2, 'regex', 'preço')
+    index.add(1, 'regex', r'(\w)\1')
+    assert index.match('preço ss') == 1
+    assert index.match('preço') == 2
+
+
+def test_conditional_group_uses_fallback():
+    index = BotTriggerIndex(1)
+    index.add(1, 'regex', 'oi')
+    index.add(2, 'regex', r'(<)?tag(?(1)>|)')
+    assert index.match('<tag>') == 2
+    assert index.match('tag') == 2
+    assert index.match('oi') == 1
+    assert [flow_id for flow_id, _ in index._regex_fallback] == [2]
@@ -0,0 +1,187 @@
+import json
+
+import pytest
+
+from src.flow_engine import MAX_STEPS_PER_RUN, FlowEngine, compile_predicate, render_template
+from src.models import db, Flow, FlowNode, NodeConnection
+
+
+@pytest.fixture
+def flow_id(app, bot_id):
+    with app.app_context():
+        flow = Flow(bot_id=bot_id, name='Vendas', trigger_type='keyword', trigger_value='oi')
+        db.session.add(flow)
+        db.session.commit()
+        return flow.id
+
+
+@pytest.fixture
+def build(app, flow_id):
+    """build(nodes, edges): nós como (chave, tipo, dados) e conexões como (de, para, tipo, valor)"""
+    def build_flow(nodes, edges=()):
+        with app.app_context():
+            ids = {}
+            for order, (key, node_type, data) in enumerate(nodes):
+                node = FlowNode(flow_id=flow_id, node_type=node_type, node_data=json.dumps(data),
+                                order_index=order)
+                db.session.add(node)
+                db.session.flush()
+                ids[key] = node.id
+            for source, target, condition_type, condition_value in edges:
+                db.session.add(NodeConnection(from_node_id=ids[source], to_node_id=ids[target],
+                                              condition_type=condition_type, condition_value=condition_value))
+            db.session.commit()
+            return FlowEngine().compile(flow_id), ids
+    return build_flow
+
+
+def _messages(result):
+    return [action['message'] for action in result.actions if action['type'] == 'send_message']
+
+
+@pytest.mark.parametrize('condition_type, value, text, expected', [
+    ('equals', 'Sim', '  SIM ', True),
+    ('equals', 'sim', 'sim!', False),
+    ('not_equals', 'sim', 'não', True),
+    ('contains', 'preço', 'Qual o PREÇO?', True),
+    ('starts_with', 'quero', 'Quero comprar', True),
+    ('starts_with', 'quero', 'eu quero', False),
+    ('regex', r'^\d{3}$', '123', True),
+    ('regex', '(', '(', False),
+    ('any', '', 'qualquer', True),
+    ('', 'sim', 'Sim', True),
+    ('desconhecido', 'x', 'x', False),
+])
+def test_compile_predicate(condition_type, value, text, expected):
+    assert compile_predicate(condition_type, value)(text) is expected
+
+
+def test_unconditional_edge_has_no_predicate():
+    assert compile_predicate(None, None) is None
+    assert compile_predicate('', '') is None
+
+
+def test_render_template():
+    assert render_template('Olá {{nome}}, pedido {{ pedido }}', {'nome': 'Ana', 'pedido': 7}) == 'Olá Ana, pedido 7'
+    assert render_template('Olá {{nome}}', {}) == 'Olá '
+    assert render_template('Olá {nome}', {'nome': 'Ana'}) == 'Olá {nome}'
+    assert render_template('', {'nome': 'Ana'}) == ''
+
+
+def test_compile_graph(build):
+    flow, ids = build(
+        [('a', 'Message', {'message': 'oi'}), ('b', 'message', 'não é objeto'), ('c', 'message', {})],
+        [('a', 'b', None, None), ('b', 'c', 'equals', 'sim')]
+    )
+    assert flow.entry == flow.index_by_id[ids['a']]
+    assert [node.node_type for node in flow.nodes] == ['message', 'message', 'message']
+    assert dict(flow.nodes[1].data) == {}
+    assert flow.nodes[0].edges[0].predicate is None
+    assert flow.nodes[1].edges[0].predicate('Sim')
+    with pytest.raises(TypeError):
+        flow.nodes[0].data['message'] = 'alterado'
+
+
+def test_entry_is_first_node_without_incoming_edges(build):
+    flow, ids = build(
+        [('b', 'message', {'message': 'depois'}), ('a', 'message', {'message': 'início'})],
+        [('a', 'b', None, None)]
+    )
+    assert flow.nodes[flow.entry].id == ids['a']
+
+
+def test_messages_run_until_a_condition_waits_for_input(build):
+    flow, ids = build(
+        [('a', 'message', {'message': 'Olá {{nome}}'}),
+         ('b', 'message', {'message': 'Quer comprar?', 'variable': 'resposta'}),
+         ('sim', 'message', {'message': 'Ótimo, {{resposta}}'}),
+         ('outro', 'message', {'message': 'Não entendi'})],
+        [('a', 'b', None, None), ('b', 'sim', 'equals', 'sim'), ('b', 'outro', None, None)]
+    )
+    engine = FlowEngine()
+
+    result = engine.start(flow, {'nome': 'Ana'})
+    assert _messages(result) == ['Olá Ana', 'Quer comprar?']
+    assert (result.node_id, result.waiting) == (ids['b'], 'input')
+
+    result = engine.resume(flow, ids['b'], 'Sim', result.variables)
+    assert _messages(result) == ['Ótimo, Sim']
+    assert result.node_id is None and result.waiting is None
+    assert result.variables == {'nome': 'Ana', 'resposta': 'Sim'}
+
+    # A conexão sem condição é o caminho padrão
+    result = engine.resume(flow, ids['b'], 'talvez')
+    assert _messages(result) == ['Não entendi']
+
+
+def test_condition_without_fallback_keeps_waiting(build):
+    flow, ids = build(
+        [('a', 'message', {'message': 'Sim ou não?'}), ('b', 'message', {'message': 'ok'})],
+        [('a', 'b', 'equals', 'sim')]
+    )
+    result = FlowEngine().resume(flow, ids['a'], 'hein?')
+    assert result.actions == []
+    assert (result.node_id, result.waiting) == (ids['a'], 'input')
+
+
+def test_delay_stops_and_resumes_after_the_delay_node(build):
+    flow, ids = build(
+        [('a', 'message', {'message': 'Um momento'}), ('d', 'delay', {'delay': '1500'}),
+         ('b', 'message', {'message': 'Pronto'})],
+        [('a', 'd', None, None), ('d', 'b', None, None)]
+    )
+    engine = FlowEngine()
+    result = engine.start(flow)
+    assert _messages(result) == ['Um momento']
+    assert (result.node_id, result.waiting, result.delay_ms) == (ids['d'], 'delay', 1500)
+
+    result = engine.resume(flow, ids['d'])
+    assert _messages(result) == ['Pronto']
+    assert result.waiting is None
+
+
+def test_invalid_delay_uses_default(build):
+    flow, _ = build([('d', 'delay', {'delay': 'logo'})])
+    assert FlowEngine().start(flow).delay_ms == 1000
+
+
+def test_actions_and_end(build):
+    flow, _ = build(
+        [('tag', 'action', {'action': 'add_tag', 'tag': 'lead'}), ('fim', 'action', {'action': 'end'}),
+         ('nunca', 'message', {'message': 'não sai'})],
+        [('tag', 'fim', None, None), ('fim', 'nunca', None, None)]
+    )
+    result = FlowEngine().start(flow)
+    assert result.actions == [{'type': 'add_tag', 'data': {'action': 'add_tag', 'tag': 'lead'}}]
+    assert result.node_id is None
+
+
+def test_removed_node_ends_the_conversation(build):
+    flow, _ = build([('a', 'message', {'message': 'oi'})])
+    result = FlowEngine().resume(flow, 999999, 'oi')
+    assert result.actions == []
+    assert result.node_id is None and result.waiting is None
+
+
+def test_unconditional_cycle_stops_at_max_steps(build):
+    flow, _ = build(
+        [('a', 'message', {'message': 'ping'}), ('b', 'message', {'message': 'pong'})],
+        [('a', 'b', None, None), ('b', 'a', None, None)]
+    )
+    result = FlowEngine().start(flow)
+    assert len(result.actions) == MAX_STEPS_PER_RUN
+    assert result.node_id is None and result.waiting is None
+
+
+def test_invalidate_recompiles(app, build, flow_id):
+    build([('a', 'message', {'message': 'v1'})])
+    engine = FlowEngine()
+    with app.app_context():
+        first = engine.get(flow_id)
+        assert engine.get(flow_id) is first
+        FlowNode.query.filter_by(flow_id=flow_id).update({'node_data': json.dumps({'message': 'v2'})})
+        db.session.commit()
+        engine.invalidate(flow_id)
+        second = engine.get(flow_id)
+    assert second.version == first.version + 1
+    assert _messages(engine.start(second)) == ['v2']
@@ -0,0 +1,32 @@
+import time
+
+import pytest
+
+from src.conversation_store import ConversationState
+from src.flow_runner import FlowRunner
+from src.whatsapp_manager import whatsapp_manager
+
+
+@pytest.fixture
+def supervisor(monkeypatch):
+    def set_supervisor(value):
+        monkeypatch.setattr(whatsapp_manager, 'supervisor', value)
+    return set_supervisor
+
+
+def _delay_state():
+    return ConversationState(1, '55', 10, 20, waiting='delay', resume_at=time.time() + 60)
+
+
+def test_followers_do_not_keep_delay_timers(supervisor):
+    supervisor(False)
+    runner = FlowRunner()
+    runner._schedule(_delay_state())
+    assert runner._timers == []
+
+
+def test_supervisor_keeps_delay_timers(supervisor):
+    supervisor(True)
+    runner = FlowRunner()
+    runner._schedule(_delay_state())
+    assert len(runner._timers) == 1
@@ -0,0 +1,74 @@
+import pytest
+
+from src.models import db, Bot
+from src.lifecycle_jobs import LifecycleJobs, lifecycle_jobs
+from src.bulk_lifecycle import BulkLifecycle
+from src.whatsapp_manager import whatsapp_manager
+
+
+@pytest.fixture
+def bot_data(app, bot_id):
+    with app.app_context():
+        return db.session.get(Bot, bot_id).to_dict()
+
+
+def workers(app):
+    """Duas instâncias com o mesmo banco, como dois workers do gunicorn"""
+    first, second = LifecycleJobs(), LifecycleJobs()
+    first.init_app(app)
+    second.init_app(app)
+    return first, second
+
+
+def test_job_status_visible_from_another_worker(app, bot_data, monkeypatch):
+    calls = {}
+    monkeypatch.setattr(whatsapp_manager, 'start_instance',
+                        lambda bot_id, data, on_done, on_step: calls.update(on_done=on_done, on_step=on_step))
+    monkeypatch.setattr(whatsapp_manager, 'get_instance_status', lambda bot_id: {'status': 'qr_ready'})
+    first, second = workers(app)
+
+    job = first.launch('start', bot_data)
+    assert second.get(job['id'])['state'] == 'running'
+    assert second.active_for(bot_data['id'])['id'] == job['id']
+
+    calls['on_step']('launching')
+    assert second.get(job['id'])['step'] == 'launching'
+
+    calls['on_done'](True, None)
+    shared = second.get(job['id'])
+    assert shared == first.get(job['id'])
+    assert shared['state'] == 'succeeded' and shared['step'] == 'done'
+    assert shared['bot_status'] == 'connecting' and shared['finished_at'] is not None
+    assert second.active_for(bot_data['id']) is None
+
+
+def test_unknown_job_is_none(app):
+    first, second = workers(app)
+    assert second.get('0' * 32) is None
+
+
+def test_finished_jobs_are_pruned_from_the_table(app, bot_data, monkeypatch):
+    monkeypatch.setattr(whatsapp_manager, 'stop_instance_async', lambda bot_id, on_done: False)
+    first, second = workers(app)
+
+    job = first.launch('stop', bot_data)
+    assert second.get(job['id'])['bot_status'] == 'inactive'
+
+    first.retention = -1
+    first.launch('stop', bot_data)
+    assert second.get(job['id']) is None
+
+
+def test_bulk_operation_visible_from_another_worker(app, bot_data, monkeypatch):
+    monkeypatch.setattr(whatsapp_manager, 'stop_instance_async', lambda bot_id, on_done: False)
+    monkeypatch.setattr(lifecycle_jobs, 'app', app)
+    first, second = BulkLifecycle(), BulkLifecycle()
+
+    operation = first.run('stop', [bot_data], user_id=bot_data['user_id'], ramp_seconds=0)
+    assert first.wait(operation, timeout=5)
+
+    shared = second.get(operation['id'])
+    assert shared == first.get(operation['id'])
+    assert shared['state'] == 'finished'
+    assert [event['event'] for event in shared['events']] == ['started', 'launched', 'result', 'finished']
+    assert shared['events'][-1]['succeeded'] == 1
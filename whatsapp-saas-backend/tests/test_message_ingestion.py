@@ -0,0 +1,135 @@
+from datetime import datetime
+
+import pytest
+
+from src.message_ingestion import IngestionPipeline, RecentIds, parse_webhook_payload
+from src.models import db, Conversation, Message
+from src.webhook_spool import webhook_spool
+
+
+@pytest.fixture
+def committed(monkeypatch):
+    positions = []
+    monkeypatch.setattr(webhook_spool, 'enabled', True)
+    monkeypatch.setattr(webhook_spool, 'commit', positions.extend)
+    return positions
+
+
+def _item(bot_id, external_id, contact_number='5511999990001', position=None):
+    return {
+        'bot_id': bot_id,
+        'external_id': external_id,
+        'contact_number': contact_number,
+        'content': 'oi',
+        'message_type': 'text',
+        'received_at': datetime.utcnow(),
+        'spool_position': position
+    }
+
+
+def test_parse_webhook_payload():
+    message = parse_webhook_payload({'type': 'message_received', 'from': '55@c.us', 'body': 'oi',
+                                     'messageType': 'chat', 'id': {'_serialized': 'abc'}})
+    assert message == {'external_id': 'abc', 'contact_number': '55@c.us', 'content': 'oi', 'message_type': 'text'}
+    assert parse_webhook_payload({'type': 'message_sent'}) is None
+
+
+def test_recent_ids_lru():
+    recent = RecentIds(2)
+    assert not recent.check_and_add('a')
+    assert recent.check_and_add('a')
+    recent.check_and_add('b')
+    recent.check_and_add('c')
+    assert not recent.check_and_add('a')
+
+
+def test_batch_skips_duplicates(app, bot_id, committed):
+    pipeline = IngestionPipeline()
+    with app.app_context():
+        assert pipeline._write([_item(bot_id, 'x1', position=(1, 10))])
+        batch = [_item(bot_id, 'x1', position=(1, 20)), _item(bot_id, 'x2', position=(1, 30))]
+        assert pipeline._write(batch)
+        assert [item['external_id'] for item in batch] == ['x2']
+        assert Message.query.count() == 2
+    assert sorted(committed) == [(1, 10), (1, 20), (1, 30)]
+
+
+def test_batch_of_invalid_rows_is_dropped_not_retried_forever(app, bot_id, committed):
+    pipeline = IngestionPipeline()
+    pipeline.max_retries = 1
+    with app.app_context():
+        # contact_number é NOT NULL: erro do registro, não do banco
+        assert pipeline._write([_item(bot_id, 'bad', contact_number=None, position=(1, 10))])
+        assert Message.query.count() == 0
+    assert pipeline.stats['failed'] == 1
+    assert committed == [(1, 10)]
+
+
+def test_invalid_row_does_not_block_the_rest(app, bot_id, committed):
+    pipeline = IngestionPipeline()
+    pipeline.max_retries = 1
+    batch = [_item(bot_id, 'ok', position=(1, 10)), _item(bot_id, 'bad', contact_number=None, position=(1, 20))]
+    with app.app_context():
+        assert pipeline._write(batch)
+        assert [message.external_id for message in Message.query.all()] == ['ok']
+    assert sorted(committed) == [(1, 10), (1, 20)]
+
+
+def _message_count(contact_number='5511999990001'):
+    return Conversation.query.filter_by(contact_number=contact_number).one().message_count
+
+
+def test_row_inserted_by_another_worker_is_not_counted_twice(app, bot_id, committed, monkeypatch):
+    pipeline = IngestionPipeline()
+    with app.app_context():
+        assert pipeline._write([_item(bot_id, 'x1', position=(1, 10))])
+        # Outro worker gravou 'x1' entre a checagem de duplicados e o INSERT
+        monkeypatch.setattr(pipeline, '_split_duplicates', lambda batch: (list(batch), []))
+        batch = [_item(bot_id, 'x1', position=(1, 20)), _item(bot_id, 'x2', position=(1, 30))]
+        assert pipeline._write(batch)
+        assert [item['external_id'] for item in batch] == ['x2']
+        assert _message_count() == 2
+    assert pipeline.stats['duplicates'] == 1
+    assert sorted(committed) == [(1, 10), (1, 20), (1, 30)]
+
+
+def test_one_by_one_skips_duplicates_in_the_summary(app, bot_id, committed):
+    pipeline = IngestionPipeline()
+    pipeline.max_retries = 1
+    with app.app_context():
+        assert pipeline._write([_item(bot_id, 'x1', position=(1, 10))])
+        batch = [_item(bot_id, 'x1', position=(1, 20)), _item(bot_id, 'x2', position=(1, 30))]
+        written = pipeline._write_one_by_one(batch)
+        assert [item['external_id'] for item in written] == ['x2']
+        assert _message_count() == 2
+    assert sorted(committed) == [(1, 10), (1, 20), (1, 30)]
+
+
+def test_failed_submit_does_not_mark_the_id_as_seen(monkeypatch):
+    pipeline = IngestionPipeline()
+    payload = {'type': 'message_received', 'from': '55@c.us', 'body': 'oi', 'id': 'retry-me'}
+
+    def broken_append(record):
+        raise OSError('disco cheio')
+
+    monkeypatch.setattr(webhook_spool, 'enabled', True)
+    monkeypatch.setattr(webhook_spool, 'append', broken_append)
+    with pytest.raises(OSError):
+        pipeline.submit(1, payload)
+
+    # O reenvio do bot é aceito, não descartado como duplicado
+    monkeypatch.setattr(webhook_spool, 'enabled', False)
+    monkeypatch.setattr(pipeline, '_ensure_worker', lambda: None)
+    assert pipeline.submit(1, payload) == 'queued'
+    assert pipeline.submit(1, payload) == 'duplicate'
+
+
+def test_full_queue_does_not_mark_the_id_as_seen(monkeypatch):
+    monkeypatch.setenv('INGESTION_QUEUE_SIZE', '1')
+    monkeypatch.setattr(webhook_spool, 'enabled', False)
+    pipeline = IngestionPipeline()
+    monkeypatch.setattr(pipeline, '_ensure_worker', lambda: None)
+    assert pipeline.submit(1, {'type': 'message_received', 'from': '55@c.us', 'id': 'a'}) == 'queued'
+    assert pipeline.submit(1, {'type': 'message_received', 'from': '55@c.us', 'id': 'b'}) == 'full'
+    pipeline.queue.get_nowait()
+    assert pipeline.submit(1, {'type': 'message_received', 'from': '55@c.us', 'id': 'b'}) == 'queued'
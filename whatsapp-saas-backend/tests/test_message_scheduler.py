@@ -0,0 +1,127 @@
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.message_scheduler import MessageScheduler, TimerWheel, parse_send_at
+from src.models import db
+from src.models.scheduled_message import ScheduledMessage
+from src.outbound_queue import outbound_queue
+from src.whatsapp_manager import whatsapp_manager
+
+
+@pytest.fixture
+def scheduler(app):
+    # Sem a thread: os testes chamam os métodos do ciclo diretamente
+    scheduler = MessageScheduler()
+    scheduler.app = app
+    scheduler._start()
+    return scheduler
+
+
+def test_parse_send_at():
+    future = datetime.utcnow().replace(microsecond=0) + timedelta(hours=1)
+    assert parse_send_at(future.isoformat()) == future
+    assert parse_send_at((future - timedelta(hours=3)).isoformat() + '-03:00') == future
+    assert parse_send_at(future.replace(tzinfo=timezone.utc).timestamp()) == future
+    # Um pouco no passado ainda é aceito e sai na hora
+    parse_send_at((datetime.utcnow() - timedelta(seconds=30)).isoformat())
+
+
+@pytest.mark.parametrize('value', [None, '', True, 'amanhã', '2020-01-01T00:00:00', 1e20])
+def test_parse_send_at_rejects(value):
+    with pytest.raises(ValueError):
+        parse_send_at(value)
+
+
+def test_timer_wheel_never_early_and_at_most_one_tick_late():
+    rng = random.Random(25)
+    start = 1_000_000.0
+    wheel = TimerWheel(tick=1.0, slots=8, levels=2, now=start)
+    # Roda baixa, roda alta e além do alcance (overflow), com repetidos
+    deadlines = {key: start + rng.uniform(0, 200) for key in range(300)}
+    for key, when in deadlines.items():
+        wheel.add(key, when)
+    assert wheel.size == 300
+
+    fired = {}
+    now = start
+    while now < start + 205:
+        now += 0.5
+        for key in wheel.advance(now):
+            fired[key] = now
+    assert set(fired) == set(deadlines)
+    assert wheel.size == 0
+    for key, when in deadlines.items():
+        assert when <= fired[key] <= when + 1.0
+
+
+def test_timer_wheel_past_deadline_fires_on_next_tick():
+    wheel = TimerWheel(tick=1.0, now=100.0)
+    wheel.add(1, 50.0)
+    assert wheel.advance(100.0) == [1]
+
+
+def test_fire_requeues_batch_when_dispatch_fails(app, scheduler, bot_id, monkeypatch):
+    with app.app_context():
+        scheduled = scheduler.add(bot_id, '5511999990001', 'oi', datetime.utcnow())
+        db.session.commit()
+        scheduled_id = scheduled.id
+
+    def broken(*args, **kwargs):
+        raise RuntimeError('banco indisponível')
+    monkeypatch.setattr(outbound_queue, 'add', broken)
+    scheduler.retry_seconds = 0.01
+    scheduler._fire([scheduled_id])
+
+    assert scheduled_id in scheduler._loaded
+    assert scheduler.wheel.size == 1
+
+    monkeypatch.undo()
+    dispatched = []
+    monkeypatch.setattr(outbound_queue, 'dispatch', dispatched.extend)
+    due = scheduler.wheel.advance(time.time() + 2)
+    scheduler._fire(due)
+
+    assert due == [scheduled_id]
+    assert len(dispatched) == 1
+    with app.app_context():
+        assert db.session.get(ScheduledMessage, scheduled_id).status == 'dispatched'
+
+
+class _Stop(Exception):
+    pass
+
+
+def test_follower_waits_between_polls(monkeypatch):
+    monkeypatch.setattr(whatsapp_manager, 'supervisor', False)
+    scheduler = MessageScheduler()
+    scheduler.poll_seconds = 0.05
+    calls = []
+    stop = threading.Event()
+    timeout = scheduler._timeout
+
+    def counted():
+        if stop.is_set():
+            raise _Stop
+        calls.append(time.monotonic())
+        return timeout()
+    monkeypatch.setattr(scheduler, '_timeout', counted)
+
+    def run():
+        try:
+            scheduler._run()
+        except _Stop:
+            pass
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    time.sleep(0.3)
+    stop.set()
+    thread.join(1)
+
+    # Sem roda nos seguidores: uma volta por poll, não um laço ocupado
+    assert not thread.is_alive()
+    assert 2 <= len(calls) <= 10
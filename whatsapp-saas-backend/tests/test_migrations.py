@@ -0,0 +1,94 @@
+import os
+
+import pytest
+from flask import Flask
+from sqlalchemy import event, inspect, text
+
+from src.db_config import init_db
+from src.migrations import MIGRATIONS, run_migrations
+from src.models import db, Message
+
+# Lido na importação, antes de o fixture 'app' apontar DATABASE_URL para o SQLite temporário
+POSTGRES_URL = os.getenv('DATABASE_URL', '')
+GROUP_JID = '120363012345678901234@g.us'
+
+
+def test_migrations_are_recorded_once(app):
+    with app.app_context():
+        run_migrations()
+        versions = [row[0] for row in db.session.execute(text('SELECT version FROM schema_migrations'))]
+    assert sorted(versions) == [version for version, _, _ in MIGRATIONS]
+
+
+def test_missing_indexes_are_recreated_without_if_not_exists(app):
+    statements = []
+    with app.app_context():
+        db.session.execute(text('DROP INDEX ix_messages_status'))
+        db.session.execute(text('DROP INDEX ix_messages_bot_timestamp'))
+        db.session.execute(text('DELETE FROM schema_migrations WHERE version IN (2, 5)'))
+        db.session.commit()
+
+        def listener(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            run_migrations()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+
+        indexes = {index['name'] for index in inspect(db.engine).get_indexes('messages')}
+    assert {'ix_messages_status', 'ix_messages_bot_timestamp', 'ix_messages_bot_contact_timestamp'} <= indexes
+    # Sintaxe que o MySQL não aceita
+    assert not [statement for statement in statements if 'INDEX IF NOT EXISTS' in statement]
+    assert [statement for statement in statements if statement.startswith('CREATE INDEX')] == [
+        'CREATE INDEX ix_messages_bot_timestamp ON messages (bot_id, timestamp, id)',
+        'CREATE INDEX ix_messages_status ON messages (status, id)'
+    ]
+
+
+def test_group_jid_fits_contact_number(app, make_bot):
+    with app.app_context():
+        bot = make_bot()
+        db.session.add(Message(bot_id=bot.id, contact_number=GROUP_JID, content='oi',
+                               message_type='text', direction='incoming'))
+        db.session.commit()
+        assert Message.query.one().contact_number == GROUP_JID
+
+
+@pytest.fixture
+def postgres_app(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', POSTGRES_URL)
+    app = Flask(__name__)
+    init_db(app)
+    with app.app_context():
+        db.drop_all()
+        db.session.execute(text('DROP TABLE IF EXISTS schema_migrations'))
+        db.session.commit()
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.session.execute(text('DROP TABLE IF EXISTS schema_migrations'))
+        db.session.commit()
+        db.engine.dispose()
+
+
+@pytest.mark.skipif(not POSTGRES_URL.startswith(('postgres://', 'postgresql')),
+                    reason='defina DATABASE_URL com um PostgreSQL de teste')
+def test_postgres_widens_legacy_contact_number(postgres_app, make_bot):
+    with postgres_app.app_context():
+        # Simula um banco criado antes da migração 6
+        db.session.execute(text('ALTER TABLE messages ALTER COLUMN contact_number TYPE VARCHAR(20)'))
+        db.session.commit()
+        run_migrations()
+
+        column = next(col for col in inspect(db.engine).get_columns('messages')
+                      if col['name'] == 'contact_number')
+        assert column['type'].length == 64
+
+        bot = make_bot()
+        db.session.add(Message(bot_id=bot.id, contact_number=GROUP_JID, content='oi',
+                               message_type='text', direction='incoming'))
+        db.session.commit()
+        assert Message.query.one().contact_number == GROUP_JID
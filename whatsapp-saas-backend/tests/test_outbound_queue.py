@@ -0,0 +1,114 @@
+import time
+
+import pytest
+
+from src.models import db
+from src.outbound_queue import OutboundQueue, TokenBucket
+from src.whatsapp_manager import whatsapp_manager
+
+
+@pytest.fixture
+def queue(app):
+    # Sem a thread de despacho: os testes chamam _poll/_send diretamente
+    queue = OutboundQueue()
+    queue.app = app
+    yield queue
+    queue._executor.shutdown(wait=False)
+
+
+def _queue_messages(app, queue, bot_id, count):
+    with app.app_context():
+        messages = [queue.add(bot_id, '5511999990001', f'msg {n}') for n in range(count)]
+        db.session.commit()
+        return [message.id for message in messages]
+
+
+def _item(message_id, bot_id, queued_at):
+    return {'id': message_id, 'bot_id': bot_id, 'contact_number': '5511999990001', 'content': 'oi',
+            'media_url': None, 'attempts': 0, 'queued_at': queued_at}
+
+
+def test_token_bucket_burst_then_rate():
+    bucket = TokenBucket(rate=2.0, capacity=3)
+    now = bucket.updated
+    assert [bucket.take(now) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.take(now) == pytest.approx(0.5)
+    assert bucket.take(now + 0.5) == 0.0
+    # A espera não acumula fichas além da capacidade
+    assert [bucket.take(now + 100) for _ in range(4)][-1] > 0
+
+
+def test_poll_reads_by_keyset(app, queue, bot_id):
+    ids = _queue_messages(app, queue, bot_id, 5)
+    queue.poll_batch = 2
+
+    queue._poll()
+    queue._poll()
+    assert queue._last_polled_id == ids[3]
+    queue._poll()
+    assert queue._known == set(ids)
+
+    # Já em memória: as próximas buscas não relêem as mesmas linhas
+    queue._poll()
+    assert queue._last_polled_id == ids[-1]
+    assert queue.stats['enqueued'] == 5
+
+    new_id = _queue_messages(app, queue, bot_id, 1)[0]
+    queue._poll()
+    assert new_id in queue._known
+
+
+def test_poll_rescans_from_the_start(app, queue, bot_id):
+    ids = _queue_messages(app, queue, bot_id, 3)
+    queue._poll()
+    # Mensagem com id menor que some da memória (ex.: gravada fora de ordem)
+    queue._known.discard(ids[0])
+    queue._queues[bot_id].popleft()
+
+    queue._poll()
+    assert ids[0] not in queue._known
+    queue._next_rescan = 0.0
+    queue._poll()
+    assert ids[0] in queue._known
+
+
+def test_offline_ttl_fails_only_expired_items(queue, bot_id, monkeypatch):
+    monkeypatch.setattr(whatsapp_manager, 'is_running', lambda bot_id: False)
+    queue.offline_ttl = 10
+    now = time.monotonic()
+    with queue._condition:
+        for message_id, age in ((1, 20), (2, 15), (3, 1)):
+            queue._push(_item(message_id, bot_id, now - age))
+        item = queue._queues[bot_id].popleft()
+        queue._busy.add(bot_id)
+
+    queue._send(item)
+
+    assert sorted((result['id'], status) for result, status in queue._results) == [(1, 'failed'), (2, 'failed')]
+    assert [pending['id'] for pending in queue._queues[bot_id]] == [3]
+    assert bot_id in queue._scheduled
+
+
+def test_offline_item_waits_within_ttl(queue, bot_id, monkeypatch):
+    monkeypatch.setattr(whatsapp_manager, 'is_running', lambda bot_id: False)
+    with queue._condition:
+        queue._push(_item(1, bot_id, time.monotonic()))
+        item = queue._queues[bot_id].popleft()
+        queue._busy.add(bot_id)
+
+    queue._send(item)
+
+    # Bot fora do ar não gasta tentativas e a mensagem volta para a frente da fila
+    assert not queue._results
+    assert item['attempts'] == 0
+    assert queue._queues[bot_id][0] is item
+
+
+def test_add_keeps_the_message_type(app, queue, bot_id):
+    with app.app_context():
+        image = queue.add(bot_id, '5511999990001', 'foto', media_url='https://example.com/a.jpg',
+                          message_type='image')
+        media = queue.add(bot_id, '5511999990001', 'arquivo', media_url='https://example.com/a.pdf')
+        text = queue.add(bot_id, '5511999990001', 'oi')
+        db.session.commit()
+        assert (image.message_type, media.message_type, text.message_type) == ('image', 'media', 'text')
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from src.instance_registry import InstanceRegistry
+from src.status_events import StatusBroker
+
+
+@pytest.fixture
+def worker(app, monkeypatch):
+    """Troca o host:pid do worker atual, como se cada chamada viesse de um processo"""
+    def use(name: str):
+        monkeypatch.setattr(InstanceRegistry, 'owner', property(lambda self: name))
+    return use
+
+
+@pytest.fixture
+def brokers(app):
+    first, second = StatusBroker(), StatusBroker()
+    first.init_app(app, relay=False)
+    second.init_app(app, relay=False)
+    return first, second
+
+
+def read(stream) -> tuple:
+    event, data = next(stream).strip().split('\n')
+    return event[len('event: '):], json.loads(data[len('data: '):])
+
+
+def test_events_reach_subscribers_on_another_worker(brokers, worker):
+    first, second = brokers
+    stream = second.stream(1, [])
+    assert read(stream) == ('snapshot', {'sessions': []})
+
+    worker('worker-a')
+    first.publish_session(1, 7, 'active')
+    first.publish_removed(1, 8)
+    worker('worker-b')
+    second.relay()
+
+    received = [read(stream), read(stream)]
+    assert ('session', {'id': '7', 'status': 'active', 'qr_code': None, 'ready': True}) in received
+    assert ('session', {'id': '8', 'removed': True}) in received
+
+
+def test_relay_skips_own_events_and_repeats(brokers, worker):
+    first, second = brokers
+    local = first.stream(1, [])
+    remote = second.stream(1, [])
+    next(local), next(remote)
+
+    worker('worker-a')
+    first.publish_session(1, 7, 'connecting')
+    assert read(local)[1]['status'] == 'connecting'
+    first.relay()  # Eventos do próprio worker já foram entregues na publicação
+    assert not any(subscriber.pending for subscriber in first._subscribers[1])
+
+    worker('worker-b')
+    second.relay()
+    second.relay()  # Relido dentro da janela de acomodação, mas não entregue de novo
+    assert read(remote)[1]['status'] == 'connecting'
+    assert not any(subscriber.pending for subscriber in second._subscribers[1])
+
+
+def test_new_worker_starts_after_existing_events(app, brokers, worker):
+    first, _ = brokers
+    worker('worker-a')
+    first.publish_session(1, 7, 'active')
+
+    late = StatusBroker()
+    late.init_app(app, relay=False)
+    stream = late.stream(1, [])
+    next(stream)
+    worker('worker-b')
+    late.relay()
+    assert not any(subscriber.pending for subscriber in late._subscribers[1])
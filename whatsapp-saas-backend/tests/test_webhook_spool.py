@@ -0,0 +1,73 @@
+import glob
+import os
+
+import pytest
+
+from src.webhook_spool import WebhookSpool
+
+
+@pytest.fixture
+def spool_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv('WEBHOOK_SPOOL_DIR', str(tmp_path / 'spool'))
+    monkeypatch.setenv('WEBHOOK_SPOOL_FSYNC_MS', '0')
+    return tmp_path / 'spool'
+
+
+def _crash(spool: WebhookSpool):
+    # Processo encerrado sem aviso: só os arquivos ficam
+    spool._file.close()
+    spool._lock_file.close()
+
+
+def test_uncommitted_records_are_replayed(spool_dir):
+    spool = WebhookSpool()
+    assert spool.open() == []
+    positions = [spool.append({'n': n}) for n in range(3)]
+    spool.commit(positions[:1])
+    _crash(spool)
+
+    recovered = WebhookSpool()
+    assert [record for _, record in recovered.open()] == [{'n': 1}, {'n': 2}]
+    assert recovered.pending_count() == 2
+
+
+def test_checkpoint_only_advances_over_contiguous_commits(spool_dir):
+    spool = WebhookSpool()
+    spool.open()
+    positions = [spool.append({'n': n}) for n in range(3)]
+    spool.commit([positions[2]])
+    assert spool._read_checkpoint() == (0, 0)
+    spool.commit([positions[0], positions[1]])
+    assert spool._read_checkpoint() == positions[2]
+    assert spool.pending_count() == 0
+
+
+def test_torn_record_at_the_end_is_ignored(spool_dir):
+    spool = WebhookSpool()
+    spool.open()
+    spool.append({'n': 1})
+    _crash(spool)
+    segment = sorted(glob.glob(os.path.join(str(spool_dir), 'slot-0', 'segment-*.log')))[-1]
+    with open(segment, 'ab') as segment_file:
+        segment_file.write(b'\x00\x00\x00\x10\xde\xad\xbe\xefpartial')
+
+    recovered = WebhookSpool()
+    assert [record for _, record in recovered.open()] == [{'n': 1}]
+
+
+def test_orphaned_slot_is_adopted(spool_dir):
+    first = WebhookSpool()
+    first.open()
+    second = WebhookSpool()
+    second.open()
+    assert second.directory != first.directory
+    second.append({'n': 'orphan'})
+    _crash(second)
+    _crash(first)
+
+    # O novo processo fica com o primeiro slot livre e adota o do processo que sumiu
+    third = WebhookSpool()
+    pending = third.open()
+    assert third.directory == first.directory
+    assert [record for _, record in pending] == [{'n': 'orphan'}]
+    assert third.pending_count() == 1
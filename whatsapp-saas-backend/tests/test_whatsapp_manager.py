@@ -0,0 +1,21 @@
+from src.whatsapp_manager import whatsapp_manager
+
+
+def test_supervisor_lock_next_to_sqlite_file(app, tmp_path, monkeypatch):
+    monkeypatch.delenv('SUPERVISOR_LOCK_PATH', raising=False)
+    monkeypatch.setattr(whatsapp_manager, 'app', app)
+    assert whatsapp_manager._supervisor_lock_path() == str(tmp_path / 'supervisor.lock')
+
+
+def test_supervisor_lock_path_from_env(app, tmp_path, monkeypatch):
+    lock_path = tmp_path / 'run' / 'supervisor.lock'
+    monkeypatch.setenv('SUPERVISOR_LOCK_PATH', str(lock_path))
+    monkeypatch.setattr(whatsapp_manager, 'app', app)
+
+    lock = whatsapp_manager._acquire_supervisor_lock()
+    try:
+        assert lock is not None and lock_path.exists()
+        # Outro worker não consegue o lock enquanto o supervisor o mantém
+        assert whatsapp_manager._acquire_supervisor_lock() is None
+    finally:
+        lock.close()
@@ -188,7 +188,7 @@ const WhatsAppSessions = () => {
       setIsSendMessageDialogOpen(false);
       setSelectedSession(null);
       setMessageData({ number: '', message: '' });
-      alert('Mensagem enviada com sucesso!');
+      alert('Mensagem enfileirada para envio!');
     } catch (error) {
       setError(error.message || 'Erro ao enviar mensagem');
     } finally {